@@ -0,0 +1,150 @@
+import json
+from datetime import date
+from functools import lru_cache
+from models import LEAVE_TYPES, DEFAULT_BALANCES
+
+# Yearly accrual: at the start of each calendar year every employee's grants
+# for the year are topped up to the policy entitlement and unused days above
+# the carry-over cap expire. Both are worked out from the ledger itself (what
+# was already granted for the year, whether the cap was already applied), so a
+# run can be repeated or resumed after a crash and never posts twice.
+#
+# Policy rules per leave type: 'annual' days a year; 'carry_cap' days that may
+# be carried into the next year (None: no limit); 'prorate' to scale the
+# entitlement by the part of the year employed, counted from the employee's
+# first ledger entry. Hire-time opening balances count as granted, and nothing
+# is ever clawed back.
+
+POLICY = {
+    'Vacation': {'annual': DEFAULT_BALANCES['Vacation'], 'carry_cap': 5, 'prorate': True},
+    'Sick': {'annual': DEFAULT_BALANCES['Sick'], 'carry_cap': 0, 'prorate': True},
+    'Maternity': {'annual': DEFAULT_BALANCES['Maternity'], 'carry_cap': 0, 'prorate': False},
+    'specific': {'annual': DEFAULT_BALANCES['specific'], 'carry_cap': 0, 'prorate': True},
+}
+CHUNK_SIZE = 5000  # employees locked and saved together
+GRANTS = ('opening', 'accrual')
+
+
+def load_policy(path):
+    with open(path) as f:
+        policy = json.load(f)
+    if not isinstance(policy, dict):
+        raise ValueError("An accrual policy is a JSON object of leave type -> rule.")
+    for lt, rule in policy.items():
+        if not isinstance(rule, dict) or lt not in LEAVE_TYPES:
+            raise ValueError(f"Invalid leave type in accrual policy: {lt}.")
+        annual, cap = rule.get('annual'), rule.get('carry_cap')
+        if not isinstance(annual, int) or annual < 0 or cap is not None and (not isinstance(cap, int) or cap < 0):
+            raise ValueError(f"Accrual rule for {lt} needs a whole 'annual' and 'carry_cap' of 0 or more.")
+        rule.setdefault('prorate', True)
+    return policy
+
+
+def check_year(year):
+    if not date.min.year <= year <= date.max.year:
+        raise ValueError(f"Invalid accrual year: {year}, expected {date.min.year} to {date.max.year}.")
+
+
+@lru_cache(maxsize=None)
+def period(year):
+    # first and last day of the accrual period, as ordinals
+    return date(year, 1, 1).toordinal(), date(year, 12, 31).toordinal()
+
+
+def accrue(emp, year, policy=POLICY):
+    # Posts whatever of the year's accrual `emp` has not had yet; returns the
+    # number of ledger entries posted, 0 once the year is fully applied.
+    first, last = period(year)
+    entries = emp.ledger.entries
+    hired = entries[0].day if entries else first
+    if hired > last:
+        return 0
+    granted, expired = {}, set()
+    for e in emp.ledger.between(first, last):
+        if e.kind in GRANTS:
+            granted[e.leave_type] = granted.get(e.leave_type, 0) + e.amount
+        elif e.kind == 'expiry' and e.day == first:
+            expired.add(e.leave_type)
+    closing = emp.ledger.totals(first - 1) if hired < first else {}
+    days = last - first + 1
+    posted = 0
+    for lt, rule in policy.items():
+        cap = rule['carry_cap']
+        if cap is not None and closing.get(lt, 0) > cap and lt not in expired:
+            emp.post(lt, cap - closing[lt], 'expiry', day=first)
+            posted += 1
+        due = rule['annual'] * (last - max(hired, first) + 1) // days if rule['prorate'] else rule['annual']
+        if due > granted.get(lt, 0):
+            emp.post(lt, due - granted.get(lt, 0), 'accrual', day=max(hired, first))
+            posted += 1
+    return posted
+
+
+def chunks(ids, size=CHUNK_SIZE):
+    ids = sorted(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def accrue_chunk(employees, ids, year, policy=POLICY):
+    # employees maps emp_id -> Employee; returns (ids changed, entries posted)
+    changed, posted = [], 0
+    for eid in ids:
+        emp = employees.get(eid)
+        n = accrue(emp, year, policy) if emp is not None else 0
+        if n:
+            changed.append(eid)
+            posted += n
+    return changed, posted
+
+
+def run_offline(year, storage='json', path=None, policy=POLICY, chunk_size=CHUNK_SIZE):
+    # Accrue straight into the data files under the workers' lock, saving and
+    # bumping the version file after every chunk; an interrupted run is simply
+    # started again. Returns {'employees', 'changed', 'entries', 'chunks'}.
+    from storage import make_backend, default_path, FileLock, VersionFile
+    from migrate_data import require_current
+    from models import employee_from_dict
+    check_year(year)
+    path = path or default_path(storage)
+    require_current(storage, path)
+    lock = FileLock(path + '.lock')
+    opts = {'lock': lock} if storage == 'journal' else {}
+    backend = make_backend(storage, path, **opts)
+    stats = {'employees': 0, 'changed': 0, 'entries': 0, 'chunks': 0}
+    try:
+        with lock:
+            employees = {eid: employee_from_dict(ed) for eid, ed in backend.iter_all()}
+            stats['employees'] = len(employees)
+            for ids in chunks(employees, chunk_size):
+                changed, posted = accrue_chunk(employees, ids, year, policy)
+                if changed:
+                    backend.save({eid: employees[eid].to_dict() for eid in changed}, changed)
+                    VersionFile(path + '.version').bump()
+                stats['changed'] += len(changed)
+                stats['entries'] += posted
+                stats['chunks'] += 1
+    finally:
+        backend.close()
+    return stats
+
+
+if __name__ == '__main__':
+    import argparse, sys, time
+    from storage import STORAGE_MODES
+    parser = argparse.ArgumentParser(description="Apply a year's leave accrual and carry-over caps to every employee")
+    parser.add_argument('year', type=int, nargs='?', default=date.today().year)
+    parser.add_argument('--storage', choices=STORAGE_MODES, default='json')
+    parser.add_argument('--path', help="data file or directory (default data.json, leave.db for sqlite, data.shards for sharded)")
+    parser.add_argument('--policy', help="JSON file of leave type -> {annual, carry_cap, prorate} (default: built-in)")
+    parser.add_argument('--chunk', type=int, default=CHUNK_SIZE, help="employees per save")
+    args = parser.parse_args()
+    t0 = time.perf_counter()
+    try:
+        policy = load_policy(args.policy) if args.policy else POLICY
+        stats = run_offline(args.year, args.storage, args.path, policy, args.chunk)
+    except (OSError, ValueError) as e:
+        sys.exit(str(e))
+    elapsed = time.perf_counter() - t0
+    print(f"{args.year}: {stats['entries']} entries posted for {stats['changed']} of {stats['employees']} employees "
+          f"in {stats['chunks']} chunks, {elapsed:.2f}s.")
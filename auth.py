@@ -0,0 +1,127 @@
+import hashlib, hmac, os, threading, time
+from collections import OrderedDict, deque
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Passwords are stored as werkzeug hashes ("method$salt$hash", scrypt by
+# default). Records written before hashing held plaintext; schema migration 4
+# (migrate_data.py) hashes those, so a stored password that is not a hash
+# never verifies.
+
+PASSWORD_METHOD = os.environ.get('LMS_PASSWORD_METHOD', 'scrypt')  # any werkzeug method, e.g. 'pbkdf2:sha256:600000'
+HASH_PREFIXES = ('scrypt:', 'pbkdf2:')
+
+
+def hash_password(password, method=None):
+    return generate_password_hash(password, method or PASSWORD_METHOD)
+
+
+def is_hashed(stored):
+    return stored.startswith(HASH_PREFIXES) and stored.count('$') == 2
+
+
+class Credentials:
+    # Checks passwords against stored hashes, remembering the last successful
+    # check per account as an HMAC of (stored hash, password) under a key that
+    # never leaves the process. Logging in again with the same password costs
+    # one HMAC instead of the KDF; a changed hash or password is a miss, and
+    # failures are never cached.
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self._key = os.urandom(32)
+        self._lock = threading.Lock()
+        self._verified = OrderedDict()  # account -> HMAC of the last verified (stored, password)
+        self.hits = 0
+        self.misses = 0
+
+    def _mac(self, stored, password):
+        return hmac.new(self._key, f"{stored}\0{password}".encode(), hashlib.sha256).digest()
+
+    def verify(self, account, stored, password):
+        if not isinstance(password, str) or not stored or not is_hashed(stored):
+            return False
+        mac = self._mac(stored, password)
+        with self._lock:
+            known = self._verified.get(account)
+            if known is not None and hmac.compare_digest(known, mac):
+                self._verified.move_to_end(account)
+                self.hits += 1
+                return True
+            self.misses += 1
+        if not check_password_hash(stored, password):
+            return False
+        if self.capacity:
+            with self._lock:
+                self._verified[account] = mac
+                self._verified.move_to_end(account)
+                while len(self._verified) > self.capacity:
+                    self._verified.popitem(last=False)
+        return True
+
+    def forget(self, account):
+        with self._lock:
+            self._verified.pop(account, None)
+
+    def stats(self):
+        with self._lock:
+            return {'cached': len(self._verified), 'hits': self.hits, 'misses': self.misses}
+
+
+class LoginLimiter:
+    # At most `attempts` failed logins per key (an account, a client address)
+    # within `window` seconds; a success clears the key's failures.
+    def __init__(self, attempts, window):
+        self.attempts = attempts
+        self.window = window
+        self._lock = threading.Lock()
+        self._failures = {}  # key -> deque of failure times
+        self.blocked = 0
+
+    def _recent(self, key, now):
+        times = self._failures.get(key)
+        if times is None:
+            return None
+        while times and times[0] <= now - self.window:
+            times.popleft()
+        if not times:
+            del self._failures[key]
+            return None
+        return times
+
+    def retry_after(self, *keys):
+        # seconds until every key may try again; 0 if none is blocked
+        now = time.monotonic()
+        wait = 0
+        with self._lock:
+            for key in keys:
+                times = self._recent(key, now)
+                if times is not None and len(times) >= self.attempts:
+                    wait = max(wait, times[-self.attempts] + self.window - now)
+            if wait:
+                self.blocked += 1
+        return wait
+
+    def failed(self, *keys):
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                times = self._recent(key, now)
+                if times is None:
+                    times = self._failures[key] = deque(maxlen=self.attempts)
+                times.append(now)
+            if len(self._failures) > 100000:
+                for key in list(self._failures):
+                    self._recent(key, now)
+
+    def succeeded(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Password maintenance")
+    sub = parser.add_subparsers(dest='command', required=True)
+    hasher = sub.add_parser('hash', help="print the hash of a password, e.g. for LMS_ADMIN_PASSWORD_HASH")
+    hasher.add_argument('password')
+    args = parser.parse_args()
+    print(hash_password(args.password))
@@ -0,0 +1,1132 @@
+import argparse, functools, gc, json, multiprocessing, os, platform, random, re, resource, sys, tempfile, threading, time
+from datetime import datetime, timedelta
+from models import Employee, LeaveRequest, LedgerEntry, Status, LEAVE_TYPES, DEFAULT_BALANCES, employee_from_dict
+from ledger import reconcile
+from storage import make_backend, default_path, STORAGE_MODES
+from migrate_data import write_schema, add_ledger
+from auth import hash_password
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+BENCHMARKS = {}
+
+
+def benchmark(fn):
+    BENCHMARKS[fn.__name__.replace('bench_', '')] = fn
+    return fn
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99) - 1]
+
+
+def synthetic_history(n, first=datetime(2000, 1, 3), step=3, length=2):
+    # n non-overlapping requests, mostly in the past, half of them still active
+    reqs = []
+    for i in range(n):
+        start = first + timedelta(days=i * step)
+        end = start + timedelta(days=length - 1)
+        reqs.append({"leave_type": "Vacation", "start_date": start.strftime('%Y-%m-%d'),
+                     "end_date": end.strftime('%Y-%m-%d'), "days": length,
+                     "status": ("Approved", "Rejected", "Pending")[i % 3], "deducted": i % 3 == 0})
+    return reqs
+
+
+@functools.lru_cache(maxsize=None)
+def stored_password():
+    # every synthetic employee's password is 'password', hashed once
+    return hash_password('password')
+
+
+def synthetic_data(employees, requests_per_employee, departments=('IT', 'HR', 'Finance', 'Operations'), balances=None):
+    # the ledger is derived the way migrate_data.py derives it for existing data
+    data = {}
+    for i in range(employees):
+        eid = f"E{i:06d}"
+        data[eid] = add_ledger({'emp_id': eid, 'name': f"Employee {i}", 'password': stored_password(), 'contact': f"07{i:08d}",
+                                'department': departments[i % len(departments)],
+                                'leave_balances': {**{lt: DEFAULT_BALANCES[lt] for lt in LEAVE_TYPES}, **(balances or {})},
+                                'leave_requests': synthetic_history(requests_per_employee, first=datetime(2020, 1, 6) + timedelta(days=i % 7))})
+    return data
+
+
+def load_app(data, storage='json'):
+    # import the Flask app against a throwaway data store so benchmarks never touch real data
+    workdir = tempfile.mkdtemp(prefix='lms-bench-')
+    seed = make_backend(storage, os.path.join(workdir, default_path(storage)))
+    seed.save(data)
+    seed.close()
+    write_schema(storage, os.path.join(workdir, default_path(storage)))
+    os.environ['LMS_STORAGE'] = storage
+    os.chdir(workdir)
+    sys.path.insert(0, HERE)
+    import connection
+    return connection
+
+
+def stored_ids(connection):
+    # a shared backend (sqlite) isn't loaded into connection.employees
+    return sorted(connection.backend.employee_ids() if connection.backend.shared else connection.employees)
+
+
+def linear_overlap(requests, start_date, end_date):
+    # the pre-index check: parse every active request dict on every submission
+    for req in requests:
+        if req['status'] in ('Pending', 'Approved'):
+            es = datetime.strptime(req['start_date'], '%Y-%m-%d')
+            ee = datetime.strptime(req['end_date'], '%Y-%m-%d')
+            if start_date <= ee and end_date >= es:
+                return True
+    return False
+
+
+@benchmark
+def bench_apply_leave(args):
+    emp = Employee('b1', 'Bench', leave_balances={'Vacation': 10 ** 9}, leave_requests=synthetic_history(args.history))
+    start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    free = start, start
+
+    def indexed():
+        emp.overlaps(free[0].toordinal(), free[1].toordinal())
+
+    history = [r.to_dict() for r in emp.leave_requests]
+
+    def linear():
+        linear_overlap(history, *free)
+
+    def submit():
+        emp.apply_leave('Vacation', free[0], free[1])
+        emp.set_status(len(emp.leave_requests) - 1, Status.Rejected)
+
+    for label, fn in (('linear overlap', linear), ('indexed overlap', indexed), ('apply_leave', submit)):
+        p50, p99 = timed(fn, args.repeat)
+        print(f"{label:<16} history={args.history:<7} p50={p50 * 1e6:9.1f}us p99={p99 * 1e6:9.1f}us")
+
+
+def rss_kb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _resident_requests(lines, as_records, conn):
+    gc.collect()
+    before = rss_kb()
+    if as_records:
+        kept = [LeaveRequest.from_dict(json.loads(line)) for line in lines]
+    else:
+        kept = [json.loads(line) for line in lines]
+    gc.collect()
+    conn.send(rss_kb() - before)
+    del kept
+
+
+@benchmark
+def bench_memory(args):
+    # each representation is built in a fresh process so RSS deltas don't mix
+    lines = [json.dumps(r) for r in synthetic_history(args.requests)]
+    results = {}
+    for label, as_records in (('dict requests', False), ('LeaveRequest', True)):
+        parent, child = multiprocessing.Pipe()
+        p = multiprocessing.Process(target=_resident_requests, args=(lines, as_records, child))
+        p.start()
+        results[label] = parent.recv()
+        p.join()
+    per = 100000 / args.requests
+    for label, kb in results.items():
+        print(f"{label:<16} requests={args.requests:<7} rss=+{kb / 1024:8.1f}MB per 100k={kb * per / 1024:8.1f}MB "
+              f"({kb * 1024 / args.requests:6.0f} B/request)")
+
+
+@benchmark
+def bench_routes(args):
+    app = load_app(synthetic_data(args.employees, args.history)).app
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s['employee_id'] = 'E000000'
+        s['admin'] = True
+    for path in ('/', '/balance', '/admin/requests'):
+        client.get(path)
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            assert client.get(path).status_code == 200
+        elapsed = time.perf_counter() - t0
+        print(f"{path:<16} {args.repeat / elapsed:8.0f} req/s  ({elapsed / args.repeat * 1e3:.2f} ms/req)")
+
+
+@benchmark
+def bench_api(args):
+    # the employee pages against /api/v1 for one employee with args.history
+    # requests: full responses, and revalidations answered with 304
+    app = load_app(synthetic_data(args.employees, args.history)).app
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s['employee_id'] = 'E000000'
+    for path in ('/balance', '/requests', '/api/v1/balance', '/api/v1/requests', '/api/v1/requests?limit=500'):
+        etag = client.get(path).headers.get('ETag')
+        for label, headers in (('', {}), ('304', {'If-None-Match': etag})):
+            if label and not etag:
+                continue
+            size = len(client.get(path, headers=headers).get_data())
+            t0 = time.perf_counter()
+            for _ in range(args.repeat):
+                client.get(path, headers=headers)
+            elapsed = time.perf_counter() - t0
+            print(f"{path:<26} {label:<4} {args.repeat / elapsed:8.0f} req/s  ({elapsed / args.repeat * 1e3:.2f} ms/req, "
+                  f"{size} bytes)")
+
+
+@benchmark
+def bench_cache(args):
+    # args.ops random changes through every mutation path (apply, approve/reject,
+    # bulk with an atomic rollback, edit, delete, add, accrual), each followed by
+    # the cached pages of a few employees compared with a render that bypasses
+    # the cache; fails on any difference. Then page times with and without it.
+    connection = load_app(synthetic_data(args.employees, 30))
+    client = connection.app.test_client()
+    rng = random.Random(1)
+    first = datetime.now().date() + timedelta(days=1)
+    added = 0
+
+    def as_employee(eid):
+        with client.session_transaction() as s:
+            s.clear()
+            s['employee_id'] = eid
+
+    def as_admin():
+        with client.session_transaction() as s:
+            s.clear()
+            s['admin'] = True
+
+    def page(path):
+        with client.session_transaction() as s:
+            s.pop('_flashes', None)
+        return client.get(path).get_data()
+
+    def check():
+        ids = stored_ids(connection)
+        for eid in rng.sample(ids, min(5, len(ids))):
+            as_employee(eid)
+            paths = ['/balance', '/requests', f"/balance?date={first + timedelta(days=rng.randint(-400, 60))}"]
+            cached = [page(p) for p in paths]
+            connection.fragments.capacity, capacity = 0, connection.fragments.capacity
+            fresh = [page(p) for p in paths]
+            connection.fragments.capacity = capacity
+            if cached != fresh:
+                sys.exit(f"FAILED: stale page for {eid}")
+        as_admin()
+        path = f"/admin/employees?page={rng.randint(1, 3)}"
+        cached = page(path)
+        connection.fragments.capacity, capacity = 0, connection.fragments.capacity
+        fresh = page(path)
+        connection.fragments.capacity = capacity
+        if cached != fresh:
+            sys.exit(f"FAILED: stale {path}")
+
+    for i in range(args.ops):
+        ids = stored_ids(connection)
+        eid = rng.choice(ids)
+        op = rng.choice(('apply', 'decide', 'bulk', 'edit', 'delete', 'add', 'accrual'))
+        day = (first + timedelta(days=rng.randint(0, 300))).isoformat()
+        if op == 'apply':
+            as_employee(eid)
+            client.post('/apply', data={'leave_type': 'Sick', 'start_date': day, 'end_date': day})
+        elif op == 'decide':
+            as_admin()
+            emp = connection.get_employee(eid)
+            if emp.leave_requests:
+                client.post('/admin/requests', data={'request_id': f"{eid}:{rng.randrange(len(emp.leave_requests))}",
+                                                     'action': rng.choice(('Approved', 'Rejected', 'Pending'))})
+        elif op == 'bulk':
+            as_admin()
+            client.post('/admin/bulk/requests', json={'atomic': True, 'items': [
+                {'emp_id': eid, 'leave_type': 'Vacation', 'start_date': day, 'end_date': day},
+                {'emp_id': eid, 'leave_type': 'Nope', 'start_date': day, 'end_date': day}]})
+        elif op == 'edit':
+            as_admin()
+            client.post(f"/admin/edit/{eid}", data={'name': f"Renamed {i}", 'contact': '0', 'department': rng.choice(('IT', 'HR'))})
+        elif op == 'delete' and len(ids) > 10:
+            as_admin()
+            client.post(f"/admin/delete/{eid}")
+        elif op == 'add':
+            as_admin()
+            added += 1
+            client.post('/add', data={'emp_id': f"N{added:05d}", 'name': f"New {added}", 'contact': '1',
+                                      'department': 'IT', 'password': ''})
+        elif op == 'accrual':
+            as_admin()
+            client.post(f"/admin/accrual/{datetime.now().year + rng.randint(0, 2)}")
+        check()
+    stats = connection.fragments.stats()
+    print(f"{args.ops} changes, no stale pages; hit rate {stats['hit_rate']}, {stats['evictions']} evictions")
+    as_employee(stored_ids(connection)[0])
+    for path in ('/balance', '/requests'):
+        for label, capacity in (('cached', connection.FRAGMENT_CACHE), ('uncached', 0)):
+            connection.fragments.capacity = capacity
+            p50, p99 = timed(lambda: client.get(path), args.repeat)
+            print(f"{path:<10} {label:<9} p50={p50 * 1e3:6.2f}ms p99={p99 * 1e3:6.2f}ms")
+    connection.fragments.capacity = connection.FRAGMENT_CACHE
+
+
+@benchmark
+def bench_login(args):
+    # logins/s with hashed passwords: every check paying the KDF, repeat logins
+    # answered by the verification cache, both through /api/v1/login; then the
+    # session stores: read, write, and revoking one session or an employee's
+    import sessions
+    data = synthetic_data(args.employees, 0)
+    connection = load_app(data)
+    client = connection.app.test_client()
+    ids = sorted(data)
+    cold = ids[:min(20, len(ids))]  # first logins pay the KDF and warm the cache for the second round
+    for label, n in (('KDF', len(cold)), ('cached', args.repeat)):
+        t0 = time.perf_counter()
+        for i in range(n):
+            r = client.post('/api/v1/login', json={'emp_id': cold[i % len(cold)], 'password': 'password'})
+            assert r.status_code == 200, r.status_code
+        elapsed = time.perf_counter() - t0
+        print(f"login {label:<8} {n / elapsed:8.1f} logins/s ({elapsed / n * 1e3:.2f} ms/login)")
+    workdir = tempfile.mkdtemp(prefix='lms-sessions-')
+    for kind in ('memory', 'sqlite'):
+        store = sessions.make_session_store(kind, os.path.join(workdir, 'sessions.db'))
+        sids = [f"s{i}" for i in range(args.employees * 10)]
+        expires = time.time() + 3600
+        t0 = time.perf_counter()
+        for i, sid in enumerate(sids):
+            store.set(sid, '{"employee_id": "x"}', expires, ids[i % len(ids)])
+        write = (time.perf_counter() - t0) / len(sids)
+        read50, _ = timed(lambda: store.get(sids[random.randrange(len(sids))]), args.repeat)
+        revoke50, _ = timed(lambda: store.delete(sids.pop()), min(args.repeat, len(sids) // 2))
+        t0 = time.perf_counter()
+        revoked = store.delete_for(ids[0])
+        everywhere = time.perf_counter() - t0
+        print(f"{kind:<7} sessions: write {write * 1e6:7.1f}us  read p50 {read50 * 1e6:7.1f}us  "
+              f"revoke one p50 {revoke50 * 1e6:7.1f}us  revoke employee ({revoked}) {everywhere * 1e6:7.1f}us")
+        store.close()
+
+
+def scan_headcount(employees, department, first, last):
+    # the pre-index way: every approved request of every employee in the department
+    out = {}
+    for emp in employees.values():
+        if emp.department != department:
+            continue
+        for r in emp.leave_requests:
+            if r.status == Status.Approved and r.end >= first and r.start <= last:
+                for day in range(max(r.start, first), min(r.end, last) + 1):
+                    out.setdefault(day, set()).add(emp.emp_id)
+    return out
+
+
+@benchmark
+def bench_staffing(args):
+    # the staffing check of one approval against a full scan, the what-if over
+    # every pending request, the what-if's choice against brute force on small
+    # batches, and threads racing to approve past a department's limit
+    import itertools, staffing
+    workdir = tempfile.mkdtemp(prefix='lms-staffing-')
+    with open(os.path.join(workdir, 'limits.json'), 'w') as f:
+        json.dump({'*': max(args.employees // 12, 1)}, f)  # about a third of each of the four departments
+    os.environ['LMS_STAFFING_LIMITS'] = os.path.join(workdir, 'limits.json')
+    data = synthetic_data(args.employees, args.per_employee)
+    connection = load_app(data, args.storage)
+    emp = connection.get_employee('E000000')
+    index = next(i for i, r in enumerate(emp.leave_requests) if r.status == Status.Pending)
+    r = emp.leave_requests[index]
+    p50, p99 = timed(lambda: connection.staffing_conflicts(emp, index), args.repeat)
+    line = f"approval check: {args.storage} p50 {p50 * 1e6:8.1f}us p99 {p99 * 1e6:8.1f}us"
+    if not connection.backend.shared:
+        s50, _ = timed(lambda: scan_headcount(connection.employees, emp.department, r.start, r.end), 5)
+        line += f"   scan p50 {s50 * 1e3:8.2f}ms"
+    print(line)
+    client = logged_in_clients(connection.app, 1, admin=True)[0]
+    t0 = time.perf_counter()
+    body = client.post('/admin/staffing/what-if', json={}).get_json()
+    pending = sum(d['pending'] for d in body['departments'])
+    print(f"what-if: {pending} pending requests in {time.perf_counter() - t0:.2f}s, "
+          f"{len(body['decisions'])} approvable together, limit {connection.STAFFING_LIMITS['*']}")
+    rng = random.Random(7)
+    for trial in range(200):
+        candidates = []
+        for i in range(rng.randint(1, 8)):
+            first = rng.randint(0, 12)
+            candidates.append((f"r{i}", f"e{i}", first, first + rng.randint(0, 5)))
+        limit = rng.randint(0, 3)
+        busy = {day: {f"x{j}" for j in range(rng.randint(0, limit + 1))} for day in range(18) if rng.random() < 0.3}
+        approve, _ = staffing.suggest(candidates, {d: set(ids) for d, ids in busy.items()}, limit)
+        best = 0
+        for n in range(len(candidates), 0, -1):
+            for subset in itertools.combinations(candidates, n):
+                out = {d: set(ids) for d, ids in busy.items()}
+                if all(not staffing.conflicts(out, e, a, b, limit) and not staffing.take(out, e, a, b)
+                       for _, e, a, b in sorted(subset, key=lambda c: c[2])):
+                    best = n
+                    break
+            if best:
+                break
+        if len(approve) != best:
+            sys.exit(f"FAILED: what-if approved {len(approve)} of {candidates} where {best} fit (limit {limit})")
+    print("what-if: largest set on 200 random batches")
+    # threads approving requests over the same days: no more than the limit may get through
+    limit = connection.STAFFING_LIMITS['*']
+    first = datetime(2040, 6, 1)
+    racers = [eid for eid in sorted(data) if data[eid]['department'] == 'IT'][:limit * 2]
+    rids = []
+    for eid in racers:
+        with connection.mutation(eid):
+            racer = connection.get_employee(eid)
+            racer.apply_leave('Vacation', first, first + timedelta(days=4))
+            connection.save_data(eid)
+        rids.append(f"{eid}:{len(racer.leave_requests) - 1}")
+    clients = logged_in_clients(connection.app, 8, admin=True)
+    calls = [lambda c=clients[i % 8], rid=rid: c.post('/admin/requests', data={'action': 'Approved', 'request_id': rid})
+             for i, rid in enumerate(rids)]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads as often as possible, so a check-then-approve race shows
+    try:
+        run_scenario(calls, 8)
+    finally:
+        sys.setswitchinterval(interval)
+    approved = sum(connection.get_employee(eid).leave_requests[-1].status == Status.Approved for eid in racers)
+    print(f"race: {approved} of {len(racers)} approved at limit {limit}")
+    if approved != limit:
+        sys.exit("FAILED: the staffing limit let too many through" if approved > limit else "FAILED: too few approved")
+
+def _stress_worker(workdir, storage, locked, lazy, wid, workers, ops, out):
+    os.environ['LMS_STORAGE'] = storage
+    os.environ['LMS_MULTIPROCESS'] = '1' if locked else '0'
+    os.environ['LMS_LAZY_EMPLOYEES'] = str(lazy)
+    os.chdir(workdir)
+    sys.path.insert(0, HERE)
+    import connection
+    client = connection.app.test_client()
+    rng = random.Random(wid)
+    emp_ids = stored_ids(connection)
+    first = datetime.now().date() + timedelta(days=1)
+    applied = 0
+    for i in range(ops):
+        # every (worker, op) gets its own day, so a submission is only refused if it is lost
+        day = (first + timedelta(days=2 * (i * workers + wid))).isoformat()
+        with client.session_transaction() as s:
+            s.clear()
+            s['employee_id'] = rng.choice(emp_ids)
+        client.post('/apply', data={'leave_type': 'Sick', 'start_date': day, 'end_date': day})
+        with client.session_transaction() as s:
+            applied += any('submitted' in msg for _, msg in s.pop('_flashes', []))
+            s.clear()
+            s['admin'] = True
+        page = client.get('/admin/requests?status=All&limit=30').get_data(as_text=True)
+        ids = re.findall(r'name="request_id" value="([^"]+)"', page)
+        if ids:
+            client.post('/admin/requests', data={'request_id': rng.choice(ids),
+                                                 'action': rng.choice(('Approved', 'Approved', 'Rejected'))})
+    mismatches = []
+    if locked and not connection.backend.shared:
+        # this worker's indexes, after taking in everyone's changes, against a recount
+        with connection.mutation(), connection.index_lock:
+            mismatches = connection.aggregates.check(list(connection.employees.values()))
+    out.put((applied, len(mismatches)))
+
+
+@benchmark
+def bench_stress(args):
+    # N worker processes apply and approve against the same data; afterwards no
+    # submission may be missing and every balance must match its approved requests.
+    workdir = tempfile.mkdtemp(prefix='lms-stress-')
+    data = synthetic_data(args.employees, 0, balances={'Sick': 10 ** 6})
+    path = os.path.join(workdir, default_path(args.storage))
+    seed = make_backend(args.storage, path)
+    seed.save(data)
+    seed.close()
+    write_schema(args.storage, path)
+    ctx = multiprocessing.get_context('fork')
+    out = ctx.Queue()
+    procs = [ctx.Process(target=_stress_worker, args=(workdir, args.storage, not args.no_lock, args.lazy, w, args.workers,
+                                                      args.ops, out))
+             for w in range(args.workers)]
+    t0 = time.perf_counter()
+    for p in procs:
+        p.start()
+    results = [out.get() for _ in procs]
+    applied, stale = sum(a for a, _ in results), sum(m for _, m in results)
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - t0
+    final = make_backend(args.storage, path)
+    result = final.load_all()
+    final.close()
+    stored = sum(len(ed['leave_requests']) for ed in result.values())
+    bad = [eid for eid, ed in result.items()
+           if ed['leave_balances']['Sick'] != 10 ** 6 - sum(r['days'] for r in ed['leave_requests'] if r['deducted'])
+           or any(r['deducted'] != (r['status'] == 'Approved') for r in ed['leave_requests'])
+           or reconcile(employee_from_dict(ed))]
+    print(f"{args.workers} workers x {args.ops} ops ({args.storage}, {'locked' if not args.no_lock else 'unlocked'}): "
+          f"{elapsed:.1f}s, {applied} accepted, {stored} stored, {len(bad)} employees with wrong balances, "
+          f"{stale} index mismatches")
+    if applied != stored or bad or stale:
+        sys.exit("FAILED: lost updates, inconsistent balances or stale indexes")
+
+
+def _hammer_thread(connection, emp_ids, tid, ops, accepted, barrier):
+    client = connection.app.test_client()
+    rng = random.Random(tid)
+    first = datetime.now().date() + timedelta(days=1)
+    barrier.wait()
+    for i in range(ops):
+        eid = rng.choice(emp_ids)
+        if rng.random() < 0.5:
+            day = (first + timedelta(days=2 * (i * 1000 + tid))).isoformat()
+            with client.session_transaction() as s:
+                s.clear()
+                s['employee_id'] = eid
+            client.post('/apply', data={'leave_type': 'Sick', 'start_date': day, 'end_date': day})
+            with client.session_transaction() as s:
+                accepted[tid] += any('submitted' in msg for _, msg in s.pop('_flashes', []))
+        else:
+            n = len(connection.get_employee(eid).leave_requests)
+            if not n:
+                continue
+            with client.session_transaction() as s:
+                s.clear()
+                s['admin'] = True
+            client.post('/admin/requests', data={'request_id': f"{eid}:{rng.randrange(n)}",
+                                                 'action': rng.choice(('Approved', 'Rejected', 'Pending'))})
+
+
+@benchmark
+def bench_hammer(args):
+    # N threads of one process apply, approve, reject and reopen requests for a
+    # handful of employees at once; afterwards memory and storage must agree,
+    # no submission may be missing and every balance must match its requests.
+    data = synthetic_data(args.employees, 0, balances={'Sick': 10 ** 6})
+    os.environ['LMS_FLUSH_INTERVAL'] = str(args.flush_interval)
+    os.environ['LMS_DURABILITY'] = args.durability
+    connection = load_app(data, args.storage)
+    emp_ids = sorted(data)
+    accepted = [0] * args.workers
+    barrier = threading.Barrier(args.workers)
+    threads = [threading.Thread(target=_hammer_thread, args=(connection, emp_ids, t, args.ops, accepted, barrier))
+               for t in range(args.workers)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    committer = connection.committer
+    stats = committer.stats()
+    committer.close()
+    connection.backend.close()
+    final = make_backend(args.storage, connection.STORE_PATH)
+    stored = final.load_all()
+    final.close()
+    memory = {eid: connection.get_employee(eid).to_dict() for eid in emp_ids}
+    bad = [eid for eid, ed in stored.items()
+           if ed['leave_balances']['Sick'] != 10 ** 6 - sum(r['days'] for r in ed['leave_requests'] if r['deducted'])
+           or any(r['deducted'] != (r['status'] == 'Approved') for r in ed['leave_requests'])
+           or reconcile(employee_from_dict(ed))]
+    total = sum(len(ed['leave_requests']) for ed in stored.values())
+    print(f"{args.workers} threads x {args.ops} ops on {args.employees} employees ({args.storage}, "
+          f"ack={args.durability}, interval={args.flush_interval}s): {elapsed:.1f}s, "
+          f"{sum(accepted)} accepted, {total} stored, {len(bad)} employees with wrong balances")
+    print(f"  {stats['saves']} saves in {stats['flushes']} writes ({stats['flushes'] / elapsed:.0f} writes/s), "
+          f"batch mean={stats['batch_size']['mean']} max={stats['batch_size']['max']}, "
+          f"flush p50={stats['flush_ms']['p50']}ms p99={stats['flush_ms']['p99']}ms")
+    if sum(accepted) != total or bad or stored != memory:
+        sys.exit("FAILED: lost updates or inconsistent balances")
+    if not connection.backend.shared and connection.aggregates.check(connection.employees.values()):
+        sys.exit("FAILED: derived indexes out of step")
+
+
+@benchmark
+def bench_bulk(args):
+    # import args.items requests through /admin/bulk/requests, decide all of them
+    # through /admin/bulk/decisions, then time the same number of one-by-one form
+    # approvals on a sample; each bulk call persists once
+    data = synthetic_data(args.employees, 0, balances={'Vacation': 10 ** 6})
+    connection = load_app(data, args.storage)
+    client = connection.app.test_client()
+    with client.session_transaction() as s:
+        s['admin'] = True
+    first = datetime.now().date() + timedelta(days=1)
+    emp_ids = sorted(data)
+    items = [{'emp_id': emp_ids[i % len(emp_ids)], 'leave_type': 'Vacation',
+              'start_date': (first + timedelta(days=2 * (i // len(emp_ids)))).isoformat(),
+              'end_date': (first + timedelta(days=2 * (i // len(emp_ids)))).isoformat()} for i in range(args.items)]
+    t0 = time.perf_counter()
+    out = client.post('/admin/bulk/requests', json=items).get_json()
+    elapsed = time.perf_counter() - t0
+    print(f"bulk import     {args.items} items: {elapsed:.2f}s ({args.items / elapsed:8.0f} items/s), {out['succeeded']} ok")
+    decisions = [{'request_id': r['request_id'], 'action': ('Approved', 'Rejected')[i % 2]}
+                 for i, r in enumerate(out['results']) if r['ok']]
+    t0 = time.perf_counter()
+    out = client.post('/admin/bulk/decisions', json=decisions).get_json()
+    elapsed = time.perf_counter() - t0
+    print(f"bulk decisions  {len(decisions)} items: {elapsed:.2f}s ({len(decisions) / elapsed:8.0f} items/s), {out['succeeded']} ok")
+    sample = decisions[:args.repeat]
+    t0 = time.perf_counter()
+    for d in sample:
+        client.post('/admin/requests', data={'request_id': d['request_id'], 'action': 'Pending'})
+    elapsed = time.perf_counter() - t0
+    print(f"form decisions  {len(sample)} items: {elapsed:.2f}s ({len(sample) / elapsed:8.0f} items/s), "
+          f"{len(decisions) / len(sample) * elapsed:.0f}s projected for {len(decisions)}")
+
+
+FIRST_NAMES = ('Alice', 'Jean', 'Claude', 'Grace', 'Eric', 'Diane', 'Patrick', 'Aline', 'Olivier', 'Chantal',
+               'Emmanuel', 'Josiane', 'Innocent', 'Solange', 'Fabrice', 'Yvette', 'Didier', 'Clarisse')
+LAST_NAMES = ('Uwase', 'Mugisha', 'Habimana', 'Niyonzima', 'Mukamana', 'Karangwa', 'Nshimiyimana', 'Ingabire',
+              'Hakizimana', 'Uwimana', 'Bizimana', 'Mutesi', 'Ndayisaba', 'Umutoni', 'Tuyishime', 'Kayitesi')
+
+
+@benchmark
+def bench_search(args):
+    # ranked index search against the old lowercase substring scan over args.employees employees
+    from indexes import EmployeeSearch
+    rng = random.Random(1)
+    departments = ('IT', 'HR', 'Finance', 'Operations', 'Customer Care', 'Legal', 'Procurement', 'Research')
+    employees = {}
+    for i in range(args.employees):
+        eid = f"E{i:07d}"
+        employees[eid] = Employee(eid, f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                                  department=rng.choice(departments))
+    gc.collect()
+    before = rss_kb()
+    t0 = time.perf_counter()
+    index = EmployeeSearch()
+    index.rebuild(employees.values())
+    build = time.perf_counter() - t0
+    gc.collect()
+    print(f"build {args.employees} employees: {build:.2f}s, +{(rss_kb() - before) / 1024:.0f}MB")
+
+    def scan(q):
+        q = q.lower()
+        return [e.to_dict() for e in employees.values()
+                if not q or q in e.emp_id.lower() or q in e.name.lower() or q in e.department.lower()]
+
+    queries = ('E0123456', 'E01234', 'karangwa', 'grace uwase', 'fin', 'procurement claude', 'e', '')
+    for q in queries:
+        rows, total = index.search(employees, q)
+        p50, p99 = timed(lambda: index.search(employees, q), args.repeat)
+        line = f"{q!r:<22} {total:>7} matches  index p50={p50 * 1e3:8.2f}ms p99={p99 * 1e3:8.2f}ms"
+        if args.scan:
+            s50, _ = timed(lambda: scan(q), 3)
+            line += f"  scan={s50 * 1e3:8.1f}ms"
+        print(line)
+    rows, total = index.search(employees, 'uwase', department='Legal', offset=100)
+    p50, p99 = timed(lambda: index.search(employees, 'uwase', department='Legal', offset=100), args.repeat)
+    print(f"{'uwase in Legal, p3':<22} {total:>7} matches  index p50={p50 * 1e3:8.2f}ms p99={p99 * 1e3:8.2f}ms")
+
+
+@benchmark
+def bench_calendar(args):
+    # "who is out next week in IT" over args.employees x args.history requests:
+    # the occupancy index against scanning every employee's requests, and the
+    # cost of keeping the index current through approve/reject
+    from indexes import OccupancyIndex
+    employees = {eid: employee_from_dict(ed) for eid, ed in synthetic_data(args.employees, args.history).items()}
+    gc.collect()
+    before = rss_kb()
+    t0 = time.perf_counter()
+    index = OccupancyIndex()
+    index.rebuild(employees.values())
+    build = time.perf_counter() - t0
+    gc.collect()
+    print(f"build {sum(len(e.leave_requests) for e in employees.values())} requests: {build:.2f}s, "
+          f"+{(rss_kb() - before) / 1024:.0f}MB")
+    rng = random.Random(1)
+    days = [r.start for e in employees.values() for r in e.leave_requests]
+    lo, hi = min(days), max(days)
+
+    def scan(start, end):
+        out = {}
+        for e in employees.values():
+            if e.department == 'IT':
+                for r in e.leave_requests:
+                    if r.status == Status.Approved and r.start <= end and r.end >= start:
+                        for day in range(max(r.start, start), min(r.end, end) + 1):
+                            out.setdefault(day, set()).add(e.emp_id)
+        return out
+
+    start = rng.randint(lo, hi)
+    assert {d: sorted(ids) for d, ids in scan(start, start + 6).items()} == index.out('IT', start, start + 6)
+    p50, p99 = timed(lambda: index.out('IT', (d := rng.randint(lo, hi)), d + 6), args.repeat)
+    s50, _ = timed(lambda: scan((d := rng.randint(lo, hi)), d + 6), 3)
+    print(f"week in IT     index p50={p50 * 1e6:8.1f}us p99={p99 * 1e6:8.1f}us  scan={s50 * 1e3:8.1f}ms")
+    emp = employees['E000000']
+
+    def flip():
+        i = rng.randrange(len(emp.leave_requests))
+        r = emp.leave_requests[i]
+        prev, r.status = r.status, Status.Approved if r.status != Status.Approved else Status.Rejected
+        index.on_change(emp, i, prev)
+    p50, p99 = timed(flip, args.repeat)
+    print(f"status change  index p50={p50 * 1e6:8.1f}us p99={p99 * 1e6:8.1f}us")
+
+
+@benchmark
+def bench_export(args):
+    # stream /admin/export/<fmt> over args.employees x args.history requests: time to
+    # the first chunk, rows/s, and peak memory traced while the body is consumed
+    import tracemalloc
+    connection = load_app(synthetic_data(args.employees, args.history), args.storage)
+    client = connection.app.test_client()
+    with client.session_transaction() as s:
+        s['admin'] = True
+    total = args.employees * args.history
+    def consume(fmt):
+        resp = client.get(f'/admin/export/{fmt}', buffered=False)
+        chunks = iter(resp.response)
+        size = len(next(chunks))
+        first = time.perf_counter() - t0
+        for chunk in chunks:
+            size += len(chunk)
+        resp.close()
+        return first, size
+
+    for fmt in ('csv', 'jsonl'):
+        t0 = time.perf_counter()
+        first, size = consume(fmt)
+        elapsed = time.perf_counter() - t0
+        gc.collect()
+        tracemalloc.start()  # second pass: tracing slows it down too much to time
+        consume(fmt)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{fmt:<6} {total} requests: first chunk {first * 1e3:.1f}ms, {elapsed:.2f}s "
+              f"({total / elapsed:.0f} rows/s, {size / 2 ** 20:.0f}MB), peak traced {peak / 2 ** 20:.1f}MB")
+
+
+@benchmark
+def bench_save(args):
+    # one employee's record changes (e.g. a password) and is saved, then a batch
+    # of 16 spread over many shards: json rewrites the one data.json, sharded
+    # rewrites only the affected shard files (in parallel for the batch)
+    data = synthetic_data(args.employees, args.history)
+    ids = sorted(data)
+    rng = random.Random(1)
+    for storage in ('json', 'sharded'):
+        workdir = tempfile.mkdtemp(prefix='lms-save-')
+        backend = make_backend(storage, os.path.join(workdir, default_path(storage)))
+        backend.save(data)
+        for batch in (1, 16):
+            def save():
+                eids = rng.sample(ids, batch)
+                for eid in eids:
+                    data[eid]['password'] = f"p{rng.random()}"
+                backend.save({eid: data[eid] for eid in eids}, eids)
+            p50, p99 = timed(save, max(args.repeat // 10, 5))
+            print(f"{storage:<8} {args.employees} employees, {batch:>2} per save: p50={p50 * 1e3:8.2f}ms p99={p99 * 1e3:8.2f}ms")
+        backend.close()
+
+
+@benchmark
+def bench_ledger(args):
+    # an employee whose ledger holds args.history deductions: balance_on() for
+    # random past days against replaying the whole ledger
+    ed = synthetic_data(1, args.history * 3, balances={'Vacation': 10 ** 9})['E000000']
+    emp = employee_from_dict(ed)
+    entries = emp.ledger.entries
+    lo, hi = entries[0].day, entries[-1].day
+    rng = random.Random(1)
+
+    def replay():
+        day, totals = rng.randint(lo, hi), {}
+        for e in entries:
+            if e.day <= day:
+                totals[e.leave_type] = totals.get(e.leave_type, 0) + e.amount
+    for label, fn in (('current', lambda: emp.leave_balances['Vacation']),
+                      ('balance_on', lambda: emp.balance_on(rng.randint(lo, hi))),
+                      ('full replay', replay)):
+        p50, p99 = timed(fn, args.repeat)
+        print(f"{label:<12} {len(entries)} entries: p50={p50 * 1e6:8.1f}us p99={p99 * 1e6:8.1f}us")
+
+
+@benchmark
+def bench_accrual(args):
+    # a year's accrual over args.employees in-memory employees, mostly hired in
+    # earlier years with balances above and below the carry-over caps, a tenth
+    # hired during the year; then the same run again, which must post nothing
+    import accrual
+    year = datetime.now().year
+    first, last = accrual.period(year)
+    rng = random.Random(1)
+    t0 = time.perf_counter()
+    employees = {}
+    for i in range(args.employees):
+        eid = f"E{i:07d}"
+        hired = rng.randint(first, last) if i % 10 == 0 else rng.randint(first - 3000, first - 1)
+        ledger = [LedgerEntry(hired, lt, DEFAULT_BALANCES[lt], 'opening') for lt in LEAVE_TYPES]
+        if hired < first:
+            ledger.append(LedgerEntry(first - 1, 'Vacation', rng.randint(-15, 10), 'adjustment'))
+        balances = {lt: 0 for lt in LEAVE_TYPES}
+        for e in ledger:
+            balances[e.leave_type] += e.amount
+        employees[eid] = Employee(eid, f"Employee {i}", leave_balances=balances, ledger=ledger)
+    print(f"built {len(employees)} employees in {time.perf_counter() - t0:.1f}s")
+    for label in ('accrual', 'repeat'):
+        t0 = time.perf_counter()
+        changed = posted = 0
+        for ids in accrual.chunks(employees):
+            c, n = accrual.accrue_chunk(employees, ids, year)
+            changed += len(c)
+            posted += n
+        elapsed = time.perf_counter() - t0
+        print(f"{label:<8} {year}: {elapsed:6.1f}s ({len(employees) / elapsed:8.0f} employees/s), "
+              f"{posted} entries for {changed} employees")
+    problems = [p for emp in list(employees.values())[::max(len(employees) // 1000, 1)] for p in reconcile(emp)]
+    if posted or problems:
+        sys.exit(f"FAILED: {posted} entries on the repeat run, {len(problems)} reconcile problems")
+
+
+def write_legacy_data(path, employees, requests_per_employee):
+    # schema 1, as the original app wrote it: no password, three leave types
+    with open(path, 'w') as f:
+        f.write('{')
+        for i in range(employees):
+            ed = synthetic_data(1, requests_per_employee)['E000000']
+            eid = ed['emp_id'] = f"E{i:07d}"
+            del ed['password'], ed['ledger']
+            ed['leave_balances'] = {lt: ed['leave_balances'][lt] for lt in ('Vacation', 'Sick', 'Maternity')}
+            f.write((',' if i else '') + f'\n    {json.dumps(eid)}: ' + json.dumps(ed, indent=4).replace('\n', '\n    '))
+        f.write('\n}' if employees else '}')
+
+
+@benchmark
+def bench_migrate(args):
+    # schema 1 -> current over args.employees x args.history requests: a dry run,
+    # then the real migration with one process and with args.workers
+    from migrate_data import migrate
+    workdir = tempfile.mkdtemp(prefix='lms-migrate-')
+    path = os.path.join(workdir, 'data.json')
+    for label, jobs, dry_run in (('dry run', 1, True), ('1 process', 1, False), (f"{args.workers} processes", args.workers, False)):
+        write_legacy_data(path, args.employees, args.history)
+        if os.path.exists(path + '.schema'):
+            os.remove(path + '.schema')
+        stats = migrate('json', path, jobs=jobs, dry_run=dry_run)
+        print(f"{label:<12} {stats['employees']} employees, {stats['requests']} requests: {stats['seconds']:6.1f}s "
+              f"({stats['requests'] / stats['seconds']:8.0f} requests/s), {stats['changed']} changed, {stats['invalid']} invalid")
+
+
+def write_big_data(path, size_mb, requests_per_employee):
+    # written one employee at a time in json.dump(indent=4) layout, so the
+    # generator itself never holds more than one record
+    target, written, i = size_mb * 2 ** 20, 0, 0
+    with open(path, 'w') as f:
+        f.write('{')
+        while written < target:
+            ed = synthetic_data(1, requests_per_employee)['E000000']
+            eid = ed['emp_id'] = f"E{i:07d}"
+            ed['name'] = f"{FIRST_NAMES[i % len(FIRST_NAMES)]} {LAST_NAMES[i // len(FIRST_NAMES) % len(LAST_NAMES)]}"
+            chunk = (',' if i else '') + f'\n    {json.dumps(eid)}: ' + json.dumps(ed, indent=4).replace('\n', '\n    ')
+            f.write(chunk)
+            written += len(chunk)
+            i += 1
+        f.write('\n}')
+    return i
+
+
+def _load_child(workdir, mode, out):
+    # mode 'json.load': the old loader, the whole file parsed into one dict first
+    os.chdir(workdir)
+    sys.path.insert(0, HERE)
+    limit = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') * 9 // 10
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))  # fail with MemoryError rather than the OOM killer
+    os.environ['LMS_LAZY_EMPLOYEES'] = '1000' if mode == 'lazy' else '0'
+    t0 = time.perf_counter()
+    try:
+        if mode == 'json.load':
+            from models import employee_from_dict
+            from indexes import RequestIndex, RequestAggregates, EmployeeSearch, rebuild_all
+            with open('data.json') as f:
+                employees = {eid: employee_from_dict(ed) for eid, ed in json.load(f).items()}
+            rebuild_all((RequestIndex(), RequestAggregates(), EmployeeSearch()), employees.values())
+            lookup = None
+        else:
+            import connection
+            eids = random.Random(1).sample(stored_ids(connection), 200)
+            t1 = time.perf_counter()
+            for eid in eids:
+                connection.get_employee(eid).leave_requests[-1].to_dict()
+            lookup = (time.perf_counter() - t1) / len(eids)
+    except MemoryError:
+        out.put((mode, None, None, None))
+        return
+    elapsed = time.perf_counter() - t0
+    out.put((mode, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, lookup))
+
+
+@benchmark
+def bench_load(args):
+    # startup time and peak RSS on a data.json of about --size-mb, each loader
+    # in a fresh process; lazy mode keeps 1000 employees resident
+    workdir = tempfile.mkdtemp(prefix='lms-load-')
+    t0 = time.perf_counter()
+    n = write_big_data(os.path.join(workdir, 'data.json'), args.size_mb, args.history)
+    write_schema('json', os.path.join(workdir, 'data.json'))
+    size = os.path.getsize(os.path.join(workdir, 'data.json'))
+    print(f"data.json: {size / 2 ** 20:.0f}MB, {n} employees x {args.history} requests "
+          f"(written in {time.perf_counter() - t0:.0f}s)")
+    ctx = multiprocessing.get_context('spawn')
+    for mode in ('json.load', 'streaming', 'lazy'):
+        out = ctx.Queue()
+        p = ctx.Process(target=_load_child, args=(workdir, mode, out))
+        p.start()
+        p.join()
+        if out.empty():
+            print(f"{mode:<10} died (exit code {p.exitcode})")
+            continue
+        mode, elapsed, peak_kb, lookup = out.get()
+        if elapsed is None:
+            print(f"{mode:<10} MemoryError")
+            continue
+        extra = f", get_employee {lookup * 1e3:.2f}ms" if lookup is not None else ''
+        print(f"{mode:<10} startup {elapsed:6.1f}s  peak RSS {peak_kb / 1024:7.0f}MB{extra}")
+
+
+
+# Load scenarios: each builds its clients against the app and returns one
+# callable per request; run_scenario() times them from --threads threads and
+# reports latency percentiles and throughput. `bench.py scenarios --save DIR`
+# keeps the results as JSON and --compare checks them against an earlier run.
+
+SCENARIOS = {}
+OK_STATUSES = (200, 302, 304)
+
+
+def scenario(fn):
+    SCENARIOS[fn.__name__.replace('scenario_', '')] = fn
+    return fn
+
+
+def logged_in_clients(app, n, **values):
+    clients = []
+    for _ in range(n):
+        client = app.test_client()
+        with client.session_transaction() as s:
+            s.update(values)
+        clients.append(client)
+    return clients
+
+
+@scenario
+def scenario_apply_storm(connection, args, threads):
+    # every employee of a client pool submits new requests, all at once
+    ids = stored_ids(connection)
+    ids = ids[:max(threads, min(len(ids), 100) // threads * threads)]
+    clients = [logged_in_clients(connection.app, 1, employee_id=eid)[0] for eid in ids]
+    first = datetime(2035, 1, 1)
+
+    def apply(client, n):
+        start = first + timedelta(days=n * 3)
+        form = {'leave_type': 'Vacation', 'start_date': start.strftime('%Y-%m-%d'),
+                'end_date': (start + timedelta(days=1)).strftime('%Y-%m-%d')}
+        return lambda: client.post('/apply', data=form)
+    return [apply(clients[i % len(clients)], i // len(clients)) for i in range(args.repeat)]
+
+
+@scenario
+def scenario_approval_sweep(connection, args, threads):
+    # admins working down the pending queue, approving one request per call
+    pending, after = [], None
+    while len(pending) < args.repeat:
+        rows, after = connection.request_page('Pending', after=after, limit=500)
+        pending += [row['request_id'] for row in rows]
+        if after is None:
+            break
+    clients = logged_in_clients(connection.app, threads, admin=True)
+    return [lambda client=clients[i % threads], rid=rid:
+            client.post('/admin/requests', data={'action': 'Approved', 'request_id': rid})
+            for i, rid in enumerate(pending[:args.repeat])]
+
+
+@scenario
+def scenario_dashboard(connection, args, threads):
+    # admins refreshing the dashboard and the stats feed behind it
+    clients = logged_in_clients(connection.app, threads, admin=True)
+    paths = ('/dashboard', '/api/stats')
+    return [lambda client=clients[i % threads], path=paths[i // threads % 2]: client.get(path)
+            for i in range(args.repeat)]
+
+
+@scenario
+def scenario_search(connection, args, threads):
+    # the admin employee list: ids, names, departments, prefixes and filters
+    clients = logged_in_clients(connection.app, threads, admin=True)
+    ids = stored_ids(connection)
+    queries = ['', 'IT', 'employee', f"employee {len(ids) // 2}", ids[-1], ids[-1][:-2], 'finance employee 1']
+    return [lambda client=clients[i % threads], q=queries[i // threads % len(queries)]:
+            client.get('/admin/employees', query_string={'q': q})
+            for i in range(args.repeat)]
+
+
+def run_scenario(calls, threads):
+    # thread t makes calls t, t + threads, ...; each scenario keeps a client to one thread that way
+    samples, errors = [[] for _ in range(threads)], [0] * threads
+    barrier = threading.Barrier(threads)
+
+    def work(t):
+        barrier.wait()
+        for call in calls[t::threads]:
+            t0 = time.perf_counter()
+            status = call().status_code
+            samples[t].append(time.perf_counter() - t0)
+            errors[t] += status not in OK_STATUSES
+    pool = [threading.Thread(target=work, args=(t,)) for t in range(threads)]
+    t0 = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    latencies = sorted(x for s in samples for x in s)
+    if not latencies:
+        return None
+    return {'requests': len(latencies), 'errors': sum(errors), 'seconds': round(elapsed, 4),
+            'throughput': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(latencies[len(latencies) // 2] * 1e3, 3),
+            'p99_ms': round(latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1e3, 3),
+            'max_ms': round(latencies[-1] * 1e3, 3)}
+
+
+def git_revision():
+    try:
+        import subprocess
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(old, new, tolerance):
+    # regressions: p50 slower or throughput lower by more than `tolerance`, or
+    # p99 slower by more than twice that (the tail of a short run is noisy)
+    regressions = []
+    for name, result in new['scenarios'].items():
+        before = old['scenarios'].get(name)
+        if not before or not result:
+            continue
+        deltas = []
+        for key, worse, allowed in (('p50_ms', 1, tolerance), ('p99_ms', 1, 2 * tolerance), ('throughput', -1, tolerance)):
+            change = (result[key] - before[key]) / before[key] if before[key] else 0.0
+            deltas.append(f"{key} {before[key]} -> {result[key]} ({change:+.0%})")
+            if change * worse > allowed:
+                regressions.append(f"{name} {key}")
+        print(f"{name:<16} " + '  '.join(deltas))
+    return regressions
+
+
+def load_data_file(storage, path):
+    backend = make_backend(storage, path)
+    try:
+        return dict(backend.iter_all())
+    finally:
+        backend.close()
+
+
+@benchmark
+def bench_generate(args):
+    # not a timing: writes a synthetic store of --employees x --per-employee
+    # requests to --data (default data.json), e.g. for a load test of a real server
+    path = os.path.abspath(args.data or default_path(args.storage))
+    if os.path.exists(path):
+        sys.exit(f"{path} already exists.")
+    t0 = time.perf_counter()
+    backend = make_backend(args.storage, path)
+    backend.save(synthetic_data(args.employees, args.per_employee))
+    backend.close()
+    write_schema(args.storage, path)
+    print(f"{path}: {args.employees} employees x {args.per_employee} requests in {time.perf_counter() - t0:.1f}s")
+
+
+@benchmark
+def bench_scenarios(args):
+    # p50/p99 latency and throughput of each --scenario, in order, against one
+    # app: --data, or --employees x --per-employee synthetic employees
+    names = args.scenario or sorted(SCENARIOS)
+    data = (load_data_file(args.storage, os.path.abspath(args.data)) if args.data
+            else synthetic_data(args.employees, args.per_employee, balances={'Vacation': 10 ** 6}))
+    saved = os.path.abspath(args.save) if args.save else None
+    # the machine is part of the configuration: timings from another runner type are no baseline
+    config = {'storage': args.storage, 'threads': args.threads, 'employees': len(data), 'repeat': args.repeat,
+              'requests': sum(len(ed['leave_requests']) for ed in data.values()),
+              'machine': f"{platform.system()} {platform.machine()} x{os.cpu_count()}"}
+    baseline = None
+    if args.compare == 'latest':
+        for name in sorted(os.listdir(saved) if saved and os.path.isdir(saved) else (), reverse=True):
+            with open(os.path.join(saved, name)) as f:
+                found = json.load(f)
+            if found.get('config') == config:
+                baseline = found
+                break
+        else:
+            print(f"no earlier results with this configuration in {saved}")
+    elif args.compare:
+        with open(os.path.abspath(args.compare)) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != config:
+            print(f"warning: {args.compare} was run with {baseline.get('config')}")
+    connection = load_app(data, args.storage)
+    del data
+    results = {'revision': git_revision(), 'time': datetime.now().isoformat(timespec='seconds'),
+               'python': sys.version.split()[0], 'config': config, 'scenarios': {}}
+    print(f"{config['employees']} employees, {config['requests']} requests, {args.storage}, {args.threads} threads")
+    for name in names:
+        result = run_scenario(SCENARIOS[name](connection, args, args.threads), args.threads)
+        results['scenarios'][name] = result
+        if result is None:
+            print(f"{name:<16} nothing to do")
+            continue
+        print(f"{name:<16} {result['requests']:6} req  {result['throughput']:8.1f} req/s  p50 {result['p50_ms']:8.2f}ms  "
+              f"p99 {result['p99_ms']:8.2f}ms  max {result['max_ms']:8.2f}ms  errors {result['errors']}")
+    if saved:
+        os.makedirs(saved, exist_ok=True)
+        out = os.path.join(saved, f"{time.strftime('%Y%m%d-%H%M%S')}-{results['revision'] or 'unknown'}.json")
+        with open(out, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"saved {out}")
+    failed = [name for name, r in results['scenarios'].items() if r and r['errors']]
+    if baseline:
+        print(f"against {baseline['revision']} ({baseline['time']}):")
+        slower = compare_results(baseline, results, args.tolerance)
+        if slower and args.report_only:
+            print(f"regressions (not failing, --report-only): {', '.join(slower)}")
+        else:
+            failed += slower
+    if failed:
+        sys.exit("FAILED: " + ', '.join(failed))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Leave Management microbenchmarks")
+    parser.add_argument('name', choices=sorted(BENCHMARKS))
+    parser.add_argument('--history', type=int, default=10000, help="historical requests per employee")
+    parser.add_argument('--employees', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--ops', type=int, default=100, help="operations per stress worker")
+    parser.add_argument('--storage', choices=STORAGE_MODES, default='json')
+    parser.add_argument('--no-lock', action='store_true', help="run the stress test without cross-process locking")
+    parser.add_argument('--lazy', type=int, default=0, help="employees each stress worker keeps resident (LMS_LAZY_EMPLOYEES)")
+    parser.add_argument('--flush-interval', type=float, default=0.0, help="seconds to collect saves into one write")
+    parser.add_argument('--durability', choices=('flush', 'immediate'), default='flush')
+    parser.add_argument('--scan', action='store_true', help="also time the linear scan search")
+    parser.add_argument('--items', type=int, default=100000, help="items per bulk call")
+    parser.add_argument('--requests', type=int, default=100000, help="leave requests to hold in memory")
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--size-mb', type=int, default=1024, help="size of the generated data.json for load")
+    parser.add_argument('--per-employee', type=int, default=20, help="requests per employee for generate and scenarios")
+    parser.add_argument('--data', help="data file for generate to write, or for scenarios to load instead of synthetic data")
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help="run only this scenario (repeatable)")
+    parser.add_argument('--threads', type=int, default=1, help="concurrent clients per scenario")
+    parser.add_argument('--save', help="directory to keep the scenario results in")
+    parser.add_argument('--compare', help="earlier results file, or 'latest' in --save with the same settings, to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="slowdown counted as a regression")
+    parser.add_argument('--report-only', action='store_true', help="print regressions against --compare without failing")
+    args = parser.parse_args()
+    BENCHMARKS[args.name](args)
@@ -0,0 +1,173 @@
+import json, os
+from datetime import datetime
+from models import Status, employee_from_dict, request_listeners
+from indexes import OccupancyIndex, request_id, parse_request_id
+import staffing
+
+# Bulk operations take a mapping emp_id -> Employee and a list of item dicts,
+# apply what validates and return (per-item results, ids of changed employees).
+# The caller locks the employees, persists the changed ones once and can roll
+# back by restoring earlier to_dict() snapshots, also when an operation raises
+# part way through a batch.
+
+IMPORT_FIELDS = ('emp_id', 'leave_type', 'start_date', 'end_date')
+
+
+def result(i, ok, message, rid=None):
+    return {'item': i, 'ok': ok, 'message': message, 'request_id': rid}
+
+
+def employee_ids(kind, items):
+    ids = set()
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        if kind == 'decisions':
+            try:
+                ids.add(parse_request_id(str(item.get('request_id', '')))[0])
+            except ValueError:
+                pass
+        elif isinstance(item.get('emp_id'), str):
+            ids.add(item['emp_id'])
+    return ids
+
+
+def apply_decisions(employees, items, guard=None):
+    # items: {"request_id": "emp_id:index", "action": "Approved" | "Rejected" | "Pending"};
+    # guard(emp, index) may refuse an approval by returning the reason
+    results, changed = [], set()
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or 'request_id' not in item:
+            results.append(result(i, False, "Invalid item."))
+            continue
+        rid, act = str(item['request_id']), item.get('action')
+        if not isinstance(act, str) or act not in Status.__members__:
+            results.append(result(i, False, "Invalid action.", rid))
+            continue
+        try:
+            eid, idx = parse_request_id(rid)
+        except ValueError:
+            eid, idx = None, -1
+        emp = employees.get(eid)
+        if emp is None or not 0 <= idx < len(emp.leave_requests):
+            results.append(result(i, False, "Request not found.", rid))
+            continue
+        refused = guard(emp, idx) if guard and act == 'Approved' else None
+        if refused:
+            results.append(result(i, False, refused, rid))
+            continue
+        emp.set_status(idx, Status[act])
+        changed.add(eid)
+        results.append(result(i, True, "Request updated.", rid))
+    return results, changed
+
+
+def import_requests(employees, items):
+    # items: {"emp_id", "leave_type", "start_date", "end_date"}, dates as YYYY-MM-DD;
+    # each one goes through Employee.apply_leave like a submission from /apply
+    results, changed = [], set()
+    for i, item in enumerate(items):
+        if (not isinstance(item, dict) or any(f not in item for f in IMPORT_FIELDS)
+                or not all(isinstance(item[f], str) for f in IMPORT_FIELDS)):
+            results.append(result(i, False, "Invalid item."))
+            continue
+        emp = employees.get(item['emp_id'])
+        if emp is None:
+            results.append(result(i, False, "Employee not found."))
+            continue
+        try:
+            start = datetime.strptime(item['start_date'], '%Y-%m-%d')
+            end = datetime.strptime(item['end_date'], '%Y-%m-%d')
+        except (TypeError, ValueError):
+            results.append(result(i, False, "Invalid dates."))
+            continue
+        if start > end:
+            results.append(result(i, False, "Start date must be before end date."))
+            continue
+        ok, msg = emp.apply_leave(item['leave_type'], start, end)
+        if ok:
+            changed.add(emp.emp_id)
+        results.append(result(i, ok, msg, request_id(emp.emp_id, len(emp.leave_requests) - 1) if ok else None))
+    return results, changed
+
+
+OPERATIONS = {'decisions': apply_decisions, 'requests': import_requests}
+
+
+def read_jsonl(path):
+    # one item per line; a line that isn't valid JSON becomes an invalid item
+    items = []
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                try:
+                    items.append(json.loads(line))
+                except ValueError:
+                    items.append(None)
+    return items
+
+
+def run_offline(kind, items, storage='json', path=None, atomic=False, limits=None):
+    # Apply a batch straight to the data files, e.g. while the server is down.
+    # Takes the same lock and bumps the same version file as LMS_MULTIPROCESS
+    # workers, which then pick the changes up on their next request. Approvals
+    # are held to the staffing `limits` as they are by /admin/bulk/decisions.
+    from storage import make_backend, default_path, FileLock, VersionFile
+    from migrate_data import require_current
+    path = path or default_path(storage)
+    require_current(storage, path)
+    lock = FileLock(path + '.lock')
+    opts = {'lock': lock} if storage == 'journal' else {}
+    backend = make_backend(storage, path, **opts)
+    try:
+        with lock:
+            employees = {eid: employee_from_dict(ed) for eid, ed in backend.load_all().items()}
+            opts, occupancy = {}, None
+            if kind == 'decisions' and limits:
+                occupancy = OccupancyIndex()
+                occupancy.rebuild(employees.values())
+                request_listeners.append(occupancy.on_change)
+                opts['guard'] = staffing.approval_guard(limits, occupancy.out)
+            try:
+                results, changed = OPERATIONS[kind](employees, items, **opts)
+            finally:
+                if occupancy is not None:
+                    request_listeners.remove(occupancy.on_change)
+            committed = bool(changed) and not (atomic and not all(r['ok'] for r in results))
+            if committed:
+                backend.save({eid: employees[eid].to_dict() for eid in changed}, list(changed))
+                VersionFile(path + '.version').bump()
+    finally:
+        backend.close()
+    return results, committed
+
+
+if __name__ == '__main__':
+    import argparse, sys, time
+    from storage import STORAGE_MODES
+    parser = argparse.ArgumentParser(description="Apply leave decisions or import leave requests from a JSONL file")
+    parser.add_argument('kind', choices=sorted(OPERATIONS))
+    parser.add_argument('src', help="JSONL file, one item per line")
+    parser.add_argument('--storage', choices=STORAGE_MODES, default='json')
+    parser.add_argument('--path', help="data file or directory (default data.json, leave.db for sqlite, data.shards for sharded)")
+    parser.add_argument('--atomic', action='store_true', help="write nothing unless every item succeeds")
+    parser.add_argument('--limits', default=os.environ.get('LMS_STAFFING_LIMITS'),
+                        help="staffing limits JSON for approvals (default $LMS_STAFFING_LIMITS, as the server)")
+    parser.add_argument('--results', help="write per-item results to this JSONL file")
+    args = parser.parse_args()
+    items = read_jsonl(args.src)
+    t0 = time.perf_counter()
+    try:
+        limits = staffing.load_limits(args.limits) if args.limits else None
+        results, committed = run_offline(args.kind, items, args.storage, args.path, args.atomic, limits)
+    except ValueError as e:
+        sys.exit(str(e))
+    elapsed = time.perf_counter() - t0
+    if args.results:
+        with open(args.results, 'w') as f:
+            f.writelines(json.dumps(r) + '\n' for r in results)
+    ok = sum(r['ok'] for r in results)
+    print(f"{ok} of {len(results)} items succeeded in {elapsed:.2f}s "
+          f"({len(results) / elapsed if elapsed else 0:.0f} items/s); {'committed' if committed else 'nothing written'}.")
+    if not committed and ok:
+        sys.exit(1)
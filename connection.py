@@ -1,468 +1,1120 @@
-from flask import Flask, render_template_string, request, redirect, url_for, flash, session
-from datetime import datetime
-import json, os, functools
-
-app = Flask(__name__)
-app.secret_key = 'secret-key-change-this'
-
-LEAVE_TYPES = ["Vacation", "Sick", "Maternity", "specific"]
-DEFAULT_BALANCES = {"Vacation": 15, "Sick": 10, "Maternity": 90, "specific": 45}
-DATA_FILE = 'data.json'
-
-class Employee:
-    def __init__(self, emp_id, name, password='password', contact='', department='', leave_balances=None, leave_requests=None):
-        self.emp_id = emp_id
-        self.name = name
-        self.password = password
-        self.contact = contact
-        self.department = department
-        self.leave_balances = leave_balances or {lt: DEFAULT_BALANCES[lt] for lt in LEAVE_TYPES}
-        self.leave_requests = leave_requests or []
-
-    def apply_leave(self, leave_type, start_date, end_date):
-        days = (end_date - start_date).days + 1
-        if start_date.date() < datetime.now().date():
-            return False, "Start date cannot be in the past."
-        if leave_type not in LEAVE_TYPES:
-            return False, f"Invalid leave type: {leave_type}."
-        if days > self.leave_balances.get(leave_type, 0):
-            return False, f"Insufficient {leave_type} leave balance."
-        for req in self.leave_requests:
-            if req['status'] in ('Pending', 'Approved'):
-                es = datetime.strptime(req['start_date'], '%Y-%m-%d')
-                ee = datetime.strptime(req['end_date'], '%Y-%m-%d')
-                if start_date <= ee and end_date >= es:
-                    return False, "Dates overlap with an existing request."
-        self.leave_requests.append({
-            "leave_type": leave_type,
-            "start_date": start_date.strftime('%Y-%m-%d'),
-            "end_date": end_date.strftime('%Y-%m-%d'),
-            "days": days,
-            "status": "Pending",
-            "deducted": False
-        })
-        return True, f"{leave_type} leave for {days} day(s) submitted."
-
-    def to_dict(self):
-        return {
-            'emp_id': self.emp_id,
-            'name': self.name,
-            'password': self.password,
-            'contact': self.contact,
-            'department': self.department,
-            'leave_balances': self.leave_balances,
-            'leave_requests': self.leave_requests
-        }
-
-employees = {}
-
-def load_data():
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, 'r') as f:
-            data = json.load(f)
-            for eid, ed in data.items():
-                employees[eid] = Employee(
-                    ed['emp_id'], ed['name'], ed.get('password', 'password'),
-                    ed.get('contact', ''), ed.get('department', ''),
-                    ed.get('leave_balances', {lt: DEFAULT_BALANCES[lt] for lt in LEAVE_TYPES}),
-                    ed.get('leave_requests', [])
-                )
-
-def save_data():
-    with open(DATA_FILE, 'w') as f:
-        json.dump({eid: emp.to_dict() for eid, emp in employees.items()}, f, indent=4)
-
-load_data()
-
-def employee_login_required(view):
-    @functools.wraps(view)
-    def wrapped_view(**kwargs):
-        if 'employee_id' not in session:
-            flash("Please log in as employee first.")
-            return redirect(url_for('employee_login'))
-        return view(**kwargs)
-    return wrapped_view
-
-base_template = """
-<!DOCTYPE html>
-<html>
-<head>
-  <title>Leave Management System</title>
-  <style>
-    body {
-      font-family: Arial;
-      margin:0; padding:0;
-      min-height:100vh;
-      background: #f4f4f4;
-      {% if request.endpoint == 'index' %}
-       background: url('{{ url_for('static', filename='img/successful-employees.png') }}') no-repeat center center fixed;
-            background-size: cover;
-      {% endif %}
-    }
-    .container {
-      max-width:900px;
-      margin:30px auto;
-      background:rgba(255,255,255,0.95);
-      padding:20px;
-      border-radius:8px;
-    }
-    ul.nav { list-style:none; padding:0; text-align:center; margin-bottom:20px; }
-    ul.nav li { display:inline; margin:0 10px; }
-    ul.nav a { color:#007BFF; text-decoration:none; font-weight:bold; }
-    .flash {
-      background-color: #f8d7da;
-      padding: 15px;
-      border-radius: 5px;
-      color: #721c24;
-      border: 1px solid #f5c6cb;
-      margin: 10px 0;
-      text-align:center;
-    }
-    table { width:100%; border-collapse:collapse; margin-top:20px; }
-    th,td { padding:8px; border:1px solid #ddd; text-align:left; }
-    th { background:#efefef; }
-    input, select, button { width:100%; padding:8px; margin:5px 0; }
-    button { background:#007BFF; color:#fff; border:none; cursor:pointer; }
-    button:hover { background:#0056b3; }
-    .action-form { display:inline; }
-  </style>
-</head>
-<body>
-  <div class="container">
-    <h2>Leave Management System</h2>
-    <ul class="nav">
-      <li><a href="{{ url_for('index') }}">Home</a></li>
-      {% if session.get('employee_id') %}
-        <li><a href="{{ url_for('apply_leave') }}">Apply Leave</a></li>
-        <li><a href="{{ url_for('view_requests') }}">My Requests</a></li>
-        <li><a href="{{ url_for('change_password') }}">Change Password</a></li>
-        <li><a href="{{ url_for('employee_logout') }}">Logout ({{ employees[session.get('employee_id')].name }})</a></li>
-      {% else %}
-        <li><a href="{{ url_for('employee_login') }}">Employee Login</a></li>
-      {% endif %}
-      {% if session.get('admin') %}
-        <li><a href="{{ url_for('dashboard') }}">Dashboard</a></li>
-        <li><a href="{{ url_for('admin_requests') }}">Admin Requests</a></li>
-        <li><a href="{{ url_for('admin_employees') }}">Employees</a></li>
-        <li><a href="{{ url_for('admin_logout') }}">Logout (Admin)</a></li>
-      {% else %}
-        <li><a href="{{ url_for('admin_login') }}">Admin Login</a></li>
-      {% endif %}
-    </ul>
-    {% with messages = get_flashed_messages() %}
-      {% if messages %}
-        <div class="flash"><strong>{{ messages[0] }}</strong></div>
-      {% endif %}
-    {% endwith %}
-    {{ content|safe }}
-  </div>
-</body>
-</html>
-"""
-
-@app.route('/')
-def index():
-    return render_template_string(base_template, content="<h3>Welcome to the Leave Management System</h3>", employees=employees)
-
-@app.route('/employee/login', methods=['GET', 'POST'])
-def employee_login():
-    if request.method == 'POST':
-        emp_id = request.form['emp_id']
-        password = request.form['password']
-        emp = employees.get(emp_id)
-        if emp and emp.password == password:
-            session.clear()
-            session['employee_id'] = emp_id
-            flash(f"Welcome {emp.name}!")
-            return redirect(url_for('apply_leave'))
-        else:
-            flash("Invalid employee ID or password.")
-            return redirect(url_for('employee_login'))
-    return render_template_string(base_template, content="""
-      <h3>Employee Login</h3>
-      <form method="post">
-        Employee ID:<input name="emp_id" required>
-        Password:<input type="password" name="password" required>
-        <button type="submit">Login</button>
-      </form>
-    """, employees=employees)
-
-@app.route('/employee/logout')
-def employee_logout():
-    session.pop('employee_id', None)
-    flash("Logged out successfully.")
-    return redirect(url_for('index'))
-
-@app.route('/employee/change_password', methods=['GET', 'POST'])
-@employee_login_required
-def change_password():
-    emp = employees.get(session['employee_id'])
-    if request.method == 'POST':
-        old = request.form['old_password']
-        new = request.form['new_password']
-        confirm = request.form['confirm_password']
-        if old != emp.password:
-            flash("Old password is incorrect.")
-        elif not new or new != confirm:
-            flash("New passwords do not match or are empty.")
-        else:
-            emp.password = new
-            save_data()
-            flash("Password changed successfully.")
-            return redirect(url_for('index'))
-    return render_template_string(base_template, content="""
-      <h3>Change Password</h3>
-      <form method="post">
-        Old Password: <input type="password" name="old_password" required>
-        New Password: <input type="password" name="new_password" required>
-        Confirm New Password: <input type="password" name="confirm_password" required>
-        <button type="submit">Update Password</button>
-      </form>
-    """, employees=employees)
-
-
-@app.route('/apply', methods=['GET', 'POST'])
-@employee_login_required
-def apply_leave():
-    emp = employees.get(session['employee_id'])
-    if request.method == 'POST':
-        lt = request.form['leave_type']
-        try:
-            start = datetime.strptime(request.form['start_date'], '%Y-%m-%d')
-            end = datetime.strptime(request.form['end_date'], '%Y-%m-%d')
-        except Exception:
-            flash("Invalid dates.")
-            return redirect(url_for('apply_leave'))
-        if start > end:
-            flash("Start date must be before end date.")
-            return redirect(url_for('apply_leave'))
-        ok, msg = emp.apply_leave(lt, start, end)
-        if ok:
-            save_data()
-        flash(msg)
-        return redirect(url_for('apply_leave'))
-    opts = ''.join(f'<option>{lt}</option>' for lt in LEAVE_TYPES)
-    return render_template_string(base_template, content=f"""
-      <h3>Apply Leave</h3>
-      <p>Logged in as: <strong>{emp.name}</strong> (ID: {emp.emp_id})</p>
-      <form method="post">
-        Leave Type: <select name="leave_type">{opts}</select>
-        Start Date: <input type="date" name="start_date" required>
-        End Date: <input type="date" name="end_date" required>
-        <button type="submit">Apply</button>
-      </form>
-    """, employees=employees)
-
-
-@app.route('/balance')
-@employee_login_required
-def view_balance():
-    emp = employees.get(session['employee_id'])
-    bal = ''.join(f'<li>{lt}: {emp.leave_balances[lt]}</li>' for lt in LEAVE_TYPES)
-    return render_template_string(base_template, content=f"<h3>{emp.name}'s Leave Balances</h3><ul>{bal}</ul>", employees=employees)
-
-
-@app.route('/requests')
-@employee_login_required
-def view_requests():
-    emp = employees.get(session['employee_id'])
-    if not emp.leave_requests:
-        content = f"<p>{emp.name} has no leave requests.</p>"
-    else:
-        items = "".join(f"<li>{r['leave_type']} {r['start_date']} → {r['end_date']} – Status: {r['status']}</li>" for r in emp.leave_requests)
-        content = f"<h3>{emp.name}'s Leave Requests</h3><ul>{items}</ul>"
-    return render_template_string(base_template, content=content, employees=employees)
-
-
-# Admin routes unchanged except they pass employees dict for navbar rendering
-
-@app.route('/admin/login', methods=['GET', 'POST'])
-def admin_login():
-    if request.method == 'POST':
-        if request.form['password'] == 'adminpass':
-            session.clear()
-            session['admin'] = True
-            flash("Logged in as Admin.")
-            return redirect(url_for('dashboard'))
-        flash("Incorrect password.")
-        return redirect(url_for('admin_login'))
-    return render_template_string(base_template, content="""
-      <h3>Admin Login</h3>
-      <form method="post">
-        Password:<input type="password" name="password" required>
-        <button type="submit">Login</button>
-      </form>
-    """, employees=employees)
-
-
-@app.route('/admin/logout')
-def admin_logout():
-    session.pop('admin', None)
-    flash("Admin logged out.")
-    return redirect(url_for('index'))
-
-
-@app.route('/admin/requests', methods=['GET', 'POST'])
-def admin_requests():
-    if not session.get('admin'):
-        return redirect(url_for('admin_login'))
-    if request.method == 'POST':
-        eid = request.form['emp_id']
-        idx = int(request.form['index'])
-        act = request.form['action']
-        emp = employees.get(eid)
-        if emp:
-            req = emp.leave_requests[idx]
-            prev = req['status']
-            req['status'] = act
-            if act == 'Approved' and not req['deducted']:
-                emp.leave_balances[req['leave_type']] -= req['days']
-                req['deducted'] = True
-            elif prev == 'Approved' and req['deducted'] and act != 'Approved':
-                emp.leave_balances[req['leave_type']] += req['days']
-                req['deducted'] = False
-            save_data()
-            flash("Request updated.")
-        return redirect(url_for('admin_requests'))
-    rows = ""
-    for emp in employees.values():
-        for i, r in enumerate(emp.leave_requests):
-            rows += f"<tr><td>{emp.emp_id}</td><td>{emp.name}</td><td>{r['leave_type']}</td><td>{r['start_date']}</td><td>{r['end_date']}</td><td>{r['days']}</td><td>{r['status']}</td><td><form method='post' class='action-form'><input type='hidden' name='emp_id' value='{emp.emp_id}'><input type='hidden' name='index' value='{i}'><button name='action' value='Approved'>Approve</button><button name='action' value='Rejected'>Reject</button></form></td></tr>"
-    table_html = f"<h3>Admin: Manage Requests</h3><a href='{url_for('add_employee')}'><button>Add Employee</button></a><table><tr><th>ID</th><th>Name</th><th>Type</th><th>Start</th><th>End</th><th>Days</th><th>Status</th><th>Actions</th></tr>{rows}</table>"
-    return render_template_string(base_template, content=table_html, employees=employees)
-
-
-@app.route('/admin/employees', methods=['GET', 'POST'])
-def admin_employees():
-    if not session.get('admin'):
-        return redirect(url_for('admin_login'))
-    q = request.form.get('query', '').lower() if request.method == 'POST' else ''
-    fl = [e for e in employees.values() if q in e.emp_id.lower() or q in e.name.lower() or q in e.department.lower()] if q else employees.values()
-    rows = ""
-    for e in fl:
-        rows += f"<tr><td>{e.emp_id}</td><td>{e.name}</td><td>{e.contact}</td><td>{e.department}</td><td><a href='{url_for('edit_employee', emp_id=e.emp_id)}'><button>Edit</button></a><form method='post' action='{url_for('delete_employee', emp_id=e.emp_id)}' class='action-form' onsubmit='return confirm(\"Delete {e.name}?\");'><button type='submit'>Delete</button></form></td></tr>"
-    tbl_html = f"<h3>Admin: Employees</h3><form method='post'><input name='query' placeholder='Search by ID, name, dept' value='{q}'><button type='submit'>Search</button></form><table><tr><th>ID</th><th>Name</th><th>Contact</th><th>Department</th><th>Actions</th></tr>{rows}</table>"
-    return render_template_string(base_template, content=tbl_html, employees=employees)
-
-
-@app.route('/admin/edit/<emp_id>', methods=['GET', 'POST'])
-def edit_employee(emp_id):
-    if not session.get('admin'):
-        return redirect(url_for('admin_login'))
-    emp = employees.get(emp_id)
-    if not emp:
-        flash("Employee not found.")
-        return redirect(url_for('admin_employees'))
-    if request.method == 'POST':
-        nm = request.form['name'].strip()
-        ct = request.form['contact'].strip()
-        dept = request.form['department'].strip()
-        pwd = request.form.get('password', '').strip()
-        if not all([nm, ct, dept]):
-            flash("All fields except password are required.")
-        else:
-            emp.name, emp.contact, emp.department = nm, ct, dept
-            if pwd:
-                emp.password = pwd
-            save_data()
-            flash("Employee updated.")
-            return redirect(url_for('admin_employees'))
-    return render_template_string(base_template, content=f"""
-      <h3>Edit Employee {emp.emp_id}</h3>
-      <form method="post">
-        Name: <input name="name" value="{emp.name}" required>
-        Contact: <input name="contact" value="{emp.contact}" required>
-        Department: <input name="department" value="{emp.department}" required>
-        Password (leave blank to keep current): <input type="password" name="password">
-        <button type="submit">Update</button>
-      </form><br>
-      <a href="{url_for('admin_employees')}"><button>Back</button></a>
-    """, employees=employees)
-
-
-@app.route('/admin/delete/<emp_id>', methods=['POST'])
-def delete_employee(emp_id):
-    if not session.get('admin'):
-        return redirect(url_for('admin_login'))
-    if emp_id in employees:
-        del employees[emp_id]
-        save_data()
-        flash("Employee deleted.")
-    else:
-        flash("Employee not found.")
-    return redirect(url_for('admin_employees'))
-
-
-@app.route('/dashboard')
-def dashboard():
-    if not session.get('admin'):
-        return redirect(url_for('admin_login'))
-    totals = {lt: 0 for lt in LEAVE_TYPES}
-    approved = {lt: 0 for lt in LEAVE_TYPES}
-    for emp in employees.values():
-        for r in emp.leave_requests:
-            totals[r['leave_type']] += 1
-            if r['status'] == 'Approved':
-                approved[r['leave_type']] += 1
-    chart_html = render_template_string("""
-      <h3>Leave Dashboard</h3>
-      <canvas id="chart" style="max-width:600px"></canvas>
-      <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-      <script>
-        const labels = {{ labels|tojson }};
-        const totalData = {{ totals|tojson }};
-        const approvedData = {{ approved|tojson }};
-        new Chart(document.getElementById('chart'), {
-          type: 'bar',
-          data: {
-            labels: labels,
-            datasets: [
-              { label: 'All Requests', data: totalData, backgroundColor: 'rgba(54,162,235,0.6)' },
-              { label: 'Approved', data: approvedData, backgroundColor: 'rgba(75,192,192,0.6)' }
-            ]
-          },
-          options: { scales: { y: { beginAtZero: true } } }
-        });
-      </script>
-    """, labels=LEAVE_TYPES, totals=list(totals.values()), approved=list(approved.values()))
-    return render_template_string(base_template, content=chart_html, employees=employees)
-
-
-@app.route('/add', methods=['GET', 'POST'])
-def add_employee():
-    # Only admin can add employees
-    if not session.get('admin'):
-        return redirect(url_for('admin_login'))
-    if request.method == 'POST':
-        eid = request.form['emp_id'].strip()
-        name = request.form['name'].strip()
-        contact = request.form['contact'].strip()
-        dept = request.form['department'].strip()
-        password = request.form['password'].strip() or 'password'  # default password if none entered
-        if not all([eid, name, contact, dept, password]):
-            flash("All fields required.")
-        elif eid in employees:
-            flash("Employee ID exists.")
-        else:
-            employees[eid] = Employee(eid, name, password, contact, dept)
-            save_data()
-            flash(f"Added {name} with default password.")
-        return redirect(url_for('add_employee'))
-    return render_template_string(base_template, content="""
-      <h3>Add Employee</h3>
-      <form method="post">
-        Employee ID: <input name="emp_id" required>
-        Name: <input name="name" required>
-        Contact: <input name="contact" required>
-        Department: <input name="department" required>
-        Password (default 'password'): <input type="text" name="password">
-        <button type="submit">Add</button>
-      </form>
-    """, employees=employees)
-
-if __name__ == '__main__':
-<<<<<<< HEAD
-    app.run(host='0.0.0.0', port=5002, debug=True)
-=======
-    app.run(host='0.0.0.0', port=5002, debug=True)
->>>>>>> 44f8223b22556f213d9065303084d49b1a4cf490
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, session, jsonify, g, \
+    before_render_template, template_rendered
+from datetime import datetime, date, timedelta
+import os, calendar, functools, atexit, secrets, threading, time
+from contextlib import contextmanager, ExitStack
+from models import LEAVE_TYPES, Status, Employee, date_ordinal, employee_from_dict, request_listeners
+from storage import make_backend, FileLock, VersionFile, GroupCommit
+from indexes import RequestIndex, RequestAggregates, EmployeeSearch, OccupancyIndex, parse_request_id, request_row, rebuild_all
+from lazy import LazyEmployees
+from fragments import FragmentCache
+from auth import Credentials, LoginLimiter, hash_password
+from sessions import ServerSession, ServerSessionInterface, make_session_store
+from metrics import Metrics, SlowRequestProfiler
+import accrual, bulk, export, ledger, migrate_data, staffing
+
+app = Flask(__name__)
+app.secret_key = os.environ.get('LMS_SECRET_KEY', 'secret-key-change-this')  # signs cookies in LMS_SESSION_STORE=cookie
+
+DATA_FILE = 'data.json'
+DB_FILE = 'leave.db'
+SESSION_DB = 'sessions.db'
+SHARD_DIR = 'data.shards'
+STORAGE_MODE = os.environ.get('LMS_STORAGE', 'json')  # 'json', 'journal', 'sqlite' or 'sharded'
+JOURNAL_FSYNC = os.environ.get('LMS_JOURNAL_FSYNC', 'interval')  # 'always', 'interval' or 'never'
+MULTIPROCESS = os.environ.get('LMS_MULTIPROCESS', '0') == '1'  # several worker processes share the data
+FLUSH_INTERVAL = float(os.environ.get('LMS_FLUSH_INTERVAL', '0'))  # seconds to collect saves into one write
+FLUSH_BATCH = int(os.environ.get('LMS_FLUSH_BATCH', '500'))  # dirty employees that trigger an early write
+DURABILITY = os.environ.get('LMS_DURABILITY', 'flush')  # 'flush': reply once written, 'immediate': reply at once
+SHARDS = int(os.environ.get('LMS_SHARDS', '64'))  # buckets of a new sharded store; an existing one keeps its manifest
+LAZY_EMPLOYEES = int(os.environ.get('LMS_LAZY_EMPLOYEES', '0'))  # >0: keep at most this many employees in memory
+FRAGMENT_CACHE = int(os.environ.get('LMS_FRAGMENT_CACHE', '10000'))  # rendered per-employee fragments kept, 0: off
+COVERAGE_LIMIT = float(os.environ.get('LMS_COVERAGE_LIMIT', '0.25'))  # share of a department out before a day is flagged
+STAFFING_FILE = os.environ.get('LMS_STAFFING_LIMITS')  # JSON of department (or "*") -> most employees out on one day
+PROFILE_SLOW_MS = float(os.environ.get('LMS_PROFILE_SLOW_MS', '0'))  # >0: dump sampled stacks of slower requests
+PROFILE_DIR = os.environ.get('LMS_PROFILE_DIR', 'profiles')
+SESSION_STORE = os.environ.get('LMS_SESSION_STORE', 'sqlite' if MULTIPROCESS else 'memory')  # 'memory', 'sqlite' or 'cookie'
+LOGIN_ATTEMPTS = int(os.environ.get('LMS_LOGIN_ATTEMPTS', '5'))  # failed logins per account (x10 per client) in a window
+LOGIN_WINDOW = float(os.environ.get('LMS_LOGIN_WINDOW', '300'))  # seconds
+AUTH_CACHE = int(os.environ.get('LMS_AUTH_CACHE', '10000'))  # accounts whose last good password check is remembered
+LOCK_STRIPES = int(os.environ.get('LMS_LOCK_STRIPES', '1024'))  # employee locks; employees share one by hash of id
+PAGE_SIZE = 50
+MAX_CALENDAR_DAYS = 366
+
+STORE_PATH = {'sqlite': DB_FILE, 'sharded': SHARD_DIR}.get(STORAGE_MODE, DATA_FILE)
+data_lock = FileLock(STORE_PATH + '.lock' if MULTIPROCESS else None)
+versions = VersionFile(STORE_PATH + '.version')
+seen_version = None
+
+if STORAGE_MODE == 'sqlite':
+    backend = make_backend('sqlite', DB_FILE)
+elif STORAGE_MODE == 'journal':
+    backend = make_backend('journal', DATA_FILE, fsync=JOURNAL_FSYNC, lock=data_lock)
+elif STORAGE_MODE == 'sharded':
+    backend = make_backend('sharded', SHARD_DIR, buckets=SHARDS)
+else:
+    backend = make_backend('json', DATA_FILE)
+
+STAFFING_LIMITS = staffing.load_limits(STAFFING_FILE) if STAFFING_FILE else {}
+
+if LAZY_EMPLOYEES and STORAGE_MODE not in ('json', 'sharded'):
+    raise ValueError("LMS_LAZY_EMPLOYEES needs LMS_STORAGE=json or sharded, which can read one employee from disk")
+
+metrics = Metrics()
+metrics.describe('lms_request_seconds', "Request latency by endpoint and method.")
+metrics.describe('lms_requests_total', "Requests by endpoint, method and status code.")
+metrics.describe('lms_section_seconds', "Time spent in storage reads and writes, serialization and template rendering.")
+metrics.describe('lms_logins_total', "Login attempts by kind and result (ok, failed, limited).")
+profiler = SlowRequestProfiler(PROFILE_SLOW_MS / 1e3, PROFILE_DIR) if PROFILE_SLOW_MS > 0 else None
+
+# 'cookie' keeps Flask's signed cookies: nothing stored, nothing to revoke
+session_store = make_session_store(SESSION_STORE, SESSION_DB) if SESSION_STORE != 'cookie' else None
+if session_store is not None:
+    app.session_interface = ServerSessionInterface(session_store)
+credentials = Credentials(AUTH_CACHE)
+account_limits = LoginLimiter(LOGIN_ATTEMPTS, LOGIN_WINDOW)
+client_limits = LoginLimiter(LOGIN_ATTEMPTS * 10, LOGIN_WINDOW)
+ADMIN_PASSWORD_HASH = os.environ.get('LMS_ADMIN_PASSWORD_HASH') or hash_password(os.environ.get('LMS_ADMIN_PASSWORD', 'adminpass'))
+if not (os.environ.get('LMS_ADMIN_PASSWORD_HASH') or os.environ.get('LMS_ADMIN_PASSWORD')):
+    app.logger.warning("*** Neither LMS_ADMIN_PASSWORD_HASH nor LMS_ADMIN_PASSWORD is set: the admin password is the "
+                       "default 'adminpass'. Set one of them before exposing this server. ***")
+UNKNOWN_ACCOUNT_HASH = hash_password(secrets.token_urlsafe(16))  # checked for unknown ids, so they take as long as wrong passwords
+
+# a shared backend can change under another process without a bump, so it renders every time
+fragments = FragmentCache(0 if backend.shared else FRAGMENT_CACHE)
+
+# Lock order: data_lock, then employee locks (by stripe), then staffing_lock, then index_lock.
+# The employee lock table is fixed, so ids that are never saved (unknown logins) add nothing.
+employee_locks = [threading.RLock() for _ in range(LOCK_STRIPES)]
+index_lock = threading.RLock()
+staffing_lock = threading.Lock()  # held from the staffing check of an approval until it is saved
+
+request_index = RequestIndex()
+aggregates = RequestAggregates()
+search_index = EmployeeSearch()
+occupancy = OccupancyIndex()
+
+def on_request_change(emp, index, prev):
+    if backend.shared:
+        return  # the backend answers every query itself, so there are no indexes to keep
+    with index_lock:
+        request_index.on_change(emp, index, prev)
+        aggregates.on_change(emp, index, prev)
+        occupancy.on_change(emp, index, prev)
+
+request_listeners.append(on_request_change)
+
+def stripe(emp_id):
+    return hash(emp_id) % len(employee_locks)
+
+def employee_lock(emp_id):
+    return employee_locks[stripe(emp_id)]
+
+def fetch_employee(emp_id):
+    # lazy mode: rebuild an evicted employee from what was last saved
+    found, ed = committer.pending(emp_id)
+    if not found:
+        with metrics.timer('lms_section_seconds', section='load_one'):
+            ed = backend.load_one(emp_id)
+    return employee_from_dict(ed) if ed is not None else None
+
+employees = LazyEmployees(fetch_employee, LAZY_EMPLOYEES) if LAZY_EMPLOYEES else {}
+
+def load_data():
+    # One streaming pass over the backend builds every index; in lazy mode the
+    # employees are let go again as the LRU fills, so only the indexes stay. A
+    # shared backend is queried directly: nothing is loaded, employees only
+    # caches what get_employee() read.
+    global seen_version
+    if backend.shared:
+        employees.clear()
+        fragments.bump_all()
+        return
+    def stored(records):
+        for eid, ed in records:
+            emp = employees[eid] = employee_from_dict(ed)
+            yield emp
+    with data_lock, index_lock, metrics.timer('lms_section_seconds', section='load_all'):
+        seen_version = versions.read() if MULTIPROCESS else None
+        employees.clear()
+        fragments.bump_all()
+        rebuild_all((request_index, aggregates, search_index, occupancy), stored(backend.iter_all()))
+
+def write_records(records):
+    # records maps emp_id -> employee dict, or None for a deleted employee
+    with metrics.timer('lms_section_seconds', section='flush'):
+        backend.save({eid: ed for eid, ed in records.items() if ed is not None}, list(records))
+
+committer = GroupCommit(write_records, interval=FLUSH_INTERVAL, max_batch=FLUSH_BATCH, ack=DURABILITY)
+
+def save_data(*emp_ids):
+    # Call inside mutation() for the same ids (a missing id means it was deleted).
+    # The records are serialized under the caller's employee locks, then written
+    # together with whatever other threads saved meanwhile in one backend call.
+    global seen_version
+    with metrics.timer('lms_section_seconds', section='save_data'):
+        with metrics.timer('lms_section_seconds', section='serialize'):
+            records = {eid: employees[eid].to_dict() if eid in employees else None for eid in emp_ids or list(employees)}
+        fragments.bump(*records)
+        if MULTIPROCESS:
+            # data_lock already serializes every writer, so there is nothing to batch
+            with data_lock:
+                write_records(records)
+                seen_version = versions.bump()
+            return
+        committer.save(records)
+
+def refresh_if_changed():
+    # Another worker saved since this one last looked: apply its records, or
+    # reload everything when the backend can't say what changed.
+    global seen_version
+    if not MULTIPROCESS or backend.shared or versions.read() == seen_version:
+        return
+    with data_lock:
+        version = versions.read()
+        changes = backend.read_changes()
+        if changes is None:
+            load_data()
+            return
+        for eid, old, new in changes:
+            # the indexes must drop what they hold: the old record, not whatever a
+            # lazy fetch of eid would read from the file the other worker wrote
+            if old is not None:
+                forget_employee(employee_from_dict(old))
+            elif eid in employees:
+                forget_employee(employees[eid])
+            if new is not None:
+                remember_employee(employee_from_dict(new))
+        seen_version = version
+
+@contextmanager
+def mutation(*emp_ids):
+    # Run a read-modify-write on the given employees. Threads only wait for each
+    # other when they touch the same employee; with several worker processes the
+    # cross-process lock is taken first and the data refreshed from disk.
+    with ExitStack() as stack:
+        if MULTIPROCESS:
+            stack.enter_context(data_lock)
+            refresh_if_changed()
+        ids = sorted(set(emp_ids) - {None})
+        for i in sorted({stripe(eid) for eid in ids}):
+            stack.enter_context(employee_locks[i])
+        if LAZY_EMPLOYEES:
+            stack.enter_context(employees.pinned(*ids))  # one live object per employee while it changes
+        yield
+
+def get_employee(emp_id):
+    if backend.shared:
+        if emp_id not in employees and not committer.pending(emp_id)[0]:
+            # never loaded here, so no mutation of it is under way: unknown ids take no lock
+            with metrics.timer('lms_section_seconds', section='load_one'):
+                if backend.load_one(emp_id) is None:
+                    return None
+        # reloads wait for a mutation of the same employee to be saved
+        with employee_lock(emp_id):
+            found, ed = committer.pending(emp_id)  # saved but possibly not written yet
+            if not found:
+                with metrics.timer('lms_section_seconds', section='load_one'):
+                    ed = backend.load_one(emp_id)
+            if ed is None:
+                employees.pop(emp_id, None)
+                return None
+            employees[emp_id] = employee_from_dict(ed)
+    return employees.get(emp_id)
+
+def request_page(status=None, leave_type=None, department=None, start=None, end=None, after=None, limit=PAGE_SIZE):
+    # Returns (rows, next_cursor); the cursor is the request id of the last row
+    # and stays valid while requests are added or change status between pages.
+    after_key = parse_request_id(after) if after else None
+    if backend.shared:
+        rows = list(backend.query_requests(
+            status=status, leave_type=leave_type, department=department,
+            start=start.isoformat() if start else None, end=end.isoformat() if end else None,
+            after=after_key, limit=limit + 1))
+        return rows[:limit], rows[limit - 1]['request_id'] if len(rows) > limit else None
+    with index_lock:
+        return request_index.page(employees, Status[status] if status else None, leave_type, department,
+                                  start.toordinal() if start else None, end.toordinal() if end else None,
+                                  after_key, limit)
+
+def search_employees(q='', department=None, offset=0, limit=PAGE_SIZE):
+    # ranked (rows, total): every word of q must start a word of the id, name or department
+    if backend.shared:
+        return backend.search_employees(q, department, offset, limit)
+    with index_lock:
+        return search_index.search(employees, q, department, offset, limit)
+
+def departments():
+    if backend.shared:
+        return backend.departments()
+    with index_lock:
+        return search_index.departments()
+
+def request_counts():
+    if backend.shared:
+        return backend.request_counts()
+    with index_lock:
+        return aggregates.request_counts()
+
+def request_stats():
+    if backend.shared:
+        return backend.aggregate_counts()
+    with index_lock:
+        return aggregates.snapshot()
+
+def department_out(department, first, last, status=Status.Approved):
+    # {day ordinal: sorted emp_ids} with a `status` request over days [first, last]
+    if backend.shared:
+        return backend.occupancy(department, first, last, status.name)
+    with index_lock:
+        return occupancy.out(department, first, last, status)
+
+def coverage(department, start, end):
+    # (department headcount, one row per day of [start, end]): who is out, who
+    # has asked to be, and whether more than COVERAGE_LIMIT of them or more than
+    # the department's staffing limit are out
+    first, last = start.toordinal(), end.toordinal()
+    if backend.shared:
+        size = backend.department_size(department)
+    else:
+        with index_lock:
+            size = search_index.department_size(department)
+    out, pending = (department_out(department, first, last, s) for s in (Status.Approved, Status.Pending))
+    limit = staffing.limit_for(STAFFING_LIMITS, department)
+    cap = min(COVERAGE_LIMIT * size, limit if limit is not None else size)
+    return size, [{'date': date.fromordinal(day).isoformat(), 'out': out.get(day, []), 'pending': pending.get(day, []),
+                   'flagged': len(out.get(day, ())) > cap} for day in range(first, last + 1)]
+
+def staffing_conflicts(emp, index, extra=None):
+    # [(day, headcount)] over emp's department limit if request `index` were approved
+    return staffing.request_conflicts(STAFFING_LIMITS, department_out, emp, index, extra)
+
+def request_headcounts(rows):
+    # request_id -> most colleagues out on one of its days, the department's
+    # limit and whether that leaves no room for this employee
+    counts = {}
+    for row in rows:
+        out = department_out(row['department'], date_ordinal(row['start_date']), date_ordinal(row['end_date']))
+        peak = max((len(ids) - (row['emp_id'] in ids) for ids in out.values()), default=0)
+        limit = staffing.limit_for(STAFFING_LIMITS, row['department'])
+        counts[row['request_id']] = {'out': peak, 'limit': limit, 'over': limit is not None and peak >= limit}
+    return counts
+
+def approval_guard():
+    # refuses approvals over the staffing limit, counting earlier ones of the same batch
+    return staffing.approval_guard(STAFFING_LIMITS, department_out)
+
+def remember_employee(emp):
+    fragments.bump(emp.emp_id)
+    with index_lock:
+        employees[emp.emp_id] = emp
+        if backend.shared:
+            return
+        request_index.add(emp)
+        aggregates.add(emp)
+        search_index.add(emp)
+        occupancy.add(emp)
+
+def forget_employee(emp):
+    with index_lock:
+        if backend.shared:
+            employees.pop(emp.emp_id, None)  # only a cache of what was read
+        else:
+            request_index.drop(emp)
+            aggregates.drop(emp)
+            search_index.drop(emp)
+            occupancy.drop(emp)
+            del employees[emp.emp_id]
+    fragments.bump(emp.emp_id)
+
+migrate_data.migrate(STORAGE_MODE, STORE_PATH, lock=data_lock)  # no-op once the store is at SCHEMA_VERSION
+load_data()
+atexit.register(backend.close)
+if session_store is not None:
+    atexit.register(session_store.close)
+atexit.register(committer.close)  # runs first: write what is still staged, then close the backend
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+    if profiler:
+        profiler.start()
+
+def finish_timer(status):
+    started = g.pop('started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    endpoint = request.endpoint or 'unmatched'
+    metrics.observe('lms_request_seconds', elapsed, endpoint=endpoint, method=request.method)
+    metrics.inc('lms_requests_total', endpoint=endpoint, method=request.method, code=status)
+    if profiler:
+        profiler.stop(elapsed, endpoint)
+
+@app.after_request
+def record_request(response):
+    # streamed bodies (exports) are timed up to the first byte
+    finish_timer(response.status_code)
+    return response
+
+@app.teardown_request
+def record_failed_request(exc):
+    if exc is not None:
+        finish_timer(500)
+
+def render_started(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+def render_finished(sender, template, context, **extra):
+    started = g.pop('render_started', None)
+    if started is not None:
+        metrics.observe('lms_section_seconds', time.perf_counter() - started, section='render', template=template.name)
+
+before_render_template.connect(render_started, app)
+template_rendered.connect(render_finished, app)
+app.before_request(refresh_if_changed)
+
+def employee_login_required(view):
+    @functools.wraps(view)
+    def wrapped_view(**kwargs):
+        if 'employee_id' not in session:
+            flash("Please log in as employee first.")
+            return redirect(url_for('employee_login'))
+        return view(**kwargs)
+    return wrapped_view
+
+def login_wait(account):
+    # seconds before `account` (or this client) may try to log in again
+    return max(account_limits.retry_after(account), client_limits.retry_after(request.remote_addr))
+
+def check_password(account, stored, password, kind):
+    ok = credentials.verify(account, stored or UNKNOWN_ACCOUNT_HASH, password) and stored is not None
+    if ok:
+        account_limits.succeeded(account)
+    else:
+        account_limits.failed(account)
+        client_limits.failed(request.remote_addr)
+    metrics.inc('lms_logins_total', kind=kind, result='ok' if ok else 'failed')
+    return ok
+
+def authenticate(emp_id, password, kind='employee'):
+    # the employee when the password is right
+    emp = get_employee(emp_id) if isinstance(emp_id, str) else None
+    return emp if check_password(f"employee:{emp_id}", emp.password if emp else None, password, kind) else None
+
+def start_session(**values):
+    # a login gets a new session, and a new id with a server-side store
+    session.clear()
+    if isinstance(session, ServerSession):
+        session.rotate()
+    session.update(values)
+
+def revoke_sessions(emp_id, keep=None):
+    # logs emp_id out everywhere except the session `keep`; None without a session store
+    return session_store.delete_for(emp_id, keep) if session_store is not None else None
+
+def api_login_required(view):
+    @functools.wraps(view)
+    def wrapped_view(**kwargs):
+        if 'employee_id' not in session:
+            return jsonify({'error': "Employee login required."}), 401
+        return view(**kwargs)
+    return wrapped_view
+
+def conditional(data):
+    # JSON with an ETag of its own bytes; a matching If-None-Match gets an empty 304
+    response = jsonify(data)
+    response.add_etag()
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.context_processor
+def inject_current_employee():
+    eid = session.get('employee_id')
+    emp = employees.get(eid)
+    if emp is None and eid is not None and backend.shared:
+        emp = get_employee(eid)  # nothing is preloaded from a shared backend
+    return {'current_employee': emp}
+
+def precompile_templates():
+    # compile every page once at startup; render_template then reuses the cached templates
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+
+precompile_templates()
+
+@app.route('/')
+def index():
+    return render_template('index.html')
+
+@app.route('/employee/login', methods=['GET', 'POST'])
+def employee_login():
+    if request.method == 'POST':
+        emp_id = request.form['emp_id']
+        password = request.form['password']
+        wait = login_wait(f"employee:{emp_id}")
+        if wait:
+            metrics.inc('lms_logins_total', kind='employee', result='limited')
+            flash(f"Too many failed logins. Try again in {int(wait) + 1} seconds.")
+            return redirect(url_for('employee_login'))
+        emp = authenticate(emp_id, password)
+        if emp:
+            start_session(employee_id=emp_id)
+            flash(f"Welcome {emp.name}!")
+            return redirect(url_for('apply_leave'))
+        else:
+            flash("Invalid employee ID or password.")
+            return redirect(url_for('employee_login'))
+    return render_template('employee_login.html')
+
+@app.route('/employee/logout')
+def employee_logout():
+    session.pop('employee_id', None)
+    flash("Logged out successfully.")
+    return redirect(url_for('index'))
+
+@app.route('/employee/change_password', methods=['GET', 'POST'])
+@employee_login_required
+def change_password():
+    if request.method == 'POST':
+        old = request.form['old_password']
+        new = request.form['new_password']
+        confirm = request.form['confirm_password']
+        emp_id = session['employee_id']
+        wait = login_wait(f"employee:{emp_id}")
+        if wait:
+            flash(f"Too many failed attempts. Try again in {int(wait) + 1} seconds.")
+            return render_template('change_password.html')
+        with mutation(emp_id):
+            emp = get_employee(emp_id)
+            if not check_password(f"employee:{emp_id}", emp.password, old, 'password_change'):
+                flash("Old password is incorrect.")
+            elif not new or new != confirm:
+                flash("New passwords do not match or are empty.")
+            else:
+                emp.password = hash_password(new)
+                save_data(emp.emp_id)
+                revoke_sessions(emp_id, keep=getattr(session, 'sid', None))
+                flash("Password changed successfully.")
+                return redirect(url_for('index'))
+    return render_template('change_password.html')
+
+
+@app.route('/apply', methods=['GET', 'POST'])
+@employee_login_required
+def apply_leave():
+    if request.method == 'POST':
+        lt = request.form['leave_type']
+        try:
+            start = datetime.strptime(request.form['start_date'], '%Y-%m-%d')
+            end = datetime.strptime(request.form['end_date'], '%Y-%m-%d')
+        except Exception:
+            flash("Invalid dates.")
+            return redirect(url_for('apply_leave'))
+        if start > end:
+            flash("Start date must be before end date.")
+            return redirect(url_for('apply_leave'))
+        with mutation(session['employee_id']):
+            emp = get_employee(session['employee_id'])
+            with metrics.timer('lms_section_seconds', section='apply_leave'):  # validation and the overlap check
+                ok, msg = emp.apply_leave(lt, start, end)
+            if ok:
+                save_data(emp.emp_id)
+        flash(msg)
+        return redirect(url_for('apply_leave'))
+    emp = get_employee(session['employee_id'])
+    return render_template('apply.html', emp=emp, leave_types=LEAVE_TYPES)
+
+
+@app.route('/balance')
+@employee_login_required
+def view_balance():
+    # ?date=YYYY-MM-DD shows the balances as they stood at the end of that day
+    emp = get_employee(session['employee_id'])
+    day = None
+    if request.args.get('date'):
+        try:
+            day = date.fromisoformat(request.args['date'])
+        except ValueError:
+            flash("Invalid date.")
+    def render():
+        balances = emp.balance_on(day.toordinal()) if day else dict(emp.leave_balances)
+        history = [e.to_dict() for e in emp.ledger.history(day.toordinal() if day else None)]
+        return render_template('_balance.html', emp=emp, leave_types=LEAVE_TYPES, balances=balances, day=day,
+                               history=history)
+    with employee_lock(emp.emp_id):
+        fragment = fragments.get(emp.emp_id, 'balance', render, day)
+    return render_template('balance.html', fragment=fragment)
+
+
+@app.route('/requests')
+@employee_login_required
+def view_requests():
+    emp = get_employee(session['employee_id'])
+    fragment = fragments.get(emp.emp_id, 'requests', lambda: render_template('_requests.html', emp=emp))
+    return render_template('requests.html', fragment=fragment)
+
+
+# Versioned JSON API for the employee self-service flows (mobile client, chat
+# bots): the same session cookie as the pages, compact bodies, errors as
+# {'error': message} with a 4xx status, and ETags on the reads.
+
+@app.route('/api/v1/login', methods=['POST'])
+def api_login():
+    body = request.get_json(silent=True) or {}
+    emp_id, password = body.get('emp_id'), body.get('password')
+    wait = login_wait(f"employee:{emp_id}")
+    if wait:
+        metrics.inc('lms_logins_total', kind='api', result='limited')
+        response = jsonify({'error': "Too many failed logins."})
+        response.headers['Retry-After'] = str(int(wait) + 1)
+        return response, 429
+    emp = authenticate(emp_id, password, 'api')
+    if not emp:
+        return jsonify({'error': "Invalid employee ID or password."}), 401
+    start_session(employee_id=emp_id)
+    return jsonify({'emp_id': emp.emp_id, 'name': emp.name})
+
+
+@app.route('/api/v1/logout', methods=['POST'])
+def api_logout():
+    session.pop('employee_id', None)
+    return jsonify({'ok': True})
+
+
+@app.route('/api/v1/balance')
+@api_login_required
+def api_balance():
+    # ?date=YYYY-MM-DD for the balances at the end of that day
+    emp = get_employee(session['employee_id'])
+    if emp is None:
+        return jsonify({'error': "Employee not found."}), 404
+    try:
+        day = date.fromisoformat(request.args['date']) if request.args.get('date') else None
+    except ValueError:
+        return jsonify({'error': "Invalid date."}), 400
+    with employee_lock(emp.emp_id):
+        balances = emp.balance_on(day.toordinal()) if day else dict(emp.leave_balances)
+    return conditional({'emp_id': emp.emp_id, 'date': day.isoformat() if day else None, 'balances': balances})
+
+
+@app.route('/api/v1/requests')
+@api_login_required
+def api_requests():
+    # ?status=Pending|Approved|Rejected, ?after=<index> and ?limit= page through the employee's requests
+    emp = get_employee(session['employee_id'])
+    if emp is None:
+        return jsonify({'error': "Employee not found."}), 404
+    status = request.args.get('status')
+    if status is not None and status not in Status.__members__:
+        return jsonify({'error': f"Unknown status: {status}."}), 400
+    after = request.args.get('after', -1, type=int)
+    limit = min(max(request.args.get('limit', PAGE_SIZE, type=int), 1), 500)
+    rows, more = [], False
+    with employee_lock(emp.emp_id):
+        for i in range(max(after + 1, 0), len(emp.leave_requests)):
+            r = emp.leave_requests[i]
+            if status is not None and r.status.name != status:
+                continue
+            if len(rows) == limit:
+                more = True
+                break
+            rows.append({'index': i, **r.to_dict()})
+    return conditional({'requests': rows, 'next': rows[-1]['index'] if more else None})
+
+
+@app.route('/api/v1/requests', methods=['POST'])
+@api_login_required
+def api_apply():
+    # JSON body {leave_type, start_date, end_date}; 201 with the new request, or 422 with the reason
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({'error': "Expected a JSON object."}), 400
+    try:
+        start = datetime.strptime(body['start_date'], '%Y-%m-%d')
+        end = datetime.strptime(body['end_date'], '%Y-%m-%d')
+        lt = body['leave_type']
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': "leave_type, start_date and end_date (YYYY-MM-DD) are required."}), 400
+    if start > end:
+        return jsonify({'error': "Start date must be before end date."}), 400
+    with mutation(session['employee_id']):
+        emp = get_employee(session['employee_id'])
+        if emp is None:
+            return jsonify({'error': "Employee not found."}), 404
+        with metrics.timer('lms_section_seconds', section='apply_leave'):
+            ok, msg = emp.apply_leave(lt, start, end)
+        if not ok:
+            return jsonify({'error': msg}), 422
+        index = len(emp.leave_requests) - 1
+        row = {'index': index, **emp.leave_requests[index].to_dict()}
+        save_data(emp.emp_id)
+    return jsonify({'request': row, 'message': msg}), 201
+
+
+@app.route('/admin/login', methods=['GET', 'POST'])
+def admin_login():
+    if request.method == 'POST':
+        wait = login_wait('admin')
+        if wait:
+            metrics.inc('lms_logins_total', kind='admin', result='limited')
+            flash(f"Too many failed logins. Try again in {int(wait) + 1} seconds.")
+            return redirect(url_for('admin_login'))
+        if check_password('admin', ADMIN_PASSWORD_HASH, request.form['password'], 'admin'):
+            start_session(admin=True)
+            flash("Logged in as Admin.")
+            return redirect(url_for('dashboard'))
+        flash("Incorrect password.")
+        return redirect(url_for('admin_login'))
+    return render_template('admin_login.html')
+
+
+@app.route('/admin/logout')
+def admin_logout():
+    session.pop('admin', None)
+    flash("Admin logged out.")
+    return redirect(url_for('index'))
+
+
+@app.route('/admin/requests', methods=['GET', 'POST'])
+def admin_requests():
+    if not session.get('admin'):
+        return redirect(url_for('admin_login'))
+    if request.method == 'POST':
+        act = request.form['action']
+        try:
+            eid, idx = parse_request_id(request.form['request_id'])
+        except ValueError:
+            eid, idx = None, None
+        with mutation(eid), staffing_lock:
+            emp = get_employee(eid) if eid else None
+            if act not in Status.__members__:
+                flash("Invalid action.")
+            elif emp and 0 <= idx < len(emp.leave_requests):
+                refused = approval_guard()(emp, idx) if act == 'Approved' else None
+                if refused:
+                    flash(refused)
+                else:
+                    emp.set_status(idx, Status[act])
+                    save_data(eid)
+                    flash("Request updated.")
+            else:
+                flash("Request not found.")
+        return redirect(url_for('admin_requests', **request.args))
+    args = request.args
+    status = args.get('status', 'Pending')
+    leave_type = args.get('leave_type') or None
+    department = args.get('department') or None
+    try:
+        start = date.fromisoformat(args['from']) if args.get('from') else None
+        end = date.fromisoformat(args['to']) if args.get('to') else None
+    except ValueError:
+        flash("Invalid dates.")
+        start = end = None
+    after = args.get('after') or None
+    try:
+        if after:
+            parse_request_id(after)
+    except ValueError:
+        flash("Invalid page cursor.")
+        after = None
+    limit = min(max(args.get('limit', PAGE_SIZE, type=int), 1), 500)
+    rows, next_cursor = request_page(status if status in Status.__members__ else None, leave_type, department,
+                                     start, end, after, limit)
+    first_url = url_for('admin_requests', **{k: v for k, v in args.items() if k != 'after'}) if after else None
+    next_url = url_for('admin_requests', **{**args, 'after': next_cursor}) if next_cursor else None
+    return render_template('admin_requests.html', rows=rows, headcounts=request_headcounts(rows),
+                           statuses=[*Status.__members__, 'All'], status=status,
+                           leave_types=LEAVE_TYPES, leave_type=leave_type, department=department, start=start, end=end,
+                           first_url=first_url, next_url=next_url,
+                           export_args={**{k: v for k, v in args.items() if k not in ('after', 'limit')}, 'status': status})
+
+
+@app.route('/admin/employees', methods=['GET', 'POST'])
+def admin_employees():
+    if not session.get('admin'):
+        return redirect(url_for('admin_login'))
+    if request.method == 'POST':
+        return redirect(url_for('admin_employees', q=request.form.get('query', '').strip()))
+    q = request.args.get('q', '').strip()
+    department = request.args.get('department') or None
+    page = max(request.args.get('page', 1, type=int), 1)
+    rows, total = search_employees(q, department, (page - 1) * PAGE_SIZE, PAGE_SIZE)
+    rows = [fragments.get(e['emp_id'] if isinstance(e, dict) else e.emp_id, 'admin_row',
+                          lambda e=e: render_template('_employee_row.html', e=e)) for e in rows]
+    args = {k: v for k, v in request.args.items() if k != 'page'}
+    prev_url = url_for('admin_employees', **args, page=page - 1) if page > 1 else None
+    next_url = url_for('admin_employees', **args, page=page + 1) if page * PAGE_SIZE < total else None
+    return render_template('admin_employees.html', rows=rows, q=q, total=total, department=department,
+                           departments=departments(), prev_url=prev_url, next_url=next_url)
+
+
+@app.route('/admin/edit/<emp_id>', methods=['GET', 'POST'])
+def edit_employee(emp_id):
+    if not session.get('admin'):
+        return redirect(url_for('admin_login'))
+    if request.method == 'POST':
+        nm = request.form['name'].strip()
+        ct = request.form['contact'].strip()
+        dept = request.form['department'].strip()
+        pwd = request.form.get('password', '').strip()
+        if not all([nm, ct, dept]):
+            flash("All fields except password are required.")
+        else:
+            with mutation(emp_id):
+                emp = get_employee(emp_id)
+                if emp:
+                    with index_lock:
+                        if backend.shared:
+                            emp.name, emp.contact, emp.department = nm, ct, dept
+                        else:
+                            if dept != emp.department:
+                                aggregates.change_department(emp, dept)
+                                occupancy.change_department(emp, dept)
+                            search_index.drop(emp)
+                            emp.name, emp.contact, emp.department = nm, ct, dept
+                            search_index.add(emp)
+                    if pwd:
+                        emp.password = hash_password(pwd)
+                    save_data(emp_id)
+                    if pwd:
+                        revoke_sessions(emp_id)
+                    flash("Employee updated.")
+                    return redirect(url_for('admin_employees'))
+    emp = get_employee(emp_id)
+    if not emp:
+        flash("Employee not found.")
+        return redirect(url_for('admin_employees'))
+    return render_template('edit_employee.html', emp=emp)
+
+
+@app.route('/admin/delete/<emp_id>', methods=['POST'])
+def delete_employee(emp_id):
+    if not session.get('admin'):
+        return redirect(url_for('admin_login'))
+    with mutation(emp_id):
+        emp = get_employee(emp_id)
+        if emp:
+            forget_employee(emp)
+            save_data(emp_id)
+            revoke_sessions(emp_id)
+            flash("Employee deleted.")
+        else:
+            flash("Employee not found.")
+    return redirect(url_for('admin_employees'))
+
+
+@app.route('/admin/sessions/<emp_id>/revoke', methods=['POST'])
+def revoke_employee_sessions(emp_id):
+    # logs the employee out of every device
+    if not session.get('admin'):
+        return jsonify({'error': "Admin login required."}), 403
+    revoked = revoke_sessions(emp_id)
+    if revoked is None:
+        return jsonify({'error': "Sessions are cookies (LMS_SESSION_STORE=cookie) and can't be revoked."}), 409
+    return jsonify({'emp_id': emp_id, 'revoked': revoked})
+
+
+@app.route('/dashboard')
+def dashboard():
+    if not session.get('admin'):
+        return redirect(url_for('admin_login'))
+    totals = {lt: 0 for lt in LEAVE_TYPES}
+    approved = {lt: 0 for lt in LEAVE_TYPES}
+    for (lt, status), n in request_counts().items():
+        totals[lt] += n
+        if status == 'Approved':
+            approved[lt] += n
+    return render_template('dashboard.html', labels=LEAVE_TYPES, totals=list(totals.values()), approved=list(approved.values()))
+
+
+@app.route('/api/stats')
+def api_stats():
+    # read-only counters for monitoring; ?verify=1 also diffs them against a full recount
+    if not session.get('admin'):
+        return jsonify({'error': "Admin login required."}), 403
+    stats = request_stats()
+    if request.args.get('verify') and not backend.shared:
+        with index_lock:
+            stats['mismatches'] = aggregates.check(list(employees.values()))
+    return jsonify(stats)
+
+
+@app.route('/api/ledger/reconcile')
+def reconcile_ledgers():
+    # checks every employee's ledger against its balances and requests, one employee locked at a time
+    if not session.get('admin'):
+        return jsonify({'error': "Admin login required."}), 403
+    if backend.shared:
+        employees_checked = (employee_from_dict(ed) for _, ed in backend.iter_all())
+    else:
+        def locked():
+            for eid in list(employees):
+                with employee_lock(eid):
+                    emp = employees.get(eid)
+                    if emp is not None:
+                        yield emp  # reconciled before the lock is let go
+        employees_checked = locked()
+    checked, problems = ledger.reconcile_all(employees_checked)
+    return jsonify({'employees': checked, 'total': len(problems), 'problems': problems[:1000]})
+
+
+@app.route('/admin/accrual/<int:year>', methods=['POST'])
+def run_accrual(year):
+    # applies the year's accrual a chunk of employees at a time, each chunk
+    # locked and saved together; repeating it posts only what is missing
+    if not session.get('admin'):
+        return jsonify({'error': "Admin login required."}), 403
+    try:
+        accrual.check_year(year)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    ids = backend.employee_ids() if backend.shared else list(employees)
+    stats = {'year': year, 'employees': len(ids), 'changed': 0, 'entries': 0}
+    for chunk in accrual.chunks(ids):
+        with mutation(*chunk):
+            targets = {eid: get_employee(eid) for eid in chunk}
+            changed, posted = accrual.accrue_chunk(targets, chunk, year)
+            if changed:
+                save_data(*changed)
+        stats['changed'] += len(changed)
+        stats['entries'] += posted
+    return jsonify(stats)
+
+
+@app.route('/admin/bulk/<kind>', methods=['POST'])
+def bulk_update(kind):
+    # JSON body: a list of items, or {"items": [...], "atomic": true}. All the
+    # employees involved are locked together and saved with one save_data();
+    # with atomic, any failed item rolls the whole batch back.
+    if not session.get('admin'):
+        return jsonify({'error': "Admin login required."}), 403
+    if kind not in bulk.OPERATIONS:
+        return jsonify({'error': f"Unknown bulk operation: {kind}."}), 404
+    body = request.get_json(silent=True)
+    items = body.get('items') if isinstance(body, dict) else body
+    if not isinstance(items, list):
+        return jsonify({'error': "Expected a JSON list of items."}), 400
+    atomic = isinstance(body, dict) and bool(body.get('atomic'))
+    ids = bulk.employee_ids(kind, items)
+    opts = {'guard': approval_guard()} if kind == 'decisions' else {}
+    with mutation(*ids), staffing_lock:
+        targets = {eid: emp for eid, emp in ((eid, get_employee(eid)) for eid in ids) if emp is not None}
+        before = {eid: emp.to_dict() for eid, emp in targets.items()}
+
+        def roll_back(eids):
+            for eid in eids:
+                forget_employee(employees[eid])
+                remember_employee(employee_from_dict(before[eid]))
+        try:
+            results, changed = bulk.OPERATIONS[kind](targets, items, **opts)
+        except Exception:
+            roll_back(eid for eid, emp in targets.items() if emp.to_dict() != before[eid])
+            raise
+        committed = not (atomic and not all(r['ok'] for r in results))
+        if not committed:
+            roll_back(changed)
+        elif changed:
+            save_data(*changed)
+    ok = sum(r['ok'] for r in results)
+    return jsonify({'committed': committed, 'succeeded': ok, 'failed': len(results) - ok, 'results': results})
+
+
+@app.route('/admin/export/<fmt>')
+def export_requests(fmt):
+    # streams every matching request; filters as on /admin/requests, status defaults to All
+    if not session.get('admin'):
+        return redirect(url_for('admin_login'))
+    if fmt not in export.FORMATS:
+        return jsonify({'error': f"Unknown export format: {fmt}."}), 404
+    args = request.args
+    status = args.get('status')
+    try:
+        start = date.fromisoformat(args['from']) if args.get('from') else None
+        end = date.fromisoformat(args['to']) if args.get('to') else None
+    except ValueError:
+        return jsonify({'error': "Invalid dates."}), 400
+    filters = (status if status in Status.__members__ else None, args.get('leave_type') or None,
+               args.get('department') or None, start, end)
+    rows = export.paged_rows(lambda after, limit: request_page(*filters, after=after, limit=limit))
+    return Response(export.WRITERS[fmt](rows), mimetype=export.FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename=leave_requests.{fmt}'})
+
+
+@app.route('/admin/staffing/what-if', methods=['POST'])
+def staffing_what_if():
+    # Evaluates pending requests together: {"request_ids": [...]}, or else every
+    # pending request matching the optional "department", "from" and "to". Per
+    # department, suggests the largest set that can be approved at once within
+    # the staffing limit and says where each of the rest would exceed it, given
+    # that set. Changes nothing; "decisions" is a body for /admin/bulk/decisions.
+    if not session.get('admin'):
+        return jsonify({'error': "Admin login required."}), 403
+    body = request.get_json(silent=True)
+    if body is None:
+        body = {}
+    if not isinstance(body, dict):
+        return jsonify({'error': "Expected a JSON object."}), 400
+    try:
+        start = date.fromisoformat(body['from']) if body.get('from') else None
+        end = date.fromisoformat(body['to']) if body.get('to') else None
+    except (TypeError, ValueError):
+        return jsonify({'error': "Invalid dates."}), 400
+    unknown = []
+    if 'request_ids' in body:
+        if not isinstance(body['request_ids'], list):
+            return jsonify({'error': "request_ids must be a list."}), 400
+        rows = []
+        for rid in body['request_ids']:
+            try:
+                eid, idx = parse_request_id(str(rid))
+            except ValueError:
+                eid, idx = None, -1
+            emp = get_employee(eid) if eid else None
+            if emp and 0 <= idx < len(emp.leave_requests) and emp.leave_requests[idx].status == Status.Pending:
+                rows.append(request_row(emp, idx))
+            else:
+                unknown.append(rid)
+    else:
+        rows = export.paged_rows(lambda after, limit: request_page('Pending', None, body.get('department') or None,
+                                                                   start, end, after=after, limit=limit))
+    candidates = {}
+    for row in rows:
+        candidates.setdefault(row['department'], []).append(
+            (row['request_id'], row['emp_id'], date_ordinal(row['start_date']), date_ordinal(row['end_date'])))
+    report, approve_all = [], []
+    for department, batch in sorted(candidates.items()):
+        limit = staffing.limit_for(STAFFING_LIMITS, department)
+        out = department_out(department, min(c[2] for c in batch), max(c[3] for c in batch))
+        out = {day: set(ids) for day, ids in out.items()}
+        approve, rejected = staffing.suggest(batch, out, limit)
+        approve_all += approve
+        report.append({'department': department, 'limit': limit, 'pending': len(batch), 'approve': approve,
+                       'peak_out': max(map(len, out.values()), default=0),
+                       'conflicts': [{'request_id': rid, 'days': [{'date': date.fromordinal(day).isoformat(), 'out': n}
+                                                                  for day, n in over]}
+                                     for rid, over in rejected.items()]})
+    return jsonify({'departments': report, 'not_found': unknown,
+                    'decisions': [{'request_id': rid, 'action': 'Approved'} for rid in approve_all]})
+
+
+@app.route('/api/calendar')
+def api_calendar():
+    # ?department=IT&from=YYYY-MM-DD&to=YYYY-MM-DD, by default the coming week
+    if not session.get('admin'):
+        return jsonify({'error': "Admin login required."}), 403
+    department = request.args.get('department')
+    if not department:
+        return jsonify({'error': "department is required."}), 400
+    try:
+        start = date.fromisoformat(request.args['from']) if request.args.get('from') else date.today()
+        end = date.fromisoformat(request.args['to']) if request.args.get('to') else start + timedelta(days=6)
+    except (ValueError, OverflowError):
+        return jsonify({'error': "Invalid dates."}), 400
+    if not 0 <= (end - start).days < MAX_CALENDAR_DAYS:
+        return jsonify({'error': f"from must not be after to, and at most {MAX_CALENDAR_DAYS} days apart."}), 400
+    size, days = coverage(department, start, end)
+    return jsonify({'department': department, 'employees': size, 'limit': COVERAGE_LIMIT,
+                    'max_out': staffing.limit_for(STAFFING_LIMITS, department), 'days': days})
+
+
+@app.route('/calendar')
+def team_calendar():
+    # ?department=IT&month=YYYY-MM: a month of who is out, too-thin days flagged
+    if not session.get('admin'):
+        return redirect(url_for('admin_login'))
+    depts = departments()
+    department = request.args.get('department') or (depts[0] if depts else '')
+    try:
+        first = datetime.strptime(request.args['month'], '%Y-%m').date() if request.args.get('month') else date.today().replace(day=1)
+    except ValueError:
+        flash("Invalid month.")
+        first = date.today().replace(day=1)
+    last = first.replace(day=calendar.monthrange(first.year, first.month)[1])
+    size, days = coverage(department, first, last)
+    ids = {eid for d in days for eid in d['out'] + d['pending']}
+    names = {eid: emp.name for eid, emp in ((eid, get_employee(eid)) for eid in ids) if emp is not None}
+    weeks = [[None] * first.weekday() + days[:7 - first.weekday()]]
+    for i in range(7 - first.weekday(), len(days), 7):
+        weeks.append(days[i:i + 7])
+    weeks[-1] += [None] * (7 - len(weeks[-1]))
+    # no link past the first or last month date can hold
+    prev_month = (first - timedelta(days=1)).strftime('%Y-%m') if first > date.min else None
+    next_month = (last + timedelta(days=1)).strftime('%Y-%m') if last < date.max else None
+    return render_template('calendar.html', departments=depts, department=department, month=first, size=size,
+                           weeks=weeks, names=names, limit=COVERAGE_LIMIT,
+                           max_out=staffing.limit_for(STAFFING_LIMITS, department), prev_month=prev_month, next_month=next_month)
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    # Prometheus text format: request and section latency histograms, plus the
+    # group commit counters and the lazy employee cache
+    stats = committer.stats()
+    gauges = [(f'lms_commit_{k}_total', stats[k], {}) for k in ('saves', 'flushes', 'records', 'errors')]
+    gauges.append(('lms_commit_pending', stats['pending'], {}))
+    gauges += [('lms_commit_flush_seconds', stats['flush_ms'][q] / 1e3 if stats['flush_ms'][q] is not None else None,
+                {'quantile': quantile}) for q, quantile in (('p50', '0.5'), ('p99', '0.99'), ('max', '1'))]
+    if not backend.shared:
+        gauges.append(('lms_employees', len(employees), {}))
+    if LAZY_EMPLOYEES:
+        cache = employees.stats()
+        gauges += [('lms_employee_cache_resident', cache['resident'], {}),
+                   ('lms_employee_cache_hits_total', cache['hits'], {}),
+                   ('lms_employee_cache_misses_total', cache['misses'], {}),
+                   ('lms_employee_cache_evictions_total', cache['evictions'], {})]
+    cache = fragments.stats()
+    gauges += [('lms_fragment_cache_entries', cache['entries'], {}),
+               ('lms_fragment_cache_hits_total', cache['hits'], {}),
+               ('lms_fragment_cache_misses_total', cache['misses'], {}),
+               ('lms_fragment_cache_evictions_total', cache['evictions'], {}),
+               ('lms_fragment_cache_hit_ratio', cache['hit_rate'], {})]
+    auth = credentials.stats()
+    gauges += [('lms_auth_cache_hits_total', auth['hits'], {}),
+               ('lms_auth_cache_misses_total', auth['misses'], {}),
+               ('lms_login_blocked_total', account_limits.blocked + client_limits.blocked, {})]
+    if session_store is not None:
+        gauges.append(('lms_sessions', session_store.count(), {'store': SESSION_STORE}))
+    if profiler:
+        gauges.append(('lms_slow_request_profiles_total', profiler.dumps, {}))
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/persistence')
+def api_persistence():
+    # save/flush counters, batch sizes and flush latency of the group commit,
+    # plus the employee cache in lazy mode and the fragment cache
+    stats = committer.stats()
+    if LAZY_EMPLOYEES:
+        stats['employees'] = employees.stats()
+    stats['fragments'] = fragments.stats()
+    return jsonify(stats)
+
+
+@app.route('/add', methods=['GET', 'POST'])
+def add_employee():
+    # Only admin can add employees
+    if not session.get('admin'):
+        return redirect(url_for('admin_login'))
+    if request.method == 'POST':
+        eid = request.form['emp_id'].strip()
+        name = request.form['name'].strip()
+        contact = request.form['contact'].strip()
+        dept = request.form['department'].strip()
+        password = request.form['password'].strip() or 'password'  # default password if none entered
+        if not all([eid, name, contact, dept, password]):
+            flash("All fields required.")
+        else:
+            with mutation(eid):
+                if get_employee(eid):
+                    flash("Employee ID exists.")
+                else:
+                    remember_employee(Employee(eid, name, hash_password(password), contact, dept))
+                    save_data(eid)
+                    flash(f"Added {name} with default password.")
+        return redirect(url_for('add_employee'))
+    return render_template('add_employee.html')
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5002, debug=True)
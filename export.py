@@ -0,0 +1,114 @@
+import csv, json
+from datetime import date
+from models import Status, employee_from_dict
+from indexes import request_row
+
+# Leave history as CSV or JSONL, produced by generators: rows are pulled a page
+# at a time and written out in chunks, so memory stays flat however long the
+# history is and the first bytes go out before the last rows are read.
+
+EXPORT_FIELDS = ('request_id', 'emp_id', 'name', 'department', 'leave_type', 'start_date', 'end_date', 'days',
+                 'status', 'deducted')
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+CHUNK_ROWS = 1000
+
+
+def paged_rows(fetch_page, page_size=CHUNK_ROWS):
+    # fetch_page(after, limit) -> (rows, next cursor), as connection.request_page
+    after = None
+    while True:
+        rows, after = fetch_page(after, page_size)
+        yield from rows
+        if after is None:
+            return
+
+
+def employee_rows(employees, status=None, leave_type=None, department=None, start=None, end=None):
+    # the same rows straight from Employee objects, in request id order;
+    # status is a Status name, start/end are dates a request has to overlap
+    start, end = start and start.toordinal(), end and end.toordinal()
+    for eid in sorted(employees):
+        emp = employees[eid]
+        if department is not None and emp.department != department:
+            continue
+        for i, r in enumerate(emp.leave_requests):
+            if status is not None and r.status != Status[status] or leave_type is not None and r.leave_type != leave_type:
+                continue
+            if start is not None and r.end < start or end is not None and r.start > end:
+                continue
+            yield request_row(emp, i)
+
+
+class _Echo:
+    def write(self, s):
+        return s
+
+
+def csv_chunks(rows, chunk_rows=CHUNK_ROWS):
+    writer = csv.writer(_Echo())
+    chunk = [writer.writerow(EXPORT_FIELDS)]
+    for row in rows:
+        chunk.append(writer.writerow([row[f] for f in EXPORT_FIELDS]))
+        if len(chunk) >= chunk_rows:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def jsonl_chunks(rows, chunk_rows=CHUNK_ROWS):
+    chunk = []
+    for row in rows:
+        chunk.append(json.dumps({f: row[f] for f in EXPORT_FIELDS}) + '\n')
+        if len(chunk) >= chunk_rows:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+WRITERS = {'csv': csv_chunks, 'jsonl': jsonl_chunks}
+
+
+def offline_rows(storage, path, status=None, leave_type=None, department=None, start=None, end=None):
+    # sqlite is read with a streaming cursor; the file backends have to be loaded first
+    from storage import make_backend
+    from migrate_data import require_current
+    require_current(storage, path)
+    backend = make_backend(storage, path)
+    try:
+        if backend.shared:
+            yield from backend.query_requests(status=status, leave_type=leave_type, department=department,
+                                              start=start and start.isoformat(), end=end and end.isoformat())
+        else:
+            employees = {eid: employee_from_dict(ed) for eid, ed in backend.load_all().items()}
+            yield from employee_rows(employees, status, leave_type, department, start, end)
+    finally:
+        backend.close()
+
+
+if __name__ == '__main__':
+    import argparse, sys
+    from storage import STORAGE_MODES, default_path
+    parser = argparse.ArgumentParser(description="Export leave requests as CSV or JSONL")
+    parser.add_argument('format', choices=sorted(FORMATS))
+    parser.add_argument('--storage', choices=STORAGE_MODES, default='json')
+    parser.add_argument('--path', help="data file or directory (default data.json, leave.db for sqlite, data.shards for sharded)")
+    parser.add_argument('--status', choices=list(Status.__members__))
+    parser.add_argument('--leave-type')
+    parser.add_argument('--department')
+    parser.add_argument('--from', dest='start', type=date.fromisoformat, help="YYYY-MM-DD")
+    parser.add_argument('--to', dest='end', type=date.fromisoformat, help="YYYY-MM-DD")
+    parser.add_argument('-o', '--output', help="output file (default stdout)")
+    args = parser.parse_args()
+    path = args.path or default_path(args.storage)
+    rows = offline_rows(args.storage, path, args.status, args.leave_type, args.department, args.start, args.end)
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        for chunk in WRITERS[args.format](rows):
+            out.write(chunk)
+    except ValueError as e:
+        sys.exit(str(e))
+    finally:
+        if args.output:
+            out.close()
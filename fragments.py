@@ -0,0 +1,64 @@
+import threading
+from collections import OrderedDict
+
+
+class FragmentCache:
+    # Bounded LRU of rendered per-employee fragments, keyed by (emp_id, name,
+    # args) and tagged with the employee's version when rendered. Every change
+    # to an employee must bump() it afterwards (bump_all() when everything was
+    # reloaded); a tag that no longer matches is a miss. A fragment whose
+    # employee was bumped while it rendered is returned but not kept, so a
+    # render racing a change can't be cached under the new version.
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (emp_id, name, args) -> (version, fragment)
+        self._versions = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _version(self, emp_id):
+        return self._generation, self._versions.get(emp_id, 0)
+
+    def bump(self, *emp_ids):
+        with self._lock:
+            for eid in emp_ids:
+                self._versions[eid] = self._versions.get(eid, 0) + 1
+
+    def bump_all(self):
+        with self._lock:
+            self._generation += 1
+            self._versions.clear()
+            self._entries.clear()
+
+    def get(self, emp_id, name, render, *args):
+        # the cached fragment, or render() stored for next time
+        if not self.capacity:
+            return render()
+        key = (emp_id, name, args)
+        with self._lock:
+            version = self._version(emp_id)
+            found = self._entries.get(key)
+            if found is not None and found[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return found[1]
+            self.misses += 1
+        fragment = render()
+        with self._lock:
+            if self._version(emp_id) == version:
+                self._entries[key] = (version, fragment)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.capacity:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return fragment
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'capacity': self.capacity, 'entries': len(self._entries), 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions,
+                    'hit_rate': round(self.hits / lookups, 4) if lookups else None}
@@ -0,0 +1,415 @@
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from datetime import date
+from heapq import merge, nsmallest
+import re, sys
+from models import Status, ACTIVE_STATUSES
+
+
+def request_id(emp_id, index):
+    return f"{emp_id}:{index}"
+
+
+def parse_request_id(rid):
+    emp_id, _, index = rid.rpartition(':')
+    return emp_id, int(index)
+
+
+def request_row(emp, index):
+    r = emp.leave_requests[index]
+    return {'request_id': request_id(emp.emp_id, index), 'emp_id': emp.emp_id, 'name': emp.name,
+            'department': emp.department, 'index': index, **r.to_dict()}
+
+
+def rebuild_all(indexes, employees):
+    # one pass over employees (which may be a generator) feeding several indexes
+    for ix in indexes:
+        ix.begin()
+    for emp in employees:
+        for ix in indexes:
+            ix.feed(emp)
+    for ix in indexes:
+        ix.finish()
+
+
+def _tail(keys, lo):
+    for i in range(lo, len(keys)):
+        yield keys[i]
+
+
+class RequestIndex:
+    # Per-status lists of (emp_id, index) keys kept in sorted order, so a
+    # status view only touches its own requests and a page resumes with one
+    # bisect past the cursor key no matter what changed in between.
+    def __init__(self):
+        self.begin()
+
+    def begin(self):
+        self._by_status = {s: [] for s in Status}
+
+    def feed(self, emp):
+        for i, r in enumerate(emp.leave_requests):
+            self._by_status[r.status].append((emp.emp_id, i))
+
+    def finish(self):
+        for keys in self._by_status.values():
+            keys.sort()
+
+    def rebuild(self, employees):
+        rebuild_all((self,), employees)
+
+    def _remove(self, status, key):
+        keys = self._by_status[status]
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            del keys[i]
+
+    def on_change(self, emp, index, prev):
+        status = emp.leave_requests[index].status
+        if prev == status:
+            return
+        key = (emp.emp_id, index)
+        if prev is not None:
+            self._remove(prev, key)
+        insort(self._by_status[status], key)
+
+    def add(self, emp):
+        for i, r in enumerate(emp.leave_requests):
+            insort(self._by_status[r.status], (emp.emp_id, i))
+
+    def drop(self, emp):
+        for i, r in enumerate(emp.leave_requests):
+            self._remove(r.status, (emp.emp_id, i))
+
+    def count(self, status):
+        return len(self._by_status[status])
+
+    def page(self, employees, status=None, leave_type=None, department=None, start=None, end=None, after=None, limit=50):
+        # start/end are date ordinals; a request matches if it overlaps [start, end]
+        statuses = [status] if status is not None else list(Status)
+        streams = []
+        for s in statuses:
+            keys = self._by_status[s]
+            lo = bisect_right(keys, after) if after is not None else 0
+            streams.append(_tail(keys, lo))
+        rows, last = [], None
+        for key in merge(*streams):
+            emp = employees.get(key[0])
+            if emp is None:
+                continue
+            r = emp.leave_requests[key[1]]
+            if leave_type is not None and r.leave_type != leave_type:
+                continue
+            if department is not None and emp.department != department:
+                continue
+            if start is not None and r.end < start or end is not None and r.start > end:
+                continue
+            if len(rows) == limit:
+                return rows, last
+            rows.append(request_row(emp, key[1]))
+            last = request_id(*key)
+        return rows, None
+
+
+def _month(ordinal):
+    d = date.fromordinal(ordinal)
+    return f"{d.year:04d}-{d.month:02d}"
+
+
+class RequestAggregates:
+    # Request counters by (leave type, status), (department, status),
+    # (start month, status) and status, plus approved days per leave type.
+    # Every change is applied as a delta, so reads never walk the requests.
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.by_type = Counter()
+        self.by_department = Counter()
+        self.by_month = Counter()
+        self.by_status = Counter()
+        self.approved_days = Counter()
+
+    def _apply(self, department, r, status, sign):
+        self.by_type[r.leave_type, status] += sign
+        self.by_department[department, status] += sign
+        self.by_month[_month(r.start), status] += sign
+        self.by_status[status] += sign
+        if status == Status.Approved:
+            self.approved_days[r.leave_type] += sign * r.days
+
+    def begin(self):
+        self.reset()
+
+    def feed(self, emp):
+        self.add(emp)
+
+    def finish(self):
+        pass
+
+    def rebuild(self, employees):
+        rebuild_all((self,), employees)
+
+    def on_change(self, emp, index, prev):
+        r = emp.leave_requests[index]
+        if prev == r.status:
+            return
+        if prev is not None:
+            self._apply(emp.department, r, prev, -1)
+        self._apply(emp.department, r, r.status, 1)
+
+    def add(self, emp):
+        for r in emp.leave_requests:
+            self._apply(emp.department, r, r.status, 1)
+
+    def drop(self, emp):
+        for r in emp.leave_requests:
+            self._apply(emp.department, r, r.status, -1)
+
+    def change_department(self, emp, department):
+        for r in emp.leave_requests:
+            self.by_department[emp.department, r.status] -= 1
+            self.by_department[department, r.status] += 1
+
+    def request_counts(self):
+        return {(lt, s.name): n for (lt, s), n in self.by_type.items() if n}
+
+    def snapshot(self):
+        def nested(counter):
+            out = {}
+            for (key, s), n in sorted(counter.items()):
+                if n:
+                    out.setdefault(key, {})[s.name] = n
+            return out
+        return {
+            'by_type': nested(self.by_type),
+            'by_department': nested(self.by_department),
+            'by_month': nested(self.by_month),
+            'by_status': {s.name: n for s, n in sorted(self.by_status.items()) if n},
+            'approved_days': {lt: n for lt, n in sorted(self.approved_days.items()) if n},
+        }
+
+    def check(self, employees):
+        # recompute from scratch and list every counter that disagrees
+        fresh = RequestAggregates()
+        fresh.rebuild(employees)
+        return diff_snapshots(fresh.snapshot(), self.snapshot())
+
+
+class OccupancyIndex:
+    # Department -> day ordinal -> {emp_id: requests covering the day}, kept
+    # separately for Approved and Pending requests. A status change touches
+    # only the request's own days and a range query only the days asked for.
+    def __init__(self):
+        self.begin()
+
+    def begin(self):
+        self._days = {s: {} for s in ACTIVE_STATUSES}
+
+    def feed(self, emp):
+        self.add(emp)
+
+    def finish(self):
+        pass
+
+    def rebuild(self, employees):
+        rebuild_all((self,), employees)
+
+    def _apply(self, department, emp_id, r, status, sign):
+        by_day = self._days.get(status)
+        if by_day is None:
+            return
+        by_day = by_day.setdefault(department, {})
+        for day in range(r.start, r.end + 1):
+            out = by_day.get(day)
+            if out is None:
+                out = by_day[day] = {}
+            n = out.get(emp_id, 0) + sign
+            if n:
+                out[emp_id] = n
+            else:
+                del out[emp_id]
+                if not out:
+                    del by_day[day]
+
+    def on_change(self, emp, index, prev):
+        r = emp.leave_requests[index]
+        if prev == r.status:
+            return
+        if prev is not None:
+            self._apply(emp.department, emp.emp_id, r, prev, -1)
+        self._apply(emp.department, emp.emp_id, r, r.status, 1)
+
+    def add(self, emp):
+        for r in emp.leave_requests:
+            self._apply(emp.department, emp.emp_id, r, r.status, 1)
+
+    def drop(self, emp):
+        for r in emp.leave_requests:
+            self._apply(emp.department, emp.emp_id, r, r.status, -1)
+
+    def change_department(self, emp, department):
+        self.drop(emp)
+        for r in emp.leave_requests:
+            self._apply(department, emp.emp_id, r, r.status, 1)
+
+    def out(self, department, start, end, status=Status.Approved):
+        # {day: sorted emp_ids} for the days in [start, end] with anyone out
+        by_day = self._days[status].get(department, {})
+        return {day: sorted(by_day[day]) for day in range(start, end + 1) if day in by_day}
+
+
+def diff_snapshots(expected, actual, path=()):
+    diffs = []
+    for key in sorted(set(expected) | set(actual), key=str):
+        e, a = expected.get(key), actual.get(key)
+        if isinstance(e, dict) or isinstance(a, dict):
+            diffs += diff_snapshots(e or {}, a or {}, path + (key,))
+        elif e != a:
+            diffs.append({'path': '/'.join(map(str, path + (key,))), 'expected': e or 0, 'actual': a or 0})
+    return diffs
+
+
+def _lower(s):
+    # share the string when it is already lowercase
+    low = s.lower()
+    return s if low == s else low
+
+
+WORD = re.compile(r'\w+')
+
+
+def words(text):
+    # how names, departments and query terms are split: runs of letters and digits, lowercased
+    return WORD.findall(text.lower())
+
+
+def search_words(emp):
+    # lowercased words of name and department, interned: most are shared by many employees
+    return {sys.intern(w) for w in words(f"{emp.name} {emp.department}")}
+
+
+class EmployeeSearch:
+    # Words of names and departments map to the employees that use them, with
+    # the distinct words kept sorted so a term's prefix range is two bisects;
+    # lowercased ids are a sorted list of their own. Departments get an exact
+    # department -> ids index. Every query term must start a word or the id.
+    # A query term matches an id it starts, or an employee with a word starting
+    # each of the term's own words ("mary-jane" is "mary" and "jane").
+    # Ranking: exact id, id prefix, every term a whole word, the rest; ties by name.
+    # drop() reads the employee's current name and department, so call it before
+    # changing them and add() afterwards.
+    def __init__(self):
+        self.begin()
+
+    def begin(self):
+        self._postings = {}
+        self._words = []
+        self._id_keys = []
+        self._names = {}
+        self._by_department = {}
+
+    def feed(self, emp):
+        self._index(emp)
+
+    def finish(self):
+        self._words = sorted(self._postings)
+        self._id_keys.sort()
+
+    def rebuild(self, employees):
+        rebuild_all((self,), employees)
+
+    def _index(self, emp, ordered=False):
+        self._names[emp.emp_id] = emp.name.lower()
+        self._by_department.setdefault(emp.department, set()).add(emp.emp_id)
+        for w in search_words(emp):
+            ids = self._postings.get(w)
+            if ids is None:
+                ids = self._postings[w] = set()
+                if ordered:
+                    insort(self._words, w)
+            ids.add(emp.emp_id)
+        key = (_lower(emp.emp_id), emp.emp_id)
+        if ordered:
+            insort(self._id_keys, key)
+        else:
+            self._id_keys.append(key)
+
+    def add(self, emp):
+        if emp.emp_id not in self._names:
+            self._index(emp, ordered=True)
+
+    def drop(self, emp):
+        emp_id = emp.emp_id
+        if self._names.pop(emp_id, None) is None:
+            return
+        for w in search_words(emp):
+            ids = self._postings[w]
+            ids.discard(emp_id)
+            if not ids:
+                del self._postings[w]
+                del self._words[bisect_left(self._words, w)]
+        key = (_lower(emp_id), emp_id)
+        i = bisect_left(self._id_keys, key)
+        if i < len(self._id_keys) and self._id_keys[i] == key:
+            del self._id_keys[i]
+        ids = self._by_department[emp.department]
+        ids.discard(emp_id)
+        if not ids:
+            del self._by_department[emp.department]
+
+    def departments(self):
+        return sorted(self._by_department)
+
+    def department_size(self, department):
+        return len(self._by_department.get(department, ()))
+
+    def _id_prefixed(self, term):
+        lo = bisect_left(self._id_keys, (term,))
+        hi = bisect_left(self._id_keys, (term + '\uffff',))
+        return {eid for _, eid in self._id_keys[lo:hi]}
+
+    def _prefixed(self, word):
+        lo = bisect_left(self._words, word)
+        hi = bisect_left(self._words, word + '\uffff')
+        return set().union(*(self._postings[w] for w in self._words[lo:hi]))
+
+    def _matching(self, term):
+        by_words = None
+        for w in sorted(words(term), key=len, reverse=True):
+            by_words = self._prefixed(w) if by_words is None else by_words & self._prefixed(w)
+            if not by_words:
+                break
+        return self._id_prefixed(term) | (by_words or set())
+
+    def search(self, employees, q='', department=None, offset=0, limit=50):
+        # returns (employees on the page, total matches)
+        terms = q.lower().split()
+        ids = self._by_department.get(department, set()) if department else None
+        if not terms:
+            if ids is None:
+                ordered = [eid for _, eid in self._id_keys[offset:offset + limit]]
+                return [employees[eid] for eid in ordered], len(self._id_keys)
+            return [employees[eid] for eid in sorted(ids)[offset:offset + limit]], len(ids)
+        for term in sorted(terms, key=len, reverse=True):  # longest term first: smallest set
+            found = self._matching(term)
+            ids = found if ids is None else ids & found
+            if not ids:
+                return [], 0
+        whole = ' '.join(terms)
+        i = bisect_left(self._id_keys, (whole,))
+        exact = {self._id_keys[i][1]} & ids if i < len(self._id_keys) and self._id_keys[i][0] == whole else set()
+        by_id = (self._id_prefixed(whole) & ids) - exact
+        whole_words = ids.intersection(*(self._postings.get(w, ()) for t in terms for w in words(t))) - exact - by_id
+        rest = ids - exact - by_id - whole_words
+        page, skip = [], offset
+        for tier in (exact, by_id, whole_words, rest):
+            if len(page) == limit:
+                break
+            if skip >= len(tier):
+                skip -= len(tier)
+                continue
+            top = nsmallest(skip + limit - len(page), tier, key=lambda eid: (self._names[eid], eid))
+            page += top[skip:]
+            skip = 0
+        return [employees[eid] for eid in page], len(ids)
@@ -0,0 +1,97 @@
+import threading
+from collections import Counter, OrderedDict
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+
+
+class LazyEmployees(MutableMapping):
+    # Drop-in for the employees dict when the data is too big to keep resident:
+    # every id is known up front, but an Employee is only built by `fetch` on
+    # first access and at most `capacity` stay cached, least recently used
+    # first out. Pinned employees (being mutated) are never evicted, so there
+    # is only ever one live object per employee while it can change.
+    def __init__(self, fetch, capacity):
+        self._fetch = fetch
+        self.capacity = capacity
+        self._ids = set()
+        self._resident = OrderedDict()
+        self._pinned = Counter()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _evict(self):
+        skipped = 0
+        while len(self._resident) > self.capacity and skipped < len(self._resident):
+            eid = next(iter(self._resident))
+            if self._pinned[eid]:
+                self._resident.move_to_end(eid)  # still in use: keep it and look at the next one
+                skipped += 1
+            else:
+                del self._resident[eid]
+                self.evictions += 1
+
+    def __getitem__(self, emp_id):
+        with self._lock:
+            emp = self._resident.get(emp_id)
+            if emp is not None:
+                self._resident.move_to_end(emp_id)
+                self.hits += 1
+                return emp
+            if emp_id not in self._ids:
+                raise KeyError(emp_id)
+            emp = self._fetch(emp_id)
+            if emp is None:
+                self._ids.discard(emp_id)
+                raise KeyError(emp_id)
+            self.misses += 1
+            self._resident[emp_id] = emp
+            self._evict()
+            return emp
+
+    def __setitem__(self, emp_id, emp):
+        with self._lock:
+            self._ids.add(emp_id)
+            self._resident[emp_id] = emp
+            self._resident.move_to_end(emp_id)
+            self._evict()
+
+    def __delitem__(self, emp_id):
+        with self._lock:
+            self._ids.remove(emp_id)
+            self._resident.pop(emp_id, None)
+
+    def __contains__(self, emp_id):
+        return emp_id in self._ids
+
+    def __iter__(self):
+        return iter(list(self._ids))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+            self._resident.clear()
+
+    @contextmanager
+    def pinned(self, *emp_ids):
+        with self._lock:
+            self._pinned.update(emp_ids)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pinned.subtract(emp_ids)
+                for eid in emp_ids:
+                    if self._pinned[eid] <= 0:
+                        del self._pinned[eid]
+                self._evict()
+
+    def stats(self):
+        with self._lock:
+            return {'employees': len(self._ids), 'resident': len(self._resident), 'capacity': self.capacity,
+                    'pinned': len(self._pinned), 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions}
@@ -0,0 +1,79 @@
+from models import Status
+
+# Reconciliation: the ledger must add up to the balances, every approved
+# request must be deducted exactly once and nothing else may be. Problems are
+# dicts {'emp_id', 'problem', 'leave_type' or 'request', 'expected', 'actual'}.
+
+
+def problem(emp, kind, expected, actual, **where):
+    return {'emp_id': emp.emp_id, 'problem': kind, **where, 'expected': expected, 'actual': actual}
+
+
+def reconcile(emp):
+    problems = []
+    totals = emp.ledger.totals()
+    for lt in sorted({**emp.leave_balances, **totals}):
+        if emp.leave_balances.get(lt, 0) != totals.get(lt, 0):
+            problems.append(problem(emp, 'balance', totals.get(lt, 0), emp.leave_balances.get(lt, 0), leave_type=lt))
+    settled = {}
+    last = None
+    for e in emp.ledger.entries:
+        if last is not None and e.day < last:
+            problems.append(problem(emp, 'order', last, e.day, leave_type=e.leave_type))
+        last = e.day
+        if e.kind in ('deduction', 'refund'):
+            if e.request is None or not 0 <= e.request < len(emp.leave_requests):
+                problems.append(problem(emp, 'unknown request', None, e.request, leave_type=e.leave_type))
+            else:
+                settled[e.request] = settled.get(e.request, 0) + e.amount
+    for i, r in enumerate(emp.leave_requests):
+        if r.deducted != (r.status == Status.Approved):
+            problems.append(problem(emp, 'deducted flag', r.status == Status.Approved, r.deducted, request=i))
+        expected = -r.days if r.status == Status.Approved else 0
+        if settled.get(i, 0) != expected:
+            problems.append(problem(emp, 'settlement', expected, settled.get(i, 0), request=i))
+    return problems
+
+
+def reconcile_all(employees):
+    # employees: any iterable of Employee; returns (employees checked, problems)
+    checked, problems = 0, []
+    for emp in employees:
+        checked += 1
+        problems += reconcile(emp)
+    return checked, problems
+
+
+if __name__ == '__main__':
+    import argparse, json, sys
+    from datetime import date
+    from models import employee_from_dict
+    from storage import make_backend, default_path, STORAGE_MODES
+    from migrate_data import require_current
+    parser = argparse.ArgumentParser(description="Check leave ledgers against balances and request status")
+    parser.add_argument('--storage', choices=STORAGE_MODES, default='json')
+    parser.add_argument('--path', help="data file or directory (default data.json, leave.db for sqlite, data.shards for sharded)")
+    parser.add_argument('--balance-on', metavar='EMP_ID', help="print one employee's balances on --date instead")
+    parser.add_argument('--date', type=date.fromisoformat, default=date.today(), help="YYYY-MM-DD (default today)")
+    args = parser.parse_args()
+    path = args.path or default_path(args.storage)
+    try:
+        require_current(args.storage, path)
+    except ValueError as e:
+        sys.exit(str(e))
+    backend = make_backend(args.storage, path)
+    try:
+        if args.balance_on:
+            ed = backend.load_one(args.balance_on)
+            if ed is None:
+                sys.exit(f"No employee {args.balance_on}.")
+            print(json.dumps(employee_from_dict(ed).balance_on(args.date.toordinal()), indent=4))
+            sys.exit(0)
+        checked, problems = reconcile_all(employee_from_dict(ed) for _, ed in backend.iter_all())
+    finally:
+        backend.close()
+    for p in problems:
+        print(json.dumps(p))
+    print(f"{checked} employees checked, {len(problems)} problems.", file=sys.stderr)
+    if problems:
+        sys.exit(1)
@@ -0,0 +1,157 @@
+import os, sys, threading, time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+
+# In-process latency histograms and counters, exposed in the Prometheus text
+# format. Series are keyed by (metric name, sorted label pairs); buckets are
+# cumulative only when rendered, so observe() is one bisect and two adds.
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(pairs, extra=()):
+    pairs = tuple(pairs) + tuple(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _number(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Metrics:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help = {}
+        self._histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self._counters = Counter()
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        i = bisect_left(self.buckets, seconds)
+        with self._lock:
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            h[i] += 1
+            h[-1] += seconds
+
+    def inc(self, name, n=1, **labels):
+        with self._lock:
+            self._counters[name, tuple(sorted(labels.items()))] += n
+
+    @contextmanager
+    def timer(self, name, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def render(self, gauges=()):
+        # gauges: (name, value, labels dict) read at scrape time, e.g. from GroupCommit.stats()
+        with self._lock:
+            histograms = {k: list(h) for k, h in self._histograms.items()}
+            counters = dict(self._counters)
+        lines, typed = [], set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+        for (name, labels), h in sorted(histograms.items()):
+            header(name, 'histogram')
+            total = 0
+            for le, n in zip(self.buckets + ('+Inf',), h[:-1]):
+                total += n
+                lines.append(f"{name}_bucket{_labels(labels, (('le', le),))} {total}")
+            lines.append(f"{name}_sum{_labels(labels)} {h[-1]!r}")
+            lines.append(f"{name}_count{_labels(labels)} {total}")
+        for (name, labels), n in sorted(counters.items()):
+            header(name, 'counter')
+            lines.append(f"{name}{_labels(labels)} {n}")
+        for name, value, labels in gauges:
+            if value is None:
+                continue
+            header(name, 'counter' if name.endswith('_total') else 'gauge')
+            lines.append(f"{name}{_labels(sorted(labels.items()))} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def fold(frame):
+    # one stack in the folded format of flamegraph.pl and speedscope, root first
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SlowRequestProfiler:
+    # Samples the stacks of the threads inside a request every `interval`
+    # seconds; when a request took longer than `threshold` its samples are
+    # written to out_dir as <time>-<endpoint>.folded, one "stack count" line per
+    # distinct stack. The sampler thread only runs while requests are active.
+    def __init__(self, threshold, out_dir, interval=0.005, keep=200):
+        self.threshold = threshold
+        self.out_dir = out_dir
+        self.interval = interval
+        self.keep = keep
+        self.dumps = 0
+        self._active = {}  # thread ident -> Counter of folded stacks
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        with self._cond:
+            self._active[threading.get_ident()] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='slow-request-profiler', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def stop(self, elapsed, label):
+        # returns the path written, or None for a fast request
+        with self._cond:
+            samples = self._active.pop(threading.get_ident(), None)
+        if not samples or elapsed < self.threshold:
+            return None
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{int(elapsed * 1e3)}ms-{label}.folded")
+        with open(path, 'w') as f:
+            f.writelines(f"{stack} {n}\n" for stack, n in samples.most_common())
+        self.dumps += 1
+        self._prune()
+        return path
+
+    def _prune(self):
+        names = sorted(n for n in os.listdir(self.out_dir) if n.endswith('.folded'))
+        for name in names[:-self.keep]:
+            try:
+                os.remove(os.path.join(self.out_dir, name))
+            except OSError:
+                pass
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            with self._cond:
+                while not self._active:
+                    self._cond.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._cond:
+                for ident, samples in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None and ident != me:
+                        samples[fold(frame)] += 1
@@ -1,351 +1,337 @@
-from flask import Flask, render_template_string, request, redirect, url_for, flash, session
-from datetime import datetime
-import json
-import os
-
-app = Flask(__name__)
-app.secret_key = 'secret-key'
-
-LEAVE_TYPES = ["Vacation", "Sick", "Maternity"]
-DEFAULT_BALANCES = {"Vacation": 15, "Sick": 10, "Maternity": 90}
-DATA_FILE = 'data.json'
-
-class Employee:
-    def __init__(self, emp_id, name, contact='', department='', leave_balances=None, leave_requests=None):
-        self.emp_id = emp_id
-        self.name = name
-        self.contact = contact
-        self.department = department
-        self.leave_balances = leave_balances or {lt: DEFAULT_BALANCES[lt] for lt in LEAVE_TYPES}
-        self.leave_requests = leave_requests or []
-
-    def apply_leave(self, leave_type, start_date, end_date):
-        days = (end_date - start_date).days + 1
-        if leave_type not in LEAVE_TYPES:
-            return False, f"Invalid leave type: {leave_type}."
-        if days > self.leave_balances.get(leave_type, 0):
-            return False, f"Insufficient {leave_type} leave balance."
-        for req in self.leave_requests:
-            if req['status'] in ('Pending', 'Approved'):
-                es = datetime.strptime(req['start_date'], '%Y-%m-%d')
-                ee = datetime.strptime(req['end_date'], '%Y-%m-%d')
-                if start_date <= ee and end_date >= es:
-                    return False, "Dates overlap with an existing request."
-        self.leave_requests.append({
-            "leave_type": leave_type,
-            "start_date": start_date.strftime('%Y-%m-%d'),
-            "end_date": end_date.strftime('%Y-%m-%d'),
-            "days": days,
-            "status": "Pending",
-            "deducted": False
-        })
-        return True, f"{leave_type} leave for {days} day(s) submitted."
-
-    def to_dict(self):
-        return {
-            'emp_id': self.emp_id,
-            'name': self.name,
-            'contact': self.contact,
-            'department': self.department,
-            'leave_balances': self.leave_balances,
-            'leave_requests': self.leave_requests
-        }
-
-employees = {}
-
-def load_data():
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, 'r') as f:
-            data = json.load(f)
-            for eid, ed in data.items():
-                employees[eid] = Employee(
-                    emp_id=ed['emp_id'],
-                    name=ed['name'],
-                    contact=ed.get('contact', ''),
-                    department=ed.get('department', ''),
-                    leave_balances=ed['leave_balances'],
-                    leave_requests=ed['leave_requests']
-                )
-
-def save_data():
-    with open(DATA_FILE, 'w') as f:
-        json.dump({eid: emp.to_dict() for eid, emp in employees.items()}, f, indent=4)
-
-load_data()
-
-base_template = """
-<!DOCTYPE html>
-<html><head><title>Leave Management System</title><style>
-body{font-family:Arial;margin:0;padding:0;
-{% if request.endpoint=='index' %}
-background:url('{{ url_for('static', filename='img/successful-employees.png') }}')center/cover fixed;
-{% else %}
-background:#f4f4f4;
-{% endif %}
-min-height:100vh}
-.container{padding:20px;max-width:800px;margin:50px auto;background:rgba(255,255,255,.95);border-radius:10px}
-h2,h3{color:#333}ul.nav{list-style:none;padding:0;margin-bottom:20px;text-align:center}
-ul.nav li{display:inline;margin:0 10px}ul.nav a{color:#007BFF;text-decoration:none;font-weight:bold}
-ul.nav a:hover{text-decoration:underline}.flash{background:#ffdddd;padding:10px;border:1px solid #d00;color:#900;margin-bottom:20px}
-table{width:100%;border-collapse:collapse;margin-top:20px;background:white}
-th,td{border:1px solid #ddd;padding:10px;text-align:left}th{background:#f0f0f0}
-input,select,button{width:100%;padding:8px;margin:5px 0;box-sizing:border-box}
-button{background:#007BFF;color:#fff;border:none;cursor:pointer}
-button:hover{background:#0056b3}.action-form{display:inline}
-</style></head><body><div class="container">
-<h2>Leave Management System</h2><ul class="nav">
-<li><a href="{{ url_for('index') }}">Home</a></li>
-<li><a href="{{ url_for('apply_leave') }}">Apply Leave</a></li>
-<li><a href="{{ url_for('view_balance') }}">Check Balance</a></li>
-<li><a href="{{ url_for('view_requests') }}">My Requests</a></li>
-{% if session.get('admin') %}
-<li><a href="{{ url_for('admin_requests') }}">Admin Panel</a></li>
-<li><a href="{{ url_for('admin_employees') }}">Employees List</a></li>
-<li><a href="{{ url_for('admin_logout') }}">Logout</a></li>
-{% else %}
-<li><a href="{{ url_for('admin_login') }}">Admin Login</a></li>
-{% endif %}
-</ul>{% with messages = get_flashed_messages() %}
-{% if messages %}<div class="flash">{{ messages[0] }}</div>{% endif %}{% endwith %}
-{{ content|safe }}
-</div></body></html>
-"""
-
-@app.route('/')
-def index():
-    return render_template_string(base_template, content="<p>Welcome to the Leave Management System.</p>")
-
-@app.route('/add', methods=['GET', 'POST'])
-def add_employee():
-    if request.method == 'POST':
-        emp_id = request.form['emp_id'].strip()
-        name = request.form['name'].strip()
-        contact = request.form['contact'].strip()
-        department = request.form['department'].strip()
-        if not emp_id or not name or not contact or not department:
-            flash("All fields required.")
-        elif emp_id in employees:
-            flash("Employee already exists.")
-        else:
-            employees[emp_id] = Employee(emp_id, name, contact, department)
-            save_data()
-            flash(f"Employee {name} added.")
-        return redirect(url_for('add_employee'))
-    return render_template_string(base_template, content="""
-      <h3>Add Employee</h3>
-      <form method="post">
-        Employee ID: <input name="emp_id" required>
-        Name: <input name="name" required>
-        Contact: <input name="contact" required>
-        Department: <input name="department" required>
-        <button type="submit">Add</button>
-      </form>
-    """)
-
-@app.route('/apply', methods=['GET', 'POST'])
-def apply_leave():
-    if request.method == 'POST':
-        emp_id = request.form['emp_id']
-        lt = request.form['leave_type']
-        try:
-            start = datetime.strptime(request.form['start_date'],'%Y-%m-%d')
-            end = datetime.strptime(request.form['end_date'],'%Y-%m-%d')
-        except ValueError:
-            flash("Invalid date format.")
-            return redirect(url_for('apply_leave'))
-        if emp_id not in employees:
-            flash("Employee not found.")
-        elif start > end:
-            flash("Start date must be before end date.")
-        else:
-            success, msg = employees[emp_id].apply_leave(lt, start, end)
-            if success:
-                save_data()
-            flash(msg)
-        return redirect(url_for('apply_leave'))
-
-    opts = ''.join(f'<option>{lt}</option>' for lt in LEAVE_TYPES)
-    return render_template_string(base_template, content=f"""
-      <h3>Apply Leave</h3>
-      <form method="post">
-        Employee ID: <input name="emp_id" required>
-        Leave Type: <select name="leave_type">{opts}</select>
-        Start Date: <input type="date" name="start_date" required>
-        End Date: <input type="date" name="end_date" required>
-        <button type="submit">Apply</button>
-      </form>
-    """)
-
-@app.route('/balance', methods=['GET', 'POST'])
-def view_balance():
-    if request.method=='POST':
-        emp_id = request.form['emp_id']
-        if emp_id not in employees:
-            flash("Employee not found.")
-            return redirect(url_for('view_balance'))
-        emp = employees[emp_id]
-        balances = ''.join(f"<li>{lt}: {emp.leave_balances[lt]} days</li>" for lt in LEAVE_TYPES)
-        return render_template_string(base_template, content=f"<h3>{emp.name}'s Balances</h3><ul>{balances}</ul>")
-    return render_template_string(base_template, content="""
-      <h3>Check Balance</h3>
-      <form method="post">
-        Employee ID: <input name="emp_id" required>
-        <button type="submit">Check</button>
-      </form>
-    """)
-
-@app.route('/requests', methods=['GET', 'POST'])
-def view_requests():
-    if request.method=='POST':
-        emp_id = request.form['emp_id']
-        if emp_id not in employees:
-            flash("Employee not found.")
-            return redirect(url_for('view_requests'))
-        emp = employees[emp_id]
-        if not emp.leave_requests:
-            content = f"<h3>{emp.name} has no leave requests.</h3>"
-        else:
-            items = "".join(f"<li>{r['leave_type']}: {r['start_date']} to {r['end_date']} - <b>{r['status']}</b></li>" for r in emp.leave_requests)
-            content = f"<h3>{emp.name}'s Leave Requests</h3><ul>{items}</ul>"
-        return render_template_string(base_template, content=content)
-    return render_template_string(base_template, content="""
-      <h3>View My Leave Requests</h3>
-      <form method="post">
-        Employee ID: <input name="emp_id" required>
-        <button type="submit">View</button>
-      </form>
-    """)
-
-@app.route('/admin/login', methods=['GET','POST'])
-def admin_login():
-    if request.method=='POST':
-        if request.form['password']=='adminpass':
-            session['admin']=True
-            return redirect(url_for('admin_requests'))
-        flash("Incorrect password.")
-        return redirect(url_for('admin_login'))
-    return render_template_string(base_template, content="""
-      <h3>Admin Login</h3>
-      <form method="post">
-        Password: <input type="password" name="password" required>
-        <button type="submit">Login</button>
-      </form>
-    """)
-
-@app.route('/admin/logout')
-def admin_logout():
-    session.pop('admin', None)
-    return redirect(url_for('index'))
-
-@app.route('/admin/requests', methods=['GET','POST'])
-def admin_requests():
-    if not session.get('admin'):
-        return redirect(url_for('admin_login'))
-    if request.method=='POST':
-        emp_id = request.form['emp_id']
-        idx = int(request.form['index'])
-        act = request.form['action']
-        if emp_id in employees and 0 <= idx < len(employees[emp_id].leave_requests):
-            req = employees[emp_id].leave_requests[idx]
-            prev = req['status']
-            req['status'] = act
-            if act=='Approved' and not req['deducted']:
-                employees[emp_id].leave_balances[req['leave_type']] -= req['days']
-                req['deducted']=True
-            elif prev=='Approved' and act!='Approved' and req['deducted']:
-                employees[emp_id].leave_balances[req['leave_type']]+=req['days']
-                req['deducted']=False
-            save_data()
-            flash(f"Request {idx+1} updated to {act}.")
-        return redirect(url_for('admin_requests'))
-
-    rows = ""
-    for emp in employees.values():
-        for i,r in enumerate(emp.leave_requests):
-            rows += (
-                f"<tr><td>{emp.emp_id}</td><td>{emp.name}</td><td>{r['leave_type']}</td>"
-                f"<td>{r['start_date']}</td><td>{r['end_date']}</td><td>{r['days']}</td>"
-                f"<td>{r['status']}</td><td>"
-                f"<form method='post' class='action-form'>"
-                f"<input type='hidden' name='emp_id' value='{emp.emp_id}'>"
-                f"<input type='hidden' name='index' value='{i}'>"
-                f"<button name='action' value='Approved'>Approve</button>"
-                f"<button name='action' value='Rejected'>Reject</button>"
-                f"</form></td></tr>"
-            )
-    table = f"""
-      <h3>Admin: Manage Requests</h3>
-      <a href="{url_for('add_employee')}"><button>Add Employee</button></a>
-      <table><tr>
-        <th>Emp ID</th><th>Name</th><th>Type</th><th>Start</th>
-        <th>End</th><th>Days</th><th>Status</th><th>Actions</th>
-      </tr>{rows}</table>
-    """
-    return render_template_string(base_template, content=table)
-
-@app.route('/admin/employees', methods=['GET','POST'])
-def admin_employees():
-    if not session.get('admin'):
-        return redirect(url_for('admin_login'))
-    q = request.form.get('query','').strip().lower() if request.method=='POST' else ''
-    filt = [e for e in employees.values() if q in e.emp_id.lower() or q in e.name.lower() or q in e.department.lower()] if q else employees.values()
-    rows = "".join(
-        f"<tr><td>{e.emp_id}</td><td>{e.name}</td><td>{e.contact}</td>"
-        f"<td>{e.department}</td>"
-        f"<td><a href=\"{url_for('edit_employee',emp_id=e.emp_id)}\"><button>Edit</button></a>"
-        f"<form method=\"post\" action=\"{url_for('delete_employee',emp_id=e.emp_id)}\" "
-        f"class=\"action-form\" onsubmit=\"return confirm('Delete {e.name}?');\">"
-        f"<button type=\"submit\">Delete</button></form></td></tr>"
-    for e in filt)
-    tbl = f"""
-      <h3>Admin: Employees List</h3>
-      <form method='post'><input name='query' placeholder='Search by ID, Name, Dept' value='{q}'><button type='submit'>Search</button></form><br>
-      <table><tr>
-        <th>Employee ID</th><th>Name</th><th>Contact</th><th>Department</th><th>Actions</th>
-      </tr>{rows}</table>
-    """
-    return render_template_string(base_template, content=tbl)
-
-@app.route('/admin/edit/<emp_id>', methods=['GET','POST'])
-def edit_employee(emp_id):
-    if not session.get('admin'): return redirect(url_for('admin_login'))
-    emp = employees.get(emp_id)
-    if not emp:
-        flash("Employee not found.")
-        return redirect(url_for('admin_employees'))
-    if request.method=='POST':
-        nm = request.form['name'].strip()
-        ct = request.form['contact'].strip()
-        dept = request.form['department'].strip()
-        if not nm or not ct or not dept:
-            flash("All fields required.")
-        else:
-            emp.name, emp.contact, emp.department = nm, ct, dept
-            save_data()
-            flash("Employee details updated.")
-            return redirect(url_for('admin_employees'))
-    form = f"""
-      <h3>Edit Employee: {emp.emp_id}</h3>
-      <form method="post">
-        Name: <input name="name" value="{emp.name}" required>
-        Contact: <input name="contact" value="{emp.contact}" required>
-        Department: <input name="department" value="{emp.department}" required>
-        <button type="submit">Update</button>
-      </form><br>
-      <a href="{url_for('admin_employees')}"><button>Back</button></a>
-    """
-    return render_template_string(base_template, content=form)
-
-@app.route('/admin/delete/<emp_id>', methods=['POST'])
-def delete_employee(emp_id):
-    if not session.get('admin'): return redirect(url_for('admin_login'))
-    if emp_id in employees:
-        del employees[emp_id]
-        save_data()
-        flash(f"Employee {emp_id} deleted.")
-    else:
-        flash("Employee not found.")
-    return redirect(url_for('admin_employees'))
-
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5001, debug=True)
+import json, os, threading, time
+from datetime import date
+from collections import deque
+from multiprocessing import Pool
+from models import LEAVE_TYPES, DEFAULT_BALANCES, SCHEMA_VERSION, employee_from_dict, date_ordinal
+from auth import hash_password, is_hashed
+from storage import iter_json_object, read_json, atomic_write_json, default_path, shard_path, Journal, FileLock, SqliteBackend
+
+# Data files carry the schema version of their records: a `<path>.schema` file
+# next to data.json (json and journal stores), "schema" in the manifest of a
+# sharded store, or PRAGMA user_version in SQLite. A migration streams every record once through the steps from
+# that version up to SCHEMA_VERSION and writes a new file, so employee_from_dict()
+# can read records as they are. Version 1 is the layout of the original app
+# (three leave types, no password); a file without a version is taken as 1.
+# Steps must accept records that already look upgraded: unversioned files are
+# often current, and an interrupted sharded migration is simply run again.
+# SQLite is migrated in place: one pass checks every record, a second rewrites
+# them in a single transaction.
+
+MIGRATIONS = {}  # version -> step upgrading one record dict from version - 1
+MAX_ERRORS = 20
+
+
+def migration(version):
+    def register(fn):
+        MIGRATIONS[version] = fn
+        return fn
+    return register
+
+
+@migration(2)
+def add_passwords(ed):
+    # the original app had no password, contact or department defaults and only
+    # Vacation/Sick/Maternity balances; its records get the defaults of the current
+    # app, including the default balance of every leave type they lack
+    balances = ed.get('leave_balances') or {}
+    return {
+        'emp_id': ed['emp_id'],
+        'name': ed['name'],
+        'password': ed.get('password', 'password'),
+        'contact': ed.get('contact', ''),
+        'department': ed.get('department', ''),
+        'leave_balances': {**{lt: DEFAULT_BALANCES[lt] for lt in LEAVE_TYPES}, **balances},
+        'leave_requests': [{**r, 'deducted': r.get('deducted', False)} for r in ed.get('leave_requests') or []],
+    }
+
+
+@migration(3)
+def add_ledger(ed):
+    # Balances get a ledger. The history before it is unknown, so each balance
+    # opens at its current value plus what approved requests took from it, and
+    # those requests are posted as deductions on their start date (or today,
+    # for leave that hasn't started), which keeps the ledger in day order.
+    if 'ledger' in ed:
+        return ed
+    today = date.today().toordinal()
+    taken, deductions = {}, []
+    for i, r in enumerate(ed['leave_requests']):
+        if r['deducted']:
+            taken[r['leave_type']] = taken.get(r['leave_type'], 0) + r['days']
+            deductions.append((min(date_ordinal(r['start_date']), today), i, r))
+    deductions.sort(key=lambda d: d[:2])
+    opened = date.fromordinal(min([d for d, _, _ in deductions] + [today])).isoformat()
+    ledger = [{'date': opened, 'leave_type': lt, 'amount': n, 'kind': 'opening', 'request': None}
+              for lt, n in ((lt, ed['leave_balances'].get(lt, 0) + taken.get(lt, 0))
+                            for lt in {**ed['leave_balances'], **taken}) if n]
+    ledger += [{'date': date.fromordinal(d).isoformat(), 'leave_type': r['leave_type'], 'amount': -r['days'],
+                'kind': 'deduction', 'request': i} for d, i, r in deductions]
+    return {**ed, 'ledger': ledger}
+
+
+@migration(4)
+def hash_passwords(ed):
+    # plaintext passwords become werkzeug hashes (see auth.py); with a big store,
+    # run `python migrate_data.py --jobs N` so the KDF runs in parallel
+    if is_hashed(ed['password']):
+        return ed
+    return {**ed, 'password': hash_password(ed['password'])}
+
+
+@migration(5)
+def add_missing_balances(ed):
+    # Stores migrated before add_passwords filled in every leave type lack the
+    # newer ones. They get the default balance, opened where the ledger opens,
+    # so the ledger stays in day order and accrual counts it as granted at hire.
+    missing = [lt for lt in LEAVE_TYPES if lt not in ed['leave_balances']]
+    if not missing:
+        return ed
+    opened = ed['ledger'][0]['date'] if ed['ledger'] else date.today().isoformat()
+    return {**ed, 'leave_balances': {**ed['leave_balances'], **{lt: DEFAULT_BALANCES[lt] for lt in missing}},
+            'ledger': [{'date': opened, 'leave_type': lt, 'amount': DEFAULT_BALANCES[lt], 'kind': 'opening',
+                        'request': None} for lt in missing if DEFAULT_BALANCES[lt]] + ed['ledger']}
+
+
+def upgrade(ed, version):
+    for v in range(version + 1, SCHEMA_VERSION + 1):
+        ed = MIGRATIONS[v](ed)
+    return ed
+
+
+def schema_path(mode, path):
+    return os.path.join(path, 'manifest.json') if mode == 'sharded' else path + '.schema'
+
+
+def read_schema(mode, path):
+    # schema version of the store at `path`; a store that doesn't exist yet is current
+    if mode == 'sqlite':
+        if not os.path.exists(path):
+            return SCHEMA_VERSION
+        backend = SqliteBackend(path)
+        try:
+            return backend.schema_version()
+        finally:
+            backend.close()
+    if mode == 'sharded':
+        manifest = read_json(schema_path(mode, path))
+        return manifest.get('schema', 1) if manifest else SCHEMA_VERSION
+    if not any(os.path.exists(p) for p in (path, path + '.log', path + '.log.old')):
+        return SCHEMA_VERSION
+    try:
+        with open(schema_path(mode, path), 'r') as f:
+            return int(f.read())
+    except FileNotFoundError:
+        return 1
+
+
+def write_schema(mode, path, version=SCHEMA_VERSION):
+    if mode == 'sqlite':
+        backend = SqliteBackend(path)
+        backend.set_schema_version(version)
+        backend.close()
+        return
+    if mode == 'sharded':
+        manifest = read_json(schema_path(mode, path))
+        manifest['schema'] = version
+        atomic_write_json(schema_path(mode, path), manifest, indent=4)
+        return
+    tmp = f"{schema_path(mode, path)}.tmp.{os.getpid()}"
+    with open(tmp, 'w') as f:
+        f.write(str(version))
+    os.replace(tmp, schema_path(mode, path))
+
+
+def require_current(mode, path):
+    version = read_schema(mode, path)
+    if version != SCHEMA_VERSION:
+        raise ValueError(f"{path} has schema version {version}, this code reads {SCHEMA_VERSION}: "
+                         f"run python migrate_data.py --storage {mode} --path {path}.")
+
+
+def _upgrade_chunk(args):
+    # -> [(changed, error or None, record text or None, request count)] for (emp_id, dict) pairs;
+    # runs in pool workers in parallel mode, so it only takes and returns plain data
+    chunk, version, render = args
+    out = []
+    for eid, ed in chunk:
+        new = upgrade(ed, version)
+        try:
+            employee_from_dict(new)
+            error = None if new['emp_id'] == eid else f"{eid}: emp_id is {new['emp_id']!r}"
+        except (KeyError, TypeError, ValueError) as e:
+            error = f"{eid}: {type(e).__name__}: {e}"
+        text = json.dumps(eid) + ': ' + json.dumps(new, indent=4).replace('\n', '\n    ') if render else None
+        out.append((new != ed, error, text, len(new.get('leave_requests') or ())))
+    return out
+
+
+def _chunks(records, size):
+    chunk = []
+    for rec in records:
+        chunk.append(rec)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _ordered(pool, work, ahead):
+    # results of pool jobs in submission order, with at most `ahead` chunks in flight
+    pending = deque()
+    for args in work:
+        pending.append(pool.apply_async(_upgrade_chunk, (args,)))
+        if len(pending) > ahead:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def migrate_records(records, version, out_path=None, jobs=1, chunk_size=1000):
+    # Upgrade (emp_id, dict) pairs and, unless out_path is None (a dry run),
+    # write them in data.json layout to out_path. With jobs > 1 chunks are
+    # upgraded and serialized by a process pool and written back in order.
+    stats = {'employees': 0, 'requests': 0, 'changed': 0, 'invalid': 0, 'errors': []}
+    render = out_path is not None
+    work = ((chunk, version, render) for chunk in _chunks(records, chunk_size))
+    pool = Pool(jobs) if jobs > 1 else None
+    out = open(out_path, 'w') if render else None
+    try:
+        results = _ordered(pool, work, 2 * jobs) if pool else map(_upgrade_chunk, work)
+        if out:
+            out.write('{')
+        for chunk in results:
+            for changed, error, text, requests in chunk:
+                if out:
+                    out.write((',\n    ' if stats['employees'] else '\n    ') + text)
+                stats['employees'] += 1
+                stats['requests'] += requests
+                stats['changed'] += changed
+                if error:
+                    stats['invalid'] += 1
+                    if len(stats['errors']) < MAX_ERRORS:
+                        stats['errors'].append(error)
+        if out:
+            out.write('\n}' if stats['employees'] else '}')
+            out.flush()
+            os.fsync(out.fileno())
+    finally:
+        if out:
+            out.close()
+        if pool:
+            pool.terminate()
+    return stats
+
+
+def _migrate_file(path, records, version, jobs, chunk_size, dry_run):
+    # upgrade one data.json-layout file into a tmp file next to it: (stats, tmp path or None)
+    tmp = None if dry_run else f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    return migrate_records(records, version, tmp, jobs, chunk_size), tmp
+
+
+def _file_records(path):
+    return ((eid, ed) for eid, ed, _, _ in iter_json_object(path)) if os.path.exists(path) else ()
+
+
+def _migrate_shard(args):
+    path, version, dry_run = args
+    return _migrate_file(path, _file_records(path), version, 1, 1000, dry_run)
+
+
+def _commit(done, ok):
+    # replace every file only once all of them upgraded cleanly
+    for path, (stats, tmp) in done:
+        if tmp and ok:
+            os.replace(tmp, path)
+        elif tmp:
+            os.remove(tmp)
+
+
+def _migrate_sqlite(backend, version, chunk_size, dry_run):
+    ids = backend.employee_ids()
+    def records():
+        for eid in ids:
+            ed = backend.load_one(eid)
+            if version < 3:
+                del ed['ledger']  # the table is empty before schema 3
+            yield eid, ed
+    stats = migrate_records(records(), version, None, 1, chunk_size)
+    if not dry_run and not stats['invalid']:
+        backend.write_dicts((eid, upgrade(ed, version)) for eid, ed in records())
+    return stats
+
+
+def migrate(mode='json', path=None, jobs=1, chunk_size=1000, dry_run=False, lock=None):
+    # Bring the store up to SCHEMA_VERSION; returns the stats with 'from' and 'to'.
+    # Run it while no server writes to the store, or under its lock (the caller's
+    # data_lock, or `path`.lock here). A sharded store is migrated a shard per job.
+    path = path or default_path(mode)
+    with lock or FileLock(path + '.lock'):
+        version = read_schema(mode, path)
+        t0 = time.perf_counter()
+        if version == SCHEMA_VERSION:
+            stats = {'employees': 0, 'requests': 0, 'changed': 0, 'invalid': 0, 'errors': []}
+        elif mode == 'sqlite':
+            backend = SqliteBackend(path)
+            try:
+                stats = _migrate_sqlite(backend, version, chunk_size, dry_run)
+            finally:
+                backend.close()
+        elif mode == 'sharded':
+            buckets = read_json(schema_path(mode, path))['buckets']
+            paths = [shard_path(path, i, buckets) for i in range(buckets)]
+            work = [(p, version, dry_run) for p in paths]
+            if jobs > 1:
+                with Pool(jobs) as pool:
+                    parts = pool.map(_migrate_shard, work)
+            else:
+                parts = list(map(_migrate_shard, work))
+            stats = {k: sum(p[k] for p, _ in parts) for k in ('employees', 'requests', 'changed', 'invalid')}
+            stats['errors'] = [e for p, _ in parts for e in p['errors']][:MAX_ERRORS]
+            _commit(zip(paths, parts), not stats['invalid'])
+        elif mode == 'journal':
+            # fold the logs in: the new snapshot holds everything and the logs go
+            journal = Journal(path)
+            stats, tmp = _migrate_file(path, journal.iter_replay(), version, jobs, chunk_size, dry_run)
+            _commit([(path, (stats, tmp))], not stats['invalid'])
+            if tmp and not stats['invalid']:
+                for log in (journal.old_path, journal.log_path):
+                    if os.path.exists(log):
+                        os.remove(log)
+        else:
+            stats, tmp = _migrate_file(path, _file_records(path), version, jobs, chunk_size, dry_run)
+            _commit([(path, (stats, tmp))], not stats['invalid'])
+        if stats['invalid'] and not dry_run:
+            raise ValueError(f"{stats['invalid']} invalid records in {path}, nothing migrated: "
+                             + '; '.join(stats['errors']))
+        if not dry_run and version != SCHEMA_VERSION:
+            write_schema(mode, path)
+        stats.update({'from': version, 'to': SCHEMA_VERSION, 'seconds': time.perf_counter() - t0})
+    return stats
+
+
+if __name__ == '__main__':
+    import argparse, sys
+    from storage import STORAGE_MODES
+    parser = argparse.ArgumentParser(description="Upgrade a Leave Management data store to the current schema")
+    parser.add_argument('--storage', choices=STORAGE_MODES, default='json')
+    parser.add_argument('--path', help="data file or directory (default data.json, leave.db for sqlite, data.shards for sharded)")
+    parser.add_argument('--dry-run', action='store_true', help="check and count what would change, write nothing")
+    parser.add_argument('--jobs', type=int, default=1, help="worker processes (chunks of one file, or shards)")
+    parser.add_argument('--chunk', type=int, default=1000, help="employees per chunk with --jobs")
+    args = parser.parse_args()
+    try:
+        stats = migrate(args.storage, args.path, args.jobs, args.chunk, args.dry_run)
+    except ValueError as e:
+        sys.exit(str(e))
+    if stats['from'] == stats['to']:
+        print(f"Already at schema version {stats['to']}.")
+        sys.exit(0)
+    rate = stats['requests'] / stats['seconds'] if stats['seconds'] else 0
+    print(f"{'Dry run: ' if args.dry_run else ''}schema {stats['from']} -> {stats['to']}: {stats['employees']} employees "
+          f"({stats['requests']} requests), {stats['changed']} changed, {stats['invalid']} invalid, "
+          f"in {stats['seconds']:.1f}s ({rate:.0f} requests/s).")
+    for error in stats['errors']:
+        print(f"  {error}")
+    if stats['invalid']:
+        sys.exit(1)
@@ -0,0 +1,259 @@
+from datetime import datetime, date
+from bisect import bisect_left, bisect_right, insort
+from enum import IntEnum
+from operator import itemgetter
+import sys
+
+LEAVE_TYPES = ["Vacation", "Sick", "Maternity", "specific"]
+DEFAULT_BALANCES = {"Vacation": 15, "Sick": 10, "Maternity": 90, "specific": 45}
+SCHEMA_VERSION = 5  # layout of employee records; migrate_data.py upgrades older data files
+
+class Status(IntEnum):
+    Pending = 0
+    Approved = 1
+    Rejected = 2
+
+ACTIVE_STATUSES = (Status.Pending, Status.Approved)
+LEDGER_KINDS = ('opening', 'accrual', 'expiry', 'deduction', 'refund', 'adjustment')
+CHECKPOINT_EVERY = 64  # ledger entries between two point-in-time checkpoints
+
+# Called as listener(emp, index, prev_status) after a request is added
+# (prev_status None) or its status is set; used to keep derived indexes current.
+request_listeners = []
+
+def notify_request_change(emp, index, prev):
+    for listener in request_listeners:
+        listener(emp, index, prev)
+
+def date_ordinal(s):
+    return date.fromisoformat(s).toordinal()
+
+class LeaveRequest:
+    # Dates are kept as proleptic ordinals and the status as a Status member;
+    # to_dict()/from_dict() keep the data.json layout of ISO date strings.
+    __slots__ = ('leave_type', 'start', 'end', 'days', 'status', 'deducted')
+
+    def __init__(self, leave_type, start, end, days, status=Status.Pending, deducted=False):
+        self.leave_type = sys.intern(leave_type)
+        self.start = start
+        self.end = end
+        self.days = days
+        self.status = status
+        self.deducted = deducted
+
+    @property
+    def start_date(self):
+        return date.fromordinal(self.start).isoformat()
+
+    @property
+    def end_date(self):
+        return date.fromordinal(self.end).isoformat()
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['leave_type'], date_ordinal(d['start_date']), date_ordinal(d['end_date']),
+                   d['days'], Status[d['status']], d['deducted'])
+
+    def to_dict(self):
+        return {
+            "leave_type": self.leave_type,
+            "start_date": self.start_date,
+            "end_date": self.end_date,
+            "days": self.days,
+            "status": self.status.name,
+            "deducted": self.deducted
+        }
+
+class LedgerEntry:
+    # One change to a leave balance, effective on `day` (an ordinal). Deductions
+    # and refunds name the index of the leave request they settle in `request`.
+    __slots__ = ('day', 'leave_type', 'amount', 'kind', 'request')
+
+    def __init__(self, day, leave_type, amount, kind, request=None):
+        if kind not in LEDGER_KINDS:
+            raise ValueError(f"Unknown ledger entry kind: {kind}.")
+        self.day = day
+        self.leave_type = sys.intern(leave_type)
+        self.amount = amount
+        self.kind = sys.intern(kind)
+        self.request = request
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(date_ordinal(d['date']), d['leave_type'], d['amount'], d['kind'], d['request'])
+
+    def to_dict(self):
+        return {
+            "date": date.fromordinal(self.day).isoformat(),
+            "leave_type": self.leave_type,
+            "amount": self.amount,
+            "kind": self.kind,
+            "request": self.request
+        }
+
+
+_entry_day = lambda e: e.day
+_checkpoint_count = itemgetter(0)
+
+
+class Ledger:
+    # Balance changes in day order, only ever added to. Totals after every
+    # CHECKPOINT_EVERY entries are kept as checkpoints, built on the first
+    # point-in-time query and extended as entries arrive, so balance_on() is
+    # two bisects and a replay of at most CHECKPOINT_EVERY entries.
+    __slots__ = ('entries', '_checkpoints')
+
+    def __init__(self, entries=()):
+        self.entries = [e if isinstance(e, LedgerEntry) else LedgerEntry.from_dict(e) for e in entries]
+        self._checkpoints = None  # [(entries covered, {leave_type: total})]
+
+    def append(self, entry):
+        # after any entries of the same day; an earlier day drops the checkpoints past it
+        i = bisect_right(self.entries, entry.day, key=_entry_day)
+        self.entries.insert(i, entry)
+        if self._checkpoints is not None:
+            if i < len(self.entries) - 1:
+                del self._checkpoints[bisect_right(self._checkpoints, i, key=_checkpoint_count):]
+            self._extend_checkpoints()
+
+    def _extend_checkpoints(self):
+        count, totals = self._checkpoints[-1] if self._checkpoints else (0, {})
+        totals = dict(totals)
+        while count + CHECKPOINT_EVERY <= len(self.entries):
+            for e in self.entries[count:count + CHECKPOINT_EVERY]:
+                totals[e.leave_type] = totals.get(e.leave_type, 0) + e.amount
+            count += CHECKPOINT_EVERY
+            self._checkpoints.append((count, dict(totals)))
+
+    def totals(self, day=None):
+        # {leave_type: sum of amounts} over the entries effective on or before day (default all)
+        if self._checkpoints is None:
+            self._checkpoints = []
+            self._extend_checkpoints()
+        k = len(self.entries) if day is None else bisect_right(self.entries, day, key=_entry_day)
+        c = bisect_right(self._checkpoints, k, key=_checkpoint_count)
+        count, totals = self._checkpoints[c - 1] if c else (0, {})
+        totals = dict(totals)
+        for e in self.entries[count:k]:
+            totals[e.leave_type] = totals.get(e.leave_type, 0) + e.amount
+        return totals
+
+    def between(self, first, last):
+        # entries effective from day `first` through day `last`
+        return self.entries[bisect_left(self.entries, first, key=_entry_day):bisect_right(self.entries, last, key=_entry_day)]
+
+    def history(self, day=None, limit=20):
+        # the latest entries effective on or before day, newest first
+        k = len(self.entries) if day is None else bisect_right(self.entries, day, key=_entry_day)
+        return self.entries[max(k - limit, 0):k][::-1]
+
+    def to_list(self):
+        return [e.to_dict() for e in self.entries]
+
+
+class Employee:
+    # leave_balances is the running total of the ledger, kept in step by post(),
+    # so reading a balance never touches the ledger.
+    __slots__ = ('emp_id', 'name', 'password', 'contact', 'department', 'leave_balances', 'leave_requests',
+                 'ledger', '_spans', '_max_span')
+
+    def __init__(self, emp_id, name, password='password', contact='', department='', leave_balances=None,
+                 leave_requests=None, ledger=None):
+        self.emp_id = emp_id
+        self.name = name
+        self.password = password
+        self.contact = contact
+        self.department = department
+        self.leave_balances = dict(leave_balances or {lt: DEFAULT_BALANCES[lt] for lt in LEAVE_TYPES})
+        self.leave_requests = [r if isinstance(r, LeaveRequest) else LeaveRequest.from_dict(r)
+                               for r in leave_requests or []]
+        if ledger is None:
+            # a new employee: the starting balances are its opening entries
+            today = date.today().toordinal()
+            ledger = [LedgerEntry(today, lt, n, 'opening') for lt, n in self.leave_balances.items() if n]
+        self.ledger = ledger if isinstance(ledger, Ledger) else Ledger(ledger)
+        self._reindex()
+
+    # Pending/Approved requests as sorted (start, end, index) ordinals. No active
+    # interval is longer than _max_span, so an overlap with [start, end] must
+    # begin within [start - _max_span, end]: two bisects and a short scan.
+    def _reindex(self):
+        self._spans = sorted((r.start, r.end, i) for i, r in enumerate(self.leave_requests)
+                             if r.status in ACTIVE_STATUSES)
+        self._max_span = max((e - s for s, e, _ in self._spans), default=0)
+
+    def _index_add(self, index):
+        r = self.leave_requests[index]
+        insort(self._spans, (r.start, r.end, index))
+        self._max_span = max(self._max_span, r.end - r.start)
+
+    def _index_remove(self, index):
+        r = self.leave_requests[index]
+        span = (r.start, r.end, index)
+        i = bisect_left(self._spans, span)
+        if i < len(self._spans) and self._spans[i] == span:
+            del self._spans[i]
+
+    def overlaps(self, start, end):
+        lo = bisect_left(self._spans, (start - self._max_span,))
+        hi = bisect_right(self._spans, (end, float('inf')))
+        return any(e >= start for _, e, _ in self._spans[lo:hi])
+
+    def apply_leave(self, leave_type, start_date, end_date):
+        days = (end_date - start_date).days + 1
+        if start_date.date() < datetime.now().date():
+            return False, "Start date cannot be in the past."
+        if leave_type not in LEAVE_TYPES:
+            return False, f"Invalid leave type: {leave_type}."
+        if days > self.leave_balances.get(leave_type, 0):
+            return False, f"Insufficient {leave_type} leave balance."
+        if self.overlaps(start_date.toordinal(), end_date.toordinal()):
+            return False, "Dates overlap with an existing request."
+        self.leave_requests.append(LeaveRequest(leave_type, start_date.toordinal(), end_date.toordinal(), days))
+        self._index_add(len(self.leave_requests) - 1)
+        notify_request_change(self, len(self.leave_requests) - 1, None)
+        return True, f"{leave_type} leave for {days} day(s) submitted."
+
+    def post(self, leave_type, amount, kind, request=None, day=None):
+        self.ledger.append(LedgerEntry(day or date.today().toordinal(), leave_type, amount, kind, request))
+        self.leave_balances[leave_type] = self.leave_balances.get(leave_type, 0) + amount
+
+    def balance_on(self, day):
+        # balances as they stood at the end of `day` (an ordinal)
+        totals = self.ledger.totals(day)
+        return {lt: totals.get(lt, 0) for lt in {**self.leave_balances, **totals}}
+
+    def set_status(self, index, status):
+        req = self.leave_requests[index]
+        prev = req.status
+        req.status = status
+        if status == Status.Approved and not req.deducted:
+            self.post(req.leave_type, -req.days, 'deduction', index)
+            req.deducted = True
+        elif prev == Status.Approved and req.deducted and status != Status.Approved:
+            self.post(req.leave_type, req.days, 'refund', index)
+            req.deducted = False
+        if prev in ACTIVE_STATUSES and status not in ACTIVE_STATUSES:
+            self._index_remove(index)
+        elif status in ACTIVE_STATUSES and prev not in ACTIVE_STATUSES:
+            self._index_add(index)
+        notify_request_change(self, index, prev)
+
+    def to_dict(self):
+        return {
+            'emp_id': self.emp_id,
+            'name': self.name,
+            'password': self.password,
+            'contact': self.contact,
+            'department': self.department,
+            'leave_balances': dict(self.leave_balances),
+            'leave_requests': [r.to_dict() for r in self.leave_requests],
+            'ledger': self.ledger.to_list()
+        }
+
+
+def employee_from_dict(ed):
+    return Employee(
+        ed['emp_id'], ed['name'], ed['password'], ed['contact'], ed['department'],
+        ed['leave_balances'], ed['leave_requests'], ed['ledger']
+    )
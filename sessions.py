@@ -0,0 +1,196 @@
+import secrets, sqlite3, threading, time
+from datetime import datetime, timezone
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SecureCookieSession
+
+# Server-side sessions: the cookie carries only a random session id and the
+# data lives in a store, so a session can be revoked by deleting one row.
+# Stores keep (serialized data, expiry timestamp, emp_id) per id; the emp_id
+# lets every session of an employee be revoked at once.
+
+PURGE_EVERY = 1000  # sessions written between two sweeps of expired ones
+
+
+class MemorySessionStore:
+    # one process only: sessions are lost on restart and not seen by other workers
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}  # sid -> (data, expires, emp_id)
+        self._by_employee = {}  # emp_id -> set of sids
+        self._writes = 0
+
+    def get(self, sid):
+        with self._lock:
+            found = self._sessions.get(sid)
+            if found is None:
+                return None
+            if found[1] <= time.time():
+                self._delete(sid)
+                return None
+            return found[0]
+
+    def set(self, sid, data, expires, emp_id=None):
+        with self._lock:
+            old = self._sessions.get(sid)
+            if old is not None and old[2] != emp_id:
+                self._unlink(sid, old[2])
+            self._sessions[sid] = (data, expires, emp_id)
+            if emp_id is not None:
+                self._by_employee.setdefault(emp_id, set()).add(sid)
+            self._writes += 1
+            if self._writes % PURGE_EVERY == 0:
+                now = time.time()
+                for s in [s for s, (_, exp, _) in self._sessions.items() if exp <= now]:
+                    self._delete(s)
+
+    def _unlink(self, sid, emp_id):
+        sids = self._by_employee.get(emp_id)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self._by_employee[emp_id]
+
+    def _delete(self, sid):
+        found = self._sessions.pop(sid, None)
+        if found is not None and found[2] is not None:
+            self._unlink(sid, found[2])
+
+    def delete(self, sid):
+        with self._lock:
+            self._delete(sid)
+
+    def delete_for(self, emp_id, keep=None):
+        # every session of emp_id except `keep`; returns how many were revoked
+        with self._lock:
+            sids = [s for s in self._by_employee.get(emp_id, ()) if s != keep]
+            for s in sids:
+                self._delete(s)
+            return len(sids)
+
+    def count(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def close(self):
+        pass
+
+
+SESSION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    sid TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    expires REAL NOT NULL,
+    emp_id TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_sessions_emp_id ON sessions (emp_id);
+"""
+
+
+class SqliteSessionStore:
+    # a local file shared by every worker process; survives restarts
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        with self._conn() as conn:
+            conn.executescript(SESSION_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, sid):
+        row = self._conn().execute('SELECT data, expires FROM sessions WHERE sid = ?', (sid,)).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return row[0]
+
+    def set(self, sid, data, expires, emp_id=None):
+        with self._conn() as conn:
+            conn.execute('INSERT OR REPLACE INTO sessions (sid, data, expires, emp_id) VALUES (?, ?, ?, ?)',
+                         (sid, data, expires, emp_id))
+            self._writes += 1
+            if self._writes % PURGE_EVERY == 0:
+                conn.execute('DELETE FROM sessions WHERE expires <= ?', (time.time(),))
+
+    def delete(self, sid):
+        with self._conn() as conn:
+            conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def delete_for(self, emp_id, keep=None):
+        with self._conn() as conn:
+            return conn.execute('DELETE FROM sessions WHERE emp_id = ? AND sid IS NOT ?', (emp_id, keep)).rowcount
+
+    def count(self):
+        return self._conn().execute('SELECT COUNT(*) FROM sessions WHERE expires > ?', (time.time(),)).fetchone()[0]
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class ServerSession(SecureCookieSession):
+    def __init__(self, initial=None, sid=None):
+        super().__init__(initial)
+        self.sid = sid
+        self.replaced = None
+
+    def rotate(self):
+        # a fresh id, e.g. on login, so an id known before it is worthless afterwards
+        self.replaced, self.sid = self.replaced or self.sid, None
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        data = self.store.get(sid) if sid else None
+        if data is None:
+            return ServerSession()
+        return ServerSession(self.serializer.loads(data), sid)
+
+    def save_session(self, app, session, response):
+        name, domain, path = self.get_cookie_name(app), self.get_cookie_domain(app), self.get_cookie_path(app)
+        if session.replaced is not None:
+            self.store.delete(session.replaced)
+            session.replaced = None
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not session:
+            if session.sid is not None and session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=self.get_cookie_secure(app),
+                                       httponly=self.get_cookie_httponly(app), samesite=self.get_cookie_samesite(app))
+            return
+        if session.sid is not None and not session.modified:
+            return
+        new = session.sid is None
+        if new:
+            session.sid = secrets.token_urlsafe(32)
+        cookie_expires = self.get_expiration_time(app, session)  # None: a browser-session cookie
+        expires = (cookie_expires or datetime.now(timezone.utc) + app.permanent_session_lifetime).timestamp()
+        self.store.set(session.sid, self.serializer.dumps(dict(session)), expires, session.get('employee_id'))
+        if new:
+            response.set_cookie(name, session.sid, expires=cookie_expires, domain=domain, path=path,
+                                secure=self.get_cookie_secure(app), httponly=self.get_cookie_httponly(app),
+                                samesite=self.get_cookie_samesite(app))
+
+
+def make_session_store(kind, path='sessions.db'):
+    if kind == 'memory':
+        return MemorySessionStore()
+    if kind == 'sqlite':
+        return SqliteSessionStore(path)
+    raise ValueError(f"Unknown session store: {kind}.")
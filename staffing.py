@@ -0,0 +1,102 @@
+import json
+from datetime import date
+from models import Status
+
+# Per-department caps on how many employees may be on approved leave on the
+# same day. Limits are a JSON object of department -> headcount, with "*" as
+# the default for departments not listed; a department with neither is not
+# limited. Headcounts come as {day ordinal: emp_ids out}, e.g. from
+# indexes.OccupancyIndex.out().
+
+DEFAULT_KEY = '*'
+
+
+def load_limits(path):
+    with open(path) as f:
+        limits = json.load(f)
+    if not isinstance(limits, dict):
+        raise ValueError("Staffing limits are a JSON object of department -> maximum out.")
+    for department, limit in limits.items():
+        if isinstance(limit, bool) or not isinstance(limit, int) or limit < 0:
+            raise ValueError(f"Invalid staffing limit for {department}: {limit!r}.")
+    return limits
+
+
+def limit_for(limits, department):
+    return limits.get(department, limits.get(DEFAULT_KEY))
+
+
+def conflicts(out, emp_id, first, last, limit):
+    # [(day, headcount)] for the days of [first, last] that emp_id joining `out`
+    # would put over `limit`; an employee already out on a day adds nobody
+    if limit is None:
+        return []
+    over = []
+    for day in range(first, last + 1):
+        ids = out.get(day, ())
+        if emp_id not in ids and len(ids) >= limit:
+            over.append((day, len(ids) + 1))
+    return over
+
+
+def request_conflicts(limits, department_out, emp, index, extra=None):
+    # conflicts() of approving emp's request `index`. department_out(department,
+    # first, last) gives who is out; `extra` is {department: {day: emp_ids}}
+    # approved but not visible there yet.
+    limit = limit_for(limits, emp.department)
+    if limit is None:
+        return []
+    r = emp.leave_requests[index]
+    out = {day: set(ids) for day, ids in department_out(emp.department, r.start, r.end).items()}
+    for day, ids in (extra or {}).get(emp.department, {}).items():
+        if r.start <= day <= r.end:
+            out.setdefault(day, set()).update(ids)
+    return conflicts(out, emp.emp_id, r.start, r.end, limit)
+
+
+def describe(limits, department, over):
+    day, n = over[0]
+    more = f" and {len(over) - 1} more day{'s' if len(over) > 2 else ''}" if len(over) > 1 else ''
+    return (f"Over the staffing limit: {department} would have {n} out on {date.fromordinal(day).isoformat()}"
+            f"{more} (limit {limit_for(limits, department)}).")
+
+
+def approval_guard(limits, department_out):
+    # guard(emp, index) for a batch of decisions (see bulk.apply_decisions): the
+    # reason approving would go over the limit, or None. Approvals it let through
+    # count for the rest of the batch, whether or not department_out shows them yet.
+    added = {}
+
+    def check(emp, index):
+        r = emp.leave_requests[index]
+        if r.status == Status.Approved:
+            return None
+        over = request_conflicts(limits, department_out, emp, index, added)
+        if over:
+            return describe(limits, emp.department, over)
+        take(added.setdefault(emp.department, {}), emp.emp_id, r.start, r.end)
+        return None
+    return check
+
+
+def take(out, emp_id, first, last):
+    for day in range(first, last + 1):
+        out.setdefault(day, set()).add(emp_id)
+
+
+def suggest(candidates, out, limit):
+    # The largest set of candidates [(request_id, emp_id, first, last)] that can
+    # be approved together on top of `out` ({day: set of emp_ids}, updated in
+    # place). Earliest end first, taking every request that still fits, is
+    # optimal for intervals under per-day capacities: a request that fits can
+    # always replace one the best set holds that ends later. Returns (request
+    # ids to approve, {request_id: conflicts} for the rest).
+    approve, rejected = [], {}
+    for rid, emp_id, first, last in sorted(candidates, key=lambda c: (c[3], -c[2], c[0])):
+        over = conflicts(out, emp_id, first, last, limit)
+        if over:
+            rejected[rid] = over
+        else:
+            take(out, emp_id, first, last)
+            approve.append(rid)
+    return approve, rejected
@@ -0,0 +1,1200 @@
+import codecs, json, os, sqlite3, tempfile, threading, time, zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from models import SCHEMA_VERSION, date_ordinal
+from indexes import words
+try:
+    import fcntl
+except ImportError:  # no flock (Windows): FileLock only serializes threads
+    fcntl = None
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+
+def atomic_write_json(path, data, indent=None):
+    tmp = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def file_id(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def read_json(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+class _ObjectReader:
+    # Decodes a file that holds one JSON object a member at a time, keeping only
+    # a window of text around the current position and the byte offset of its start.
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.mark = (0, 0)  # (index in buf, byte offset) of a known position
+        self.eof = False
+
+    def fill(self, size):
+        data = self.f.read(size)
+        self.eof = not data
+        self.buf += self.utf8.decode(data, final=self.eof)
+
+    def offset(self, i):
+        # byte offset of buf[i]; positions are asked for in increasing order
+        mi, mb = self.mark
+        self.mark = (i, mb + len(self.buf[mi:i].encode('utf-8')))
+        return self.mark[1]
+
+    def compact(self):
+        if self.pos > self.chunk_size:
+            byte = self.offset(self.pos)
+            self.buf = self.buf[self.pos:]
+            self.pos, self.mark = 0, (0, byte)
+
+    def skip(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf) or self.eof:
+                return
+            self.fill(self.chunk_size)
+
+    def char(self):
+        self.skip()
+        if self.pos >= len(self.buf):
+            raise ValueError("Unexpected end of JSON file.")
+        self.pos += 1
+        return self.buf[self.pos - 1]
+
+    def value(self):
+        self.skip()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self.fill(max(self.chunk_size, len(self.buf) - self.pos))  # value spans the window: widen it
+                continue
+            if end == len(self.buf) and not self.eof:
+                self.fill(self.chunk_size)  # a number may go on in the next chunk
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_object(path, chunk_size=1 << 20):
+    # Yields (key, value, start, end) for each member of the JSON object in
+    # `path` without reading the whole file; start/end are the byte offsets of
+    # the value, so a single member can be read back later with a seek.
+    with open(path, 'rb') as f:
+        r = _ObjectReader(f, chunk_size)
+        if r.char() != '{':
+            raise ValueError(f"{path} does not hold a JSON object.")
+        r.skip()
+        if r.buf[r.pos:r.pos + 1] == '}':
+            return
+        while True:
+            key = r.value()
+            if r.char() != ':':
+                raise ValueError(f"Expected ':' after {key!r} in {path}.")
+            r.skip()
+            start = r.offset(r.pos)
+            value = r.value()
+            yield key, value, start, r.offset(r.pos)
+            c = r.char()
+            if c == '}':
+                return
+            if c != ',':
+                raise ValueError(f"Expected ',' or '}}' after {key!r} in {path}.")
+            r.compact()
+
+
+class FileLock:
+    # Exclusive lock shared by every process that opens the same path (flock on
+    # a side file), re-entrant for the thread holding it. With path=None it is
+    # a plain in-process lock.
+    def __init__(self, path=None):
+        self.path = path
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def __enter__(self):
+        self._rlock.acquire()
+        if self._depth == 0 and self.path and fcntl:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._rlock.release()
+
+
+class VersionFile:
+    # Monotonic change counter next to the data; bumped under the data lock on
+    # every save so other workers can tell whether their copy is stale.
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return int(f.read() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def bump(self):
+        version = self.read() + 1
+        tmp = f"{self.path}.tmp.{os.getpid()}"
+        with open(tmp, 'w') as f:
+            f.write(str(version))
+        os.replace(tmp, self.path)
+        return version
+
+
+class Journal:
+    # Snapshot lives at `path` (same layout as data.json); every mutation appends
+    # one line {"id": emp_id, "emp": employee dict or null for a delete} to
+    # `path.log`. Compaction rotates the log to `path.log.old`, folds it into a
+    # new snapshot and drops it, so writers never wait on the fold.
+    def __init__(self, path, fsync='interval', fsync_interval=1.0, compact_threshold=1000, compact_interval=60.0, lock=None):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}.")
+        self.path = path
+        self.log_path = path + '.log'
+        self.old_path = path + '.log.old'
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.compact_threshold = compact_threshold
+        self.compact_interval = compact_interval
+        self._lock = threading.Lock()
+        self._compact_lock = lock or threading.Lock()  # a FileLock when several processes share the files
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._log = None
+        self._thread = None
+        self._unsynced = False
+        self._pending = 0
+        self._tail = None  # (snapshot file id, log inode, offset) this process has read up to
+
+    def replay(self):
+        return dict(self.iter_replay())
+
+    def iter_replay(self):
+        # (emp_id, dict) for the current state; the snapshot is streamed, so only
+        # the records still in the logs are held in memory at once
+        snapshot = file_id(self.path)
+        overlay = {}
+        for path in (self.old_path, self.log_path):
+            offset = 0
+            for offset, rec in self._read_log(path):
+                overlay[rec['id']] = rec['emp']
+        log = file_id(self.log_path)
+        self._tail = (snapshot, log and log[0], offset)
+        if snapshot is not None:
+            for eid, ed, _, _ in iter_json_object(self.path):
+                if eid not in overlay:
+                    yield eid, ed
+        for eid, ed in overlay.items():
+            if ed is not None:
+                yield eid, ed
+
+    def read_new(self):
+        # Records appended since the last replay()/read_new() as (emp_id, dict or None),
+        # or None when a compaction replaced the files and a full replay is needed.
+        if self._tail is None:
+            return None
+        snapshot, inode, offset = self._tail
+        if file_id(self.path) != snapshot or os.path.exists(self.old_path):
+            return None
+        log = file_id(self.log_path)
+        if log is None:
+            return [] if inode is None else None
+        if log[0] != inode and not (inode is None and offset == 0):
+            return None
+        records = []
+        for offset, rec in self._read_log(self.log_path, offset):
+            records.append((rec['id'], rec['emp']))
+        self._tail = (snapshot, log[0], offset)
+        return records
+
+    def _is_current(self):
+        if self._tail is None:
+            return False
+        snapshot, inode, offset = self._tail
+        log = file_id(self.log_path)
+        return file_id(self.path) == snapshot and (log and log[0], log[2] if log else 0) == (inode, offset)
+
+    @staticmethod
+    def _read_log(path, offset=0):
+        # yields (end offset, record) for each complete record after `offset`
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # torn tail from a crash mid-append
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    break
+                offset += len(line)
+                yield offset, rec
+
+    @classmethod
+    def _apply_log(cls, data, path):
+        offset = 0
+        for offset, rec in cls._read_log(path):
+            if rec['emp'] is None:
+                data.pop(rec['id'], None)
+            else:
+                data[rec['id']] = rec['emp']
+        return offset
+
+    def _open_log(self):
+        if self._log is not None:
+            try:
+                current = os.stat(self.log_path).st_ino
+            except FileNotFoundError:
+                current = None
+            if current != os.fstat(self._log.fileno()).st_ino:
+                # another process rotated the log; stop appending to the old file
+                if self._unsynced:
+                    os.fsync(self._log.fileno())
+                self._log.close()
+                self._log = None
+        if self._log is None:
+            self._log = open(self.log_path, 'ab')
+            size = os.fstat(self._log.fileno()).st_size
+            end = 0
+            for end, _ in self._read_log(self.log_path):
+                pass
+            if end != size:
+                self._log.truncate(end)  # drop a torn record so new ones stay readable
+        return self._log
+
+    def append(self, records):
+        lines = ''.join(json.dumps({'id': eid, 'emp': ed}, separators=(',', ':')) + '\n' for eid, ed in records)
+        if not lines:
+            return
+        data = lines.encode()
+        with self._lock:
+            f = self._open_log()
+            before = os.fstat(f.fileno()).st_size
+            f.write(data)
+            f.flush()
+            if self._tail is not None:
+                snapshot, inode, offset = self._tail
+                current = os.fstat(f.fileno()).st_ino
+                if offset == before and (inode == current or inode is None and before == 0):
+                    self._tail = (snapshot, current, before + len(data))  # our own write is already in memory
+            if self.fsync == 'always':
+                os.fsync(f.fileno())
+            else:
+                self._unsynced = True
+            self._pending += lines.count('\n')
+            if self._pending >= self.compact_threshold:
+                self._wake.set()
+
+    def sync(self):
+        with self._lock:
+            if self._log is not None and self._unsynced:
+                os.fsync(self._log.fileno())
+            self._unsynced = False
+
+    def _rotate(self):
+        with self._lock:
+            if self._log is not None:
+                self._log.flush()
+                os.fsync(self._log.fileno())
+                self._log.close()
+                self._log = None
+            self._unsynced = False
+            self._pending = 0
+            if not os.path.exists(self.log_path):
+                return
+            if os.path.exists(self.old_path):
+                # a previous fold did not finish; keep both logs in order
+                with open(self.old_path, 'ab') as dst, open(self.log_path, 'rb') as src:
+                    dst.write(src.read())
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(self.log_path)
+            else:
+                os.replace(self.log_path, self.old_path)
+
+    def compact(self):
+        with self._compact_lock:
+            current = self._is_current()
+            self._rotate()
+            if not os.path.exists(self.old_path):
+                return
+            data = read_json(self.path)
+            self._apply_log(data, self.old_path)
+            atomic_write_json(self.path, data, indent=4)
+            os.remove(self.old_path)
+            self._tail = (file_id(self.path), None, 0) if current else None
+
+    def checkpoint(self, data):
+        # full save: the caller's state replaces snapshot and logs outright
+        with self._compact_lock:
+            self._rotate()
+            atomic_write_json(self.path, data, indent=4)
+            if os.path.exists(self.old_path):
+                os.remove(self.old_path)
+            self._tail = (file_id(self.path), None, 0)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='journal-compactor', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        last_compact = time.monotonic()
+        tick = min(self.fsync_interval, self.compact_interval)
+        while not self._stop.is_set():
+            woken = self._wake.wait(tick)
+            self._wake.clear()
+            if self.fsync == 'interval':
+                self.sync()
+            if woken or time.monotonic() - last_compact >= self.compact_interval:
+                if self._pending:
+                    self.compact()
+                last_compact = time.monotonic()
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            if self._log is not None:
+                self._log.flush()
+                if self.fsync != 'never':
+                    os.fsync(self._log.fileno())
+                self._log.close()
+                self._log = None
+
+
+ACK_MODES = ('flush', 'immediate')
+
+
+class GroupCommit:
+    # Coalesces saves from concurrent threads. Each writer stages its records
+    # ({emp_id: dict or None}; later records for an employee replace earlier
+    # ones) and gets a ticket for the batch they will go out in.
+    #
+    # With interval=0 and ack='flush' the first waiter that finds no write
+    # running becomes the leader and hands everything staged so far to `flush`
+    # in one call. Otherwise a background thread flushes `interval` seconds
+    # after the first record of a batch was staged, or as soon as max_batch
+    # employees are dirty. ack='flush' makes save() return once its batch is
+    # written; ack='immediate' returns right away, so a crash can lose the last
+    # interval of acknowledged changes.
+    def __init__(self, flush, interval=0.0, max_batch=0, ack='flush', samples=1000):
+        if ack not in ACK_MODES:
+            raise ValueError(f"Unknown ack mode: {ack}.")
+        self._flush = flush
+        self.interval = interval
+        self.max_batch = max_batch
+        self.ack = ack
+        self._cond = threading.Condition()
+        self._staged = {}
+        self._staged_at = None
+        self._inflight = {}
+        self._next = 1  # batch the staged records will go out in
+        self._done = 0  # last batch written (or failed)
+        self._flushing = False
+        self._failed = {}
+        self._closed = False
+        self._samples = deque(maxlen=samples)  # (seconds, records) of recent flushes
+        self.saves = 0
+        self.flushes = 0
+        self.records = 0
+        self.errors = 0
+        self.last_error = None
+        self._thread = None
+        if interval > 0 or ack == 'immediate':
+            self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+            self._thread.start()
+
+    def stage(self, records):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("GroupCommit is closed.")
+            if not records:
+                return self._done
+            first = not self._staged
+            if first:
+                self._staged_at = time.monotonic()
+            self._staged.update(records)
+            self.saves += 1
+            if self._thread is not None and (first or self.max_batch and len(self._staged) >= self.max_batch):
+                self._cond.notify_all()  # start the interval, or flush a full batch early
+            return self._next
+
+    def pending(self, emp_id):
+        # (True, record) if a save of emp_id is staged or being written, else (False, None)
+        with self._cond:
+            for records in (self._staged, self._inflight):
+                if emp_id in records:
+                    return True, records[emp_id]
+        return False, None
+
+    def _flush_staged(self):
+        # called with the condition held; releases it while writing
+        batch, records = self._next, self._staged
+        self._next, self._staged, self._inflight, self._flushing = batch + 1, {}, records, True
+        error = None
+        self._cond.release()
+        t0 = time.perf_counter()
+        try:
+            self._flush(records)
+        except Exception as exc:
+            error = exc
+        finally:
+            elapsed = time.perf_counter() - t0
+            self._cond.acquire()
+            self._flushing = False
+            self._inflight = {}
+            self._done = batch
+            self.flushes += 1
+            if error is None:
+                self.records += len(records)
+                self._samples.append((elapsed, len(records)))
+            else:
+                # keep the records for the next batch; this batch's writers see the error
+                if not self._staged:
+                    self._staged_at = time.monotonic()
+                self._staged = {**records, **self._staged}
+                self._failed[batch] = error
+                self.errors += 1
+                self.last_error = repr(error)
+            self._cond.notify_all()
+        return error
+
+    def wait(self, ticket):
+        with self._cond:
+            while self._done < ticket:
+                if self._thread is None and not self._flushing and self._staged:
+                    self._flush_staged()
+                else:
+                    self._cond.wait()
+            if ticket in self._failed:
+                raise self._failed[ticket]
+
+    def save(self, records):
+        ticket = self.stage(records)
+        if self.ack == 'flush':
+            self.wait(ticket)
+
+    def _due(self):
+        if self._closed or not self.interval:
+            return 0
+        if self.max_batch and len(self._staged) >= self.max_batch:
+            return 0
+        return self._staged_at + self.interval - time.monotonic()
+
+    def _run(self):
+        with self._cond:
+            while True:
+                while not self._staged and not self._closed:
+                    self._cond.wait()
+                if not self._staged:
+                    return
+                delay = self._due()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                if self._flush_staged() is not None:
+                    if self._closed:
+                        return  # close() makes the last attempt
+                    self._cond.wait(max(self.interval, 1.0))  # back off before retrying
+
+    def close(self):
+        # flush whatever is staged and stop the background thread
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._cond:
+            while self._flushing:
+                self._cond.wait()
+            if self._staged:
+                error = self._flush_staged()
+                if error is not None:
+                    raise error
+
+    def stats(self):
+        with self._cond:
+            samples = list(self._samples)
+            out = {'ack': self.ack, 'interval': self.interval, 'max_batch': self.max_batch,
+                   'saves': self.saves, 'flushes': self.flushes, 'records': self.records,
+                   'errors': self.errors, 'last_error': self.last_error, 'pending': len(self._staged),
+                   'saves_per_flush': round(self.saves / self.flushes, 2) if self.flushes else None}
+        latencies = sorted(t for t, _ in samples)
+        sizes = [n for _, n in samples]
+        out['flush_ms'] = {
+            'p50': round(latencies[len(latencies) // 2] * 1e3, 3) if latencies else None,
+            'p99': round(latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1e3, 3) if latencies else None,
+            'max': round(latencies[-1] * 1e3, 3) if latencies else None,
+        }
+        out['batch_size'] = {
+            'mean': round(sum(sizes) / len(sizes), 2) if sizes else None,
+            'max': max(sizes, default=None),
+            'last': sizes[-1] if sizes else None,
+        }
+        return out
+
+
+class StorageBackend:
+    # `shared` backends may be written by other processes, so callers should
+    # fetch rows from the backend rather than trust the in-memory cache.
+    shared = False
+
+    def load_all(self):
+        return dict(self.iter_all())
+
+    def iter_all(self):
+        # (emp_id, dict) pairs, without holding every record at once where the format allows
+        raise NotImplementedError
+
+    def load_one(self, emp_id):
+        return self.load_all().get(emp_id)
+
+    def read_changes(self):
+        # (emp_id, old, new) for the records other processes wrote since the last
+        # load or read_changes(), old/new a dict or None (absent). old is None too
+        # when the backend keeps no earlier records, so the caller has to use its
+        # own copy. None means the caller has to load_all() again.
+        return None
+
+    def save(self, docs, emp_ids=()):
+        # docs maps emp_id -> employee dict; emp_ids names the ones that changed
+        # (an id missing from docs was deleted). No ids means docs is everything.
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+def copy_bytes(src, dst, n, chunk_size=1 << 20):
+    while n > 0:
+        data = src.read(min(n, chunk_size))
+        if not data:
+            raise ValueError("File ended before the copied range.")
+        dst.write(data)
+        n -= len(data)
+
+
+class JsonBackend(StorageBackend):
+    # data.json is read with the streaming parser, which also notes where each
+    # employee's record sits in the file. load_one() is then a seek and a read,
+    # and a save rewrites the file copying unchanged records byte for byte, so
+    # only the changed employees are serialized. Output matches json.dump(indent=4).
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._offsets = None  # emp_id -> (start, end) of its record, in file order
+        self._file = None  # file_id() of the file the offsets describe
+
+    def iter_all(self):
+        ident = file_id(self.path)
+        offsets = {}
+        if ident is not None:
+            for eid, ed, start, end in iter_json_object(self.path):
+                offsets[eid] = (start, end)
+                yield eid, ed
+        with self._lock:
+            self._offsets, self._file = offsets, ident
+
+    def _current(self):
+        # offsets for the file as it is now: rescan if another process replaced it (call with _lock)
+        ident = file_id(self.path)
+        if self._offsets is None or ident != self._file:
+            self._offsets = {eid: (start, end) for eid, _, start, end in iter_json_object(self.path)} if ident else {}
+            self._file = ident
+        return self._offsets
+
+    def load_one(self, emp_id):
+        with self._lock:
+            span = self._current().get(emp_id)
+            if span is None:
+                return None
+            with open(self.path, 'rb') as f:
+                f.seek(span[0])
+                return json.loads(f.read(span[1] - span[0]))
+
+    def save(self, docs, emp_ids=()):
+        with self._lock:
+            old = self._current() if emp_ids else {}
+        changed = set(emp_ids or docs)
+        order = [eid for eid in old if eid not in changed or eid in docs]
+        order += [eid for eid in dict.fromkeys(emp_ids or docs) if eid not in old and eid in docs]
+        rank = {eid: i for i, eid in enumerate(old)}
+        offsets = {}
+        tmp = f"{self.path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp, 'wb') as dst, open(self.path if old else os.devnull, 'rb') as src:
+            dst.write(b'{')
+            pos, i = 1, 0
+            while i < len(order):
+                eid = order[i]
+                head = (b',\n    ' if i else b'\n    ') + json.dumps(eid).encode() + b': '
+                dst.write(head)
+                pos += len(head)
+                if eid in changed:
+                    data = json.dumps(docs[eid], indent=4).replace('\n', '\n    ').encode()
+                    dst.write(data)
+                    offsets[eid] = (pos, pos + len(data))
+                    pos += len(data)
+                    i += 1
+                    continue
+                # a run of unchanged records that were adjacent in the old file is one copy
+                j = i + 1
+                while j < len(order) and order[j] not in changed and rank[order[j]] == rank[order[j - 1]] + 1:
+                    j += 1
+                start, end = old[eid][0], old[order[j - 1]][1]
+                src.seek(start)
+                copy_bytes(src, dst, end - start)
+                for k in range(i, j):
+                    s, e = old[order[k]]
+                    offsets[order[k]] = (s - start + pos, e - start + pos)
+                pos += end - start
+                i = j
+            dst.write(b'\n}' if order else b'}')
+            dst.flush()
+            os.fsync(dst.fileno())
+        with self._lock:
+            os.replace(tmp, self.path)
+            self._offsets, self._file = offsets, file_id(self.path)
+
+
+class JournalBackend(StorageBackend):
+    def __init__(self, path, **opts):
+        self.journal = Journal(path, **opts)
+
+    def iter_all(self):
+        yield from self.journal.iter_replay()
+        self.journal.start()
+
+    def read_changes(self):
+        records = self.journal.read_new()
+        return None if records is None else [(eid, None, ed) for eid, ed in records]
+
+    def save(self, docs, emp_ids=()):
+        if emp_ids:
+            self.journal.append((eid, docs.get(eid)) for eid in emp_ids)
+        else:
+            self.journal.checkpoint(docs)
+
+    def close(self):
+        self.journal.close()
+
+
+class ShardedBackend(StorageBackend):
+    # `path` is a directory: manifest.json plus employees hash-bucketed by
+    # crc32(emp_id) into shard-NNN.json files, each in data.json layout and
+    # handled by its own JsonBackend. A save rewrites only the shards holding
+    # changed employees, in parallel; each shard is replaced atomically, but a
+    # save that spans shards is not atomic as a whole.
+    def __init__(self, path, buckets=64, workers=8):
+        self.path = path
+        manifest = read_json(os.path.join(path, 'manifest.json'))
+        if not manifest:
+            os.makedirs(path, exist_ok=True)
+            manifest = {'format': 1, 'hash': 'crc32', 'buckets': buckets, 'schema': SCHEMA_VERSION}
+            atomic_write_json(os.path.join(path, 'manifest.json'), manifest, indent=4)
+        if manifest.get('format') != 1 or manifest.get('hash') != 'crc32':
+            raise ValueError(f"Unsupported shard manifest in {path}: {manifest}.")
+        self.buckets = manifest['buckets']
+        self.shards = [JsonBackend(shard_path(path, i, self.buckets)) for i in range(self.buckets)]
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        # per shard, as this process last read or wrote it: (file_id, offsets, open file).
+        # Kept apart from the shard's own offsets, which load_one() moves to the
+        # current file; the open file keeps the old records readable after another
+        # process replaced the shard.
+        self._seen = [None] * self.buckets
+
+    def shard(self, emp_id):
+        return self.shards[zlib.crc32(emp_id.encode()) % self.buckets]
+
+    def _remember(self, i):
+        # snapshot shard i as it is now; returns the snapshot it replaces, for the caller to close
+        shard = self.shards[i]
+        while True:
+            try:
+                f = open(shard.path, 'rb')
+            except FileNotFoundError:
+                f, ident = None, None
+            else:
+                st = os.fstat(f.fileno())
+                ident = st.st_ino, st.st_mtime_ns, st.st_size
+            with shard._lock:
+                offsets = shard._current()
+                if shard._file == ident:
+                    break
+            if f:
+                f.close()  # replaced again between the open and the scan
+        prev, self._seen[i] = self._seen[i], (ident, offsets, f)
+        return prev
+
+    def iter_all(self):
+        # the pool reads up to `workers` shards ahead; records are yielded shard by shard
+        read = lambda shard: list(shard.iter_all())
+        ahead = deque(self._pool.submit(read, shard) for shard in self.shards[:self.workers])
+        nxt = len(ahead)
+        done = 0
+        while ahead:
+            records = ahead.popleft().result()
+            close_snapshot(self._remember(done))
+            done += 1
+            if nxt < len(self.shards):
+                ahead.append(self._pool.submit(read, self.shards[nxt]))
+                nxt += 1
+            yield from records
+
+    def load_one(self, emp_id):
+        return self.shard(emp_id).load_one(emp_id)
+
+    def read_changes(self):
+        # the records that differ, byte for byte, between each shard another process
+        # replaced and the file this process last read or wrote, still open
+        if None in self._seen:
+            return None
+        changes = []
+        for i, shard in enumerate(self.shards):
+            if file_id(shard.path) == self._seen[i][0]:
+                continue
+            _, old, old_file = self._remember(i)
+            _, new, new_file = self._seen[i]
+            try:
+                for eid, span in new.items():
+                    raw = read_span(new_file, span)
+                    before = read_span(old_file, old[eid]) if eid in old else None
+                    if raw != before:
+                        changes.append((eid, json.loads(before) if before is not None else None, json.loads(raw)))
+                changes += [(eid, json.loads(read_span(old_file, span)), None)
+                            for eid, span in old.items() if eid not in new]
+            finally:
+                if old_file:
+                    old_file.close()
+        return changes
+
+    def save(self, docs, emp_ids=()):
+        groups = {shard: ([], {}) for shard in self.shards} if not emp_ids else {}
+        for eid in emp_ids or docs:
+            ids, shard_docs = groups.setdefault(self.shard(eid), ([], {}))
+            ids.append(eid)
+            if eid in docs:
+                shard_docs[eid] = docs[eid]
+        # a full save (no emp_ids) passes no ids either, so every shard is rewritten from docs
+        jobs = [self._pool.submit(shard.save, shard_docs, ids if emp_ids else ())
+                for shard, (ids, shard_docs) in groups.items()]
+        for job in jobs:
+            job.result()
+        for shard in groups:
+            close_snapshot(self._remember(self.shards.index(shard)))
+
+    def close(self):
+        self._pool.shutdown()
+        for i in range(self.buckets):
+            close_snapshot(self._seen[i])
+            self._seen[i] = None
+
+
+def read_span(f, span):
+    f.seek(span[0])
+    return f.read(span[1] - span[0])
+
+
+def close_snapshot(snapshot):
+    if snapshot and snapshot[2]:
+        snapshot[2].close()
+
+
+def shard_path(path, i, buckets):
+    return os.path.join(path, f"shard-{i:0{len(str(buckets - 1))}d}.json")
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS employees (
+    emp_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    password TEXT NOT NULL DEFAULT 'password',
+    contact TEXT NOT NULL DEFAULT '',
+    department TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS leave_balances (
+    emp_id TEXT NOT NULL REFERENCES employees(emp_id),
+    leave_type TEXT NOT NULL,
+    balance INTEGER NOT NULL,
+    PRIMARY KEY (emp_id, leave_type)
+);
+CREATE TABLE IF NOT EXISTS leave_requests (
+    emp_id TEXT NOT NULL REFERENCES employees(emp_id),
+    idx INTEGER NOT NULL,
+    leave_type TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    days INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    deducted INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (emp_id, idx)
+);
+CREATE TABLE IF NOT EXISTS leave_ledger (
+    emp_id TEXT NOT NULL REFERENCES employees(emp_id),
+    seq INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    leave_type TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    request INTEGER,
+    PRIMARY KEY (emp_id, seq)
+);
+CREATE INDEX IF NOT EXISTS ix_employees_department ON employees (department);
+CREATE INDEX IF NOT EXISTS ix_requests_status ON leave_requests (status, emp_id, idx);
+CREATE INDEX IF NOT EXISTS ix_requests_dates ON leave_requests (start_date, end_date);
+CREATE INDEX IF NOT EXISTS ix_requests_status_end ON leave_requests (status, end_date, start_date);
+"""
+
+REQUEST_COLUMNS = ('leave_type', 'start_date', 'end_date', 'days', 'status', 'deducted')
+
+
+class SqliteBackend(StorageBackend):
+    # Rows are keyed by emp_id (primary keys on employees, leave_balances,
+    # leave_requests and leave_ledger), so reading or rewriting one employee
+    # touches only its rows. PRAGMA user_version holds the schema version.
+    shared = True
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            fresh = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'employees'").fetchone() is None
+            conn.executescript(SQLITE_SCHEMA)
+            if fresh:
+                conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def schema_version(self):
+        # databases from before the version was kept hold schema 2 records
+        return self._conn().execute('PRAGMA user_version').fetchone()[0] or 2
+
+    def set_schema_version(self, version):
+        with self._conn() as conn:
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+
+    def employee_ids(self):
+        return [r[0] for r in self._conn().execute('SELECT emp_id FROM employees ORDER BY emp_id')]
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            # ' word word ... ' of a name and department, split as indexes.EmployeeSearch splits them
+            conn.create_function('search_text', 2, lambda name, department: f" {' '.join(words(f'{name} {department}'))} ",
+                                 deterministic=True)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _request(row):
+        r = {c: row[c] for c in REQUEST_COLUMNS}
+        r['deducted'] = bool(r['deducted'])
+        return r
+
+    @staticmethod
+    def _entry(row):
+        return {'date': row['day'], 'leave_type': row['leave_type'], 'amount': row['amount'], 'kind': row['kind'],
+                'request': row['request']}
+
+    def iter_all(self):
+        # four cursors in emp_id order, merged one employee at a time
+        conn = self._conn()
+        balances = conn.execute('SELECT emp_id, leave_type, balance FROM leave_balances ORDER BY emp_id')
+        requests = conn.execute('SELECT * FROM leave_requests ORDER BY emp_id, idx')
+        entries = conn.execute('SELECT * FROM leave_ledger ORDER BY emp_id, seq')
+        b, r, e = next(balances, None), next(requests, None), next(entries, None)
+        for row in conn.execute('SELECT * FROM employees ORDER BY emp_id'):
+            eid = row['emp_id']
+            ed = {**dict(row), 'leave_balances': {}, 'leave_requests': [], 'ledger': []}
+            while b is not None and b['emp_id'] <= eid:
+                if b['emp_id'] == eid:
+                    ed['leave_balances'][b['leave_type']] = b['balance']
+                b = next(balances, None)
+            while r is not None and r['emp_id'] <= eid:
+                if r['emp_id'] == eid:
+                    ed['leave_requests'].append(self._request(r))
+                r = next(requests, None)
+            while e is not None and e['emp_id'] <= eid:
+                if e['emp_id'] == eid:
+                    ed['ledger'].append(self._entry(e))
+                e = next(entries, None)
+            yield eid, ed
+
+    def load_one(self, emp_id):
+        conn = self._conn()
+        row = conn.execute('SELECT * FROM employees WHERE emp_id = ?', (emp_id,)).fetchone()
+        if row is None:
+            return None
+        ed = dict(row)
+        ed['leave_balances'] = {r['leave_type']: r['balance'] for r in conn.execute(
+            'SELECT leave_type, balance FROM leave_balances WHERE emp_id = ?', (emp_id,))}
+        ed['leave_requests'] = [self._request(r) for r in conn.execute(
+            'SELECT * FROM leave_requests WHERE emp_id = ? ORDER BY idx', (emp_id,))]
+        ed['ledger'] = [self._entry(r) for r in conn.execute(
+            'SELECT * FROM leave_ledger WHERE emp_id = ? ORDER BY seq', (emp_id,))]
+        return ed
+
+    def _write(self, conn, emp_id, ed):
+        conn.execute('DELETE FROM leave_requests WHERE emp_id = ?', (emp_id,))
+        conn.execute('DELETE FROM leave_balances WHERE emp_id = ?', (emp_id,))
+        conn.execute('DELETE FROM leave_ledger WHERE emp_id = ?', (emp_id,))
+        if ed is None:
+            conn.execute('DELETE FROM employees WHERE emp_id = ?', (emp_id,))
+            return
+        conn.execute(
+            'INSERT INTO employees (emp_id, name, password, contact, department) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT(emp_id) DO UPDATE SET name = excluded.name, password = excluded.password, '
+            'contact = excluded.contact, department = excluded.department',
+            (emp_id, ed['name'], ed.get('password', 'password'), ed.get('contact', ''), ed.get('department', '')))
+        conn.executemany('INSERT INTO leave_balances VALUES (?, ?, ?)',
+                         [(emp_id, lt, bal) for lt, bal in ed.get('leave_balances', {}).items()])
+        conn.executemany('INSERT INTO leave_requests VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         [(emp_id, i, r['leave_type'], r['start_date'], r['end_date'], r['days'], r['status'], int(r['deducted']))
+                          for i, r in enumerate(ed.get('leave_requests', []))])
+        conn.executemany('INSERT INTO leave_ledger VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         [(emp_id, i, e['date'], e['leave_type'], e['amount'], e['kind'], e['request'])
+                          for i, e in enumerate(ed.get('ledger', []))])
+
+    def write_dicts(self, records):
+        # records: iterable of (emp_id, employee dict or None), one transaction
+        with self._conn() as conn:
+            for eid, ed in records:
+                self._write(conn, eid, ed)
+
+    def save(self, docs, emp_ids=()):
+        if emp_ids:
+            self.write_dicts((eid, docs.get(eid)) for eid in emp_ids)
+            return
+        with self._conn() as conn:
+            stale = {r[0] for r in conn.execute('SELECT emp_id FROM employees')} - set(docs)
+            for eid in stale:
+                self._write(conn, eid, None)
+            for eid, ed in docs.items():
+                self._write(conn, eid, ed)
+
+    def query_requests(self, status=None, leave_type=None, department=None, emp_id=None, start=None, end=None,
+                       after=None, limit=None):
+        # keyset pagination: `after` is the (emp_id, idx) of the last row already seen
+        sql = ('SELECT r.*, e.name, e.department FROM leave_requests r '
+               'JOIN employees e ON e.emp_id = r.emp_id WHERE 1 = 1')
+        args = []
+        for col, val in (('r.status', status), ('r.leave_type', leave_type), ('e.department', department),
+                         ('r.emp_id', emp_id)):
+            if val is not None:
+                sql += f' AND {col} = ?'
+                args.append(val)
+        if start is not None:
+            sql += ' AND r.end_date >= ?'
+            args.append(start)
+        if end is not None:
+            sql += ' AND r.start_date <= ?'
+            args.append(end)
+        if after is not None:
+            sql += ' AND (r.emp_id, r.idx) > (?, ?)'
+            args.extend(after)
+        sql += ' ORDER BY r.emp_id, r.idx'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            args.append(limit)
+        for row in self._conn().execute(sql, args):
+            yield {'request_id': f"{row['emp_id']}:{row['idx']}", 'emp_id': row['emp_id'], 'name': row['name'],
+                   'department': row['department'], 'index': row['idx'], **self._request(row)}
+
+    def request_counts(self):
+        # {(leave_type, status): count}
+        return {(r[0], r[1]): r[2] for r in self._conn().execute(
+            'SELECT leave_type, status, COUNT(*) FROM leave_requests GROUP BY leave_type, status')}
+
+    def aggregate_counts(self):
+        # same layout as indexes.RequestAggregates.snapshot()
+        conn = self._conn()
+        out = {'by_type': {}, 'by_department': {}, 'by_month': {}, 'by_status': {}, 'approved_days': {}}
+        for name, expr, join in (('by_type', 'r.leave_type', ''),
+                                 ('by_department', 'e.department', ' JOIN employees e ON e.emp_id = r.emp_id'),
+                                 ('by_month', 'substr(r.start_date, 1, 7)', '')):
+            for key, status, n in conn.execute(
+                    f'SELECT {expr}, r.status, COUNT(*) FROM leave_requests r{join} GROUP BY 1, 2 ORDER BY 1, 2'):
+                out[name].setdefault(key, {})[status] = n
+        for status, n in conn.execute('SELECT status, COUNT(*) FROM leave_requests GROUP BY status ORDER BY status'):
+            out['by_status'][status] = n
+        for lt, n in conn.execute("SELECT leave_type, SUM(days) FROM leave_requests WHERE status = 'Approved' "
+                                  "GROUP BY leave_type ORDER BY leave_type"):
+            out['approved_days'][lt] = n
+        return out
+
+    def search_employees(self, q='', department=None, offset=0, limit=50):
+        # word-prefix matching like indexes.EmployeeSearch, exact and prefix id
+        # matches first, then by name; returns (rows, total)
+        where, args = ['1 = 1'], []
+        if department:
+            where.append('department = ?')
+            args.append(department)
+        like = lambda s: s.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        for term in q.lower().split():
+            # the id starts with the term, or a word starts with each of the term's words
+            by_words = ["search_text(name, department) LIKE ? ESCAPE '\\'"] * len(words(term))
+            where.append(f"(lower(emp_id) LIKE ? ESCAPE '\\' OR ({' AND '.join(by_words) or '0'}))")
+            args += [like(term)] + ['% ' + like(w) for w in words(term)]
+        conn = self._conn()
+        sql = ' AND '.join(where)
+        total = conn.execute(f'SELECT COUNT(*) FROM employees WHERE {sql}', args).fetchone()[0]
+        whole = ' '.join(q.lower().split())
+        if whole:
+            order = 'lower(emp_id) = ? DESC, substr(lower(emp_id), 1, ?) = ? DESC, lower(name), emp_id'
+            args += [whole, len(whole), whole]
+        else:
+            order = 'emp_id'
+        rows = conn.execute(f'SELECT emp_id, name, contact, department FROM employees WHERE {sql} '
+                            f'ORDER BY {order} LIMIT ? OFFSET ?', args + [limit, offset])
+        return [dict(r) for r in rows], total
+
+    def departments(self):
+        return [r[0] for r in self._conn().execute('SELECT DISTINCT department FROM employees ORDER BY department')]
+
+    def department_size(self, department):
+        return self._conn().execute('SELECT COUNT(*) FROM employees WHERE department = ?', (department,)).fetchone()[0]
+
+    def occupancy(self, department, start, end, status='Approved'):
+        # same as indexes.OccupancyIndex.out(): {day: sorted emp_ids} over ordinals [start, end].
+        # Requests drive the join (CROSS JOIN fixes the order): for the weeks ahead, which
+        # approvals and the calendar ask about, end_date >= start leaves only the newest rows.
+        out = {}
+        for emp_id, first, last in self._conn().execute(
+                'SELECT r.emp_id, r.start_date, r.end_date FROM leave_requests r CROSS JOIN employees e ON e.emp_id = r.emp_id '
+                'WHERE r.status = ? AND r.end_date >= ? AND r.start_date <= ? AND e.department = ?',
+                (status, date.fromordinal(start).isoformat(), date.fromordinal(end).isoformat(), department)):
+            for day in range(max(date_ordinal(first), start), min(date_ordinal(last), end) + 1):
+                out.setdefault(day, set()).add(emp_id)
+        return {day: sorted(out[day]) for day in sorted(out)}
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+STORAGE_MODES = ('json', 'journal', 'sqlite', 'sharded')
+
+
+def default_path(mode):
+    return {'sqlite': 'leave.db', 'sharded': 'data.shards'}.get(mode, 'data.json')
+
+
+def make_backend(mode, path, **opts):
+    if mode == 'json':
+        return JsonBackend(path)
+    if mode == 'journal':
+        return JournalBackend(path, **opts)
+    if mode == 'sqlite':
+        return SqliteBackend(path)
+    if mode == 'sharded':
+        return ShardedBackend(path, **opts)
+    raise ValueError(f"Unknown storage mode: {mode}.")
+
+
+def import_json(src, dst, batch=500):
+    from migrate_data import read_schema, upgrade
+    version = read_schema('json', src)
+    backend = SqliteBackend(dst)
+    data = read_json(src)
+    items = list(data.items())
+    for i in range(0, len(items), batch):
+        backend.write_dicts((eid, upgrade(ed, version)) for eid, ed in items[i:i + batch])
+    backend.close()
+    return len(items)
+
+
+def shard_store(src, dst, mode='json', buckets=64):
+    # Split any store (a current or legacy data.json by default) into a sharded
+    # directory, upgrading records to the current schema on the way. Records are
+    # spilled to one JSONL file per bucket first, so only one bucket is in memory
+    # while its shard is written.
+    from migrate_data import read_schema, upgrade
+    if os.path.exists(os.path.join(dst, 'manifest.json')):
+        raise ValueError(f"{dst} already holds a sharded store.")
+    version = read_schema(mode, src)
+    source = make_backend(mode, src)
+    spill = tempfile.mkdtemp(prefix='lms-shard-', dir=os.path.dirname(os.path.abspath(dst)))
+    files = [open(os.path.join(spill, f"{i}.jsonl"), 'w') for i in range(buckets)]
+    n = 0
+    try:
+        for eid, ed in source.iter_all():
+            ed = upgrade(ed, version)
+            files[zlib.crc32(eid.encode()) % buckets].write(json.dumps([eid, ed]) + '\n')
+            n += 1
+        for f in files:
+            f.close()
+        target = ShardedBackend(dst, buckets=buckets, workers=1)
+        for i, shard in enumerate(target.shards):
+            with open(os.path.join(spill, f"{i}.jsonl")) as f:
+                shard.save(dict(json.loads(line) for line in f))
+        target.close()
+    finally:
+        source.close()
+        for i, f in enumerate(files):
+            f.close()
+            os.remove(os.path.join(spill, f"{i}.jsonl"))
+        os.rmdir(spill)
+    return n
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Leave Management storage tools")
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('import', help="import a data.json (any schema version) into a SQLite database")
+    p.add_argument('src')
+    p.add_argument('dst')
+    p = sub.add_parser('shard', help="split a store (a data.json of any schema version by default) into a sharded directory")
+    p.add_argument('src')
+    p.add_argument('dst')
+    p.add_argument('--from', dest='mode', choices=STORAGE_MODES, default='json')
+    p.add_argument('--buckets', type=int, default=64)
+    args = parser.parse_args()
+    if args.cmd == 'import':
+        print(f"Imported {import_json(args.src, args.dst)} employees into {args.dst}.")
+    elif args.cmd == 'shard':
+        n = shard_store(args.src, args.dst, args.mode, args.buckets)
+        print(f"Sharded {n} employees into {args.buckets} buckets under {args.dst}.")